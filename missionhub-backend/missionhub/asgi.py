@@ -3,6 +3,11 @@ ASGI config for missionhub project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Les endpoints Pi (pi_authenticate, pi_withdraw, pi_payment_webhook) sont des
+vues asynchrones : servis via ASGI, par exemple
+    gunicorn missionhub.asgi:application -k uvicorn.workers.UvicornWorker
+un worker peut garder des centaines d'appels Pi en vol au lieu d'un par thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
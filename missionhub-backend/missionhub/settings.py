@@ -53,15 +53,25 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'missions.middleware.CompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'missions.middleware.ProfilePreloadMiddleware',
+    'missions.middleware.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# ProfileModelBackend charge user + profil en une requête jointe.
+# ModelBackend reste listé pour les sessions ouvertes avant son introduction.
+AUTHENTICATION_BACKENDS = [
+    'missions.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 ROOT_URLCONF = 'missionhub.urls'
 
 TEMPLATES = [
@@ -101,21 +111,49 @@ if DEBUG:
 else:
     DATABASES = {'default': dj_database_url.config(conn_max_age=600, ssl_require=True)}
 
+# Réplicas en lecture (missions/routers.py) : URLs séparées par des virgules
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv()), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = dj_database_url.parse(replica_url, conn_max_age=600, ssl_require=not DEBUG)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['missions.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=10, cast=int)
+DATABASE_REPLICA_CHECK_INTERVAL = config('DATABASE_REPLICA_CHECK_INTERVAL', default=10, cast=int)
+DATABASE_REPLICA_COOLDOWN = config('DATABASE_REPLICA_COOLDOWN', default=30, cast=int)
+
 #Configuration JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'missions.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson (missions/renderers.py) ; l'API navigable n'est servie qu'en DEBUG
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'missions.renderers.ORJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    ],
+    # Pagination par curseur (missions/pagination.py) : ni OFFSET ni COUNT(*)
+    'DEFAULT_PAGINATION_CLASS': 'missions.pagination.IdCursorPagination',
+    'PAGE_SIZE': config('API_PAGE_SIZE', default=50, cast=int),
+    'DEFAULT_PARSER_CLASSES': [
+        'missions.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=200, cast=int)
+
+# Compression des réponses de l'API (missions/middleware.py)
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)  # octets
+COMPRESSION_CONTENT_TYPES = ('application/json',)
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(
@@ -126,6 +164,20 @@ SIMPLE_JWT = {
     ),
 }
 
+# Cache partagé entre workers (limitation de débit) ; cache mémoire local,
+# propre à chaque processus, si REDIS_URL n'est pas défini.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Cache des principaux JWT (voir missions/authentication.py). L'invalidation est
+# locale au processus : le TTL borne le délai pendant lequel les autres workers
+# servent un principal périmé (compte désactivé, mot de passe changé).
+PRINCIPAL_CACHE_MAX_SIZE = config('PRINCIPAL_CACHE_MAX_SIZE', default=10000, cast=int)
+PRINCIPAL_CACHE_TTL = config('PRINCIPAL_CACHE_TTL', default=60, cast=int)  # secondes
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -170,12 +222,23 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Media files (User-uploaded content)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Transfert des médias par le frontal (missions/media.py) : préfixe d'une location
+# nginx `internal` pointant sur MEDIA_ROOT, ou X-Sendfile (Apache, lighttpd).
+MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', default='')
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default=False, cast=bool)
+
+# Médias adressés par contenu et dédupliqués (missions/storage.py).
+# STATICFILES_STORAGE n'est plus lu depuis Django 5.1 : les fichiers statiques se configurent ici.
+STORAGES = {
+    'default': {'BACKEND': 'missions.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': config('STATICFILES_BACKEND', default='whitenoise.storage.CompressedStaticFilesStorage')},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -187,4 +250,66 @@ CSRF_TRUSTED_ORIGINS = [f'https://{host}' for host in ALLOWED_HOSTS if host != '
 CSRF_TRUSTED_ORIGINS.append('http://localhost:8000')
 CSRF_TRUSTED_ORIGINS.append('http://127.0.0.1:8000')
 
-PI_API_KEY = config('PI_API_KEY', default='VOTRE_CLE_API_PI_SERVEUR')
\ No newline at end of file
+PI_API_KEY = config('PI_API_KEY', default='VOTRE_CLE_API_PI_SERVEUR')
+PI_API_TIMEOUT = config('PI_API_TIMEOUT', default=10, cast=float)  # secondes
+PI_API_MAX_CONNECTIONS = config('PI_API_MAX_CONNECTIONS', default=200, cast=int)
+
+# Planificateur du séquestre (manage.py run_escrow_scheduler)
+ESCROW_AUTO_RELEASE_DAYS = config('ESCROW_AUTO_RELEASE_DAYS', default=14, cast=float)
+UNPAID_PURCHASE_TIMEOUT_HOURS = config('UNPAID_PURCHASE_TIMEOUT_HOURS', default=24, cast=float)
+
+# File de modération des preuves (missions/moderation.py)
+MODERATION_BATCH_SIZE = config('MODERATION_BATCH_SIZE', default=10, cast=int)
+MODERATION_LEASE_SECONDS = config('MODERATION_LEASE_SECONDS', default=600, cast=int)
+# Pré-filtrage des preuves (missions/screening.py)
+PROOF_SCREENING_WORKERS = config('PROOF_SCREENING_WORKERS', default=2, cast=int)
+PROOF_AUTO_REJECT_RISK = config('PROOF_AUTO_REJECT_RISK', default=0.8, cast=float)  # entre 0 et 1
+
+# Limitation de débit (missions/throttling.py) : portée -> (débit soutenu, rafale).
+# Les seaux *_endpoint sont partagés par tous les clients : ce sont des disjoncteurs
+# contre un afflux distribué, très au-dessus du budget d'un client (vérifié avant eux).
+THROTTLE_BUCKETS = {
+    'auth': ('10/min', 20),             # par IP : connexion, inscription, jetons JWT
+    'auth_endpoint': ('300/s', 3000),   # disjoncteur, tous clients confondus
+    'pi_auth': ('10/min', 10),          # par utilisateur
+    'withdraw': ('3/min', 5),           # par utilisateur
+    'webhook': ('20/s', 100),           # par IP (serveurs Pi)
+    'webhook_endpoint': ('100/s', 300),
+}
+
+# Journal d'audit des achats et des preuves (missions/audit.py, commande audit_partitions)
+AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=500, cast=int)
+AUDIT_PARTITIONS_AHEAD = config('AUDIT_PARTITIONS_AHEAD', default=3, cast=int)  # mois créés à l'avance
+AUDIT_RETENTION_MONTHS = config('AUDIT_RETENTION_MONTHS', default=24, cast=int)
+
+# Archivage à froid (missions/archive.py, commande archive_cold_data)
+ARCHIVE_ROOT = config('ARCHIVE_ROOT', default=str(BASE_DIR / 'archive'))
+ARCHIVE_NOTIFICATION_DAYS = config('ARCHIVE_NOTIFICATION_DAYS', default=90, cast=int)  # notifications lues
+ARCHIVE_SESSION_DAYS = config('ARCHIVE_SESSION_DAYS', default=180, cast=int)  # sessions closes de missions désactivées
+ARCHIVE_SEGMENT_ROWS = config('ARCHIVE_SEGMENT_ROWS', default=50000, cast=int)
+ARCHIVE_DELETE_CHUNK = config('ARCHIVE_DELETE_CHUNK', default=1000, cast=int)
+
+# Journalisation : erreurs de paiement Pi et événements critiques sur la sortie standard
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'missions': {'handlers': ['console'], 'level': config('LOG_LEVEL', default='INFO')},
+    },
+}
+
+# Synchronisation incrémentale du client mobile (missions/sync.py)
+SYNC_TOMBSTONE_DAYS = config('SYNC_TOMBSTONE_DAYS', default=30, cast=int)  # validité des jetons
+SYNC_OVERLAP_SECONDS = config('SYNC_OVERLAP_SECONDS', default=30, cast=int)
+SYNC_FULL_NOTIFICATIONS = config('SYNC_FULL_NOTIFICATIONS', default=200, cast=int)
+
+# Server-sent events (missions/events.py)
+SSE_POLL_INTERVAL = config('SSE_POLL_INTERVAL', default=15, cast=int)  # secondes, repli multi-workers
+SSE_POLL_OVERLAP = config('SSE_POLL_OVERLAP', default=10, cast=int)  # secondes relues à chaque poll (commits tardifs)
+SSE_MAX_DURATION = config('SSE_MAX_DURATION', default=300, cast=int)  # durée max d'une connexion SSE
@@ -19,16 +19,17 @@ from django.contrib.auth import views as auth_views
 from django.views.generic import RedirectView
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework import routers
 from rest_framework_simplejwt.views import TokenRefreshView, TokenObtainPairView
 from missions.views import (
-    UserProfileViewSet, MissionViewSet, UserMissionViewSet, mark_notification_read, custom_login_view,
+    UserProfileViewSet, MissionViewSet, UserMissionViewSet, ModerationViewSet, mark_notification_read, custom_login_view,
     RegisterViewSet, CustomTokenObtainPairView, user_proofs, user_notifications, list_missions,
-    choose_mission, mission_detail, submit_proof, user_profile, product_list, create_product,
+    choose_mission, mission_detail, submit_proof, user_profile, profile_purchases, profile_sales, profile_badges, product_list, create_product,
     product_detail, start_purchase, edit_proof, delete_proof, signup, pi_authenticate,
-    pi_withdraw, pi_payment_webhook, mark_shipped, confirm_receipt, privacy_policy, terms_of_service
+    pi_withdraw, pi_payment_webhook, event_stream, mark_shipped, confirm_receipt, privacy_policy, terms_of_service,
+    sync_changes, serve_media, leaderboard_view
 )
+from missions.throttling import AuthThrottle
 
 
 router = routers.DefaultRouter()
@@ -36,6 +37,7 @@ router.register(r'user-profile', UserProfileViewSet, basename='user-profile')
 router.register(r'missions', MissionViewSet, basename='missions')
 router.register(r'user-missions', UserMissionViewSet, basename='user-missions')
 router.register(r'auth', RegisterViewSet, basename='auth')
+router.register(r'moderation', ModerationViewSet, basename='moderation')
 
 api_patterns = [
     path('', include(router.urls)),
@@ -43,6 +45,12 @@ api_patterns = [
     path('pi/auth/', pi_authenticate, name='pi_authenticate'),
     path('pi/withdraw/', pi_withdraw, name='pi_withdraw'),
     path('pi/webhook/', pi_payment_webhook, name='pi_webhook'),
+    # Synchronisation incrémentale du client mobile
+    path('sync/', sync_changes, name='sync'),
+    # Classements jour / semaine / mois
+    path('leaderboard/', leaderboard_view, name='leaderboard'),
+    # Server-sent events (notifications, statut des achats)
+    path('events/', event_stream, name='event_stream'),
     # API for purchase flow
     path('marketplace/product/<int:product_id>/start-purchase/', start_purchase, name='start_purchase'),
     path('marketplace/purchase/<int:purchase_id>/mark-shipped/', mark_shipped, name='mark_shipped'),
@@ -54,7 +62,7 @@ urlpatterns = [
    # API endpoints
     path('api/', include(api_patterns)),
     path('api/token/', include('missions.urls_token')),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', TokenRefreshView.as_view(throttle_classes=[AuthThrottle]), name='token_refresh'),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
    # Web pages
     path('', RedirectView.as_view(pattern_name='login', permanent=False), name='home'),
@@ -67,6 +75,9 @@ urlpatterns = [
     path('missions/<int:mission_id>/', mission_detail, name='mission_detail'),
     path('missions/session/<int:session_id>/submit-proof/', submit_proof, name='submit_proof'),
     path('profile/', user_profile, name='user_profile'),
+    path('profile/purchases/', profile_purchases, name='profile_purchases'),
+    path('profile/sales/', profile_sales, name='profile_sales'),
+    path('profile/badges/', profile_badges, name='profile_badges'),
     path('marketplace/', product_list, name='product_list'),
     path('marketplace/product/<int:product_id>/', product_detail, name='product_detail'),
     path('marketplace/create/', create_product, name='create_product'),
@@ -79,6 +90,7 @@ urlpatterns = [
     path('terms-of-service/', terms_of_service, name='terms_of_service'),
 ]
 
-# Servir les fichiers médias en mode DEBUG
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Médias : accès contrôlé (preuves privées), transfert par le frontal en production
+urlpatterns += [
+    path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media, name='serve_media'),
+]
@@ -1,16 +1,36 @@
 # Dans c:\Users\HP\MissionHub\missionhub-backend\missions\admin.py
+from django import forms
 from django.contrib import admin
 from django.db import transaction
-from django.utils import timezone
-from django.utils.html import format_html
-from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+from django.urls import path, reverse
 from django.contrib import messages
-from .models import Mission, Proof, UserProfile, UserSession, Badge, UserBadge, Product, Purchase, Notification
-from .views import release_funds_to_seller
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from . import audit, badges
+from .models import AuditEvent, Mission, Proof, UserProfile, UserSession, Badge, UserBadge, Product, Purchase, Notification
+from .moderation import ModerationError, claim_batch, moderation_stats, release_claims, review_proof
+from .transitions import bulk_transition, transition_purchase
+from .views import pay_seller
+
+@admin.register(Mission)
+class MissionAdmin(admin.ModelAdmin):
+    list_display = ('title', 'category', 'difficulty', 'reward', 'participant_count', 'capacity', 'is_active')
+    list_filter = ('is_active', 'category')
+    readonly_fields = ('participant_count',)
 
 @admin.register(Badge)
 class BadgeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'icon', 'reward_value')
+    list_display = ('name', 'description', 'icon', 'reward_value', 'rule')
+
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        if db_field.name == 'rule':
+            return forms.ChoiceField(
+                choices=[('', "Aucune (attribution manuelle)")] + badges.choices(), required=False, label="Règle",
+                help_text="Attribution rétroactive : manage.py backfill_badge <id>",
+            )
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
 
 @admin.register(UserBadge)
 class UserBadgeAdmin(admin.ModelAdmin):
@@ -22,20 +42,18 @@ class UserBadgeAdmin(admin.ModelAdmin):
 def resolve_in_favor_of_seller(modeladmin, request, queryset):
     """Résout les litiges en payant le vendeur."""
     resolved_count = 0
-    for purchase in queryset.filter(status='disputed'):
-        try:
-            with transaction.atomic():
-                success, message = release_funds_to_seller(purchase)
-                if not success:
-                    raise Exception(message)
-                
-                purchase.status = 'completed'
-                purchase.save()
-                Notification.objects.create(user=purchase.seller, message=f"Le litige pour '{purchase.product.name}' a été résolu en votre faveur. Les fonds ont été transférés.")
-                Notification.objects.create(user=purchase.buyer, message=f"Le litige pour '{purchase.product.name}' a été résolu en faveur du vendeur.")
-                resolved_count += 1
-        except Exception as e:
-            modeladmin.message_user(request, f"Erreur lors de la résolution du litige #{purchase.id}: {e}", messages.ERROR)
+    for purchase in queryset.filter(status='disputed').select_related('product', 'seller', 'buyer'):
+        # Transition validée avant le paiement : un autre admin ne peut pas payer en parallèle
+        if not transition_purchase(purchase, 'disputed', 'completed', actor=request.user):
+            continue
+        success, message = pay_seller(purchase, actor=request.user)
+        if not success:
+            modeladmin.message_user(request, f"Erreur lors de la résolution du litige #{purchase.id}: {message}", messages.ERROR)
+            continue
+
+        Notification.objects.create(user=purchase.seller, message=f"Le litige pour '{purchase.product.name}' a été résolu en votre faveur. Les fonds ont été transférés.")
+        Notification.objects.create(user=purchase.buyer, message=f"Le litige pour '{purchase.product.name}' a été résolu en faveur du vendeur.")
+        resolved_count += 1
     
     if resolved_count > 0:
         modeladmin.message_user(request, f"{resolved_count} litige(s) résolu(s) en faveur du vendeur.")
@@ -45,20 +63,20 @@ def resolve_in_favor_of_buyer(modeladmin, request, queryset):
     """Résout les litiges en remboursant l'acheteur."""
     from .views import refund_to_buyer  # Local import to avoid circular dependency
     resolved_count = 0
-    for purchase in queryset.filter(status='disputed'):
+    for purchase in queryset.filter(status='disputed').select_related('product', 'seller', 'buyer'):
         try:
             with transaction.atomic():
+                if not transition_purchase(purchase, 'disputed', 'cancelled', actor=request.user):
+                    continue
                 success, message = refund_to_buyer(purchase)
                 if not success:
                     raise Exception(message)
-                
-                purchase.status = 'cancelled'
-                purchase.save()
 
                 Notification.objects.create(user=purchase.buyer, message=f"Le litige pour '{purchase.product.name}' a été résolu en votre faveur. Vous avez été remboursé.")
                 Notification.objects.create(user=purchase.seller, message=f"Le litige pour '{purchase.product.name}' a été résolu en faveur de l'acheteur.")
                 resolved_count += 1
         except Exception as e:
+            audit.record('purchase', purchase.id, 'refund_failed', actor=request.user, error=str(e))
             modeladmin.message_user(request, f"Erreur lors de la résolution du litige #{purchase.id}: {e}", messages.ERROR)
     
     if resolved_count > 0:
@@ -70,19 +88,16 @@ def confirm_payment_manually(modeladmin, request, queryset):
     Action pour manuellement passer une commande de 'En attente de paiement' à 'Paiement sécurisé'.
     Utile si le webhook de paiement Pi a échoué.
     """
-    purchases_updated = 0
-    for purchase in queryset.filter(status='awaiting_payment'):
-        purchase.status = 'in_escrow'
-        purchase.save()
-        
+    # Une seule requête UPDATE ... RETURNING pour toute la sélection
+    updated_ids = bulk_transition(queryset, 'awaiting_payment', 'in_escrow', actor=request.user, reason='manual_confirmation')
+    for purchase in Purchase.objects.filter(pk__in=updated_ids).select_related('product'):
         Notification.objects.create(
-            user=purchase.seller,
+            user_id=purchase.seller_id,
             message=f"Le paiement pour '{purchase.product.name}' a été confirmé. Vous pouvez maintenant expédier le produit."
         )
-        purchases_updated += 1
             
-    if purchases_updated > 0:
-        modeladmin.message_user(request, f"{purchases_updated} achat(s) ont été manuellement confirmés et sont maintenant en séquestre.")
+    if updated_ids:
+        modeladmin.message_user(request, f"{len(updated_ids)} achat(s) ont été manuellement confirmés et sont maintenant en séquestre.")
     else:
         modeladmin.message_user(request, "Aucun achat n'était en attente de paiement.", messages.WARNING)
 
@@ -93,64 +108,108 @@ def force_complete_purchase(modeladmin, request, queryset):
     À utiliser si l'acheteur ne confirme pas la réception.
     """
     completed_count = 0
-    for purchase in queryset.filter(status='shipped'):
-        try:
-            with transaction.atomic():
-                success, message = release_funds_to_seller(purchase)
-                if not success:
-                    raise Exception(message)
-                purchase.status = 'completed'
-                purchase.save()
-                completed_count += 1
-        except Exception as e:
-            modeladmin.message_user(request, f"Erreur lors de la finalisation de l'achat #{purchase.id}: {e}", messages.ERROR)
+    for purchase in queryset.filter(status='shipped').select_related('product', 'seller'):
+        if not transition_purchase(purchase, 'shipped', 'completed', actor=request.user, reason='forced'):
+            continue
+        success, message = pay_seller(purchase, actor=request.user)
+        if not success:
+            modeladmin.message_user(request, f"Erreur lors de la finalisation de l'achat #{purchase.id}: {message}", messages.ERROR)
+            continue
+        completed_count += 1
     if completed_count > 0:
         modeladmin.message_user(request, f"{completed_count} achat(s) ont été finalisés avec succès.")
 
 
 @admin.action(description='Valider les preuves sélectionnées')
 def validate_proofs(modeladmin, request, queryset):
-    # On ne traite que les preuves en attente pour éviter de donner des points en double
-    proofs_to_validate = queryset.filter(status='pending')
+    # On ne traite que les preuves en attente pour éviter de donner des points en double ;
+    # les preuves réservées par un autre modérateur sont ignorées.
     validated_count = 0
-    for proof in proofs_to_validate:
-            with transaction.atomic():
-                profile = proof.session.user.profile
-                mission = proof.session.mission
-                profile.solde += mission.reward
-                profile.score += mission.reward
-                profile.save()
-
-                proof.status = 'validated'
-                proof.reviewed_at = timezone.now()
-                proof.rejection_reason = None  # On s'assure que la raison est nulle
-                proof.save()
-                validated_count += 1
+    for proof_id in queryset.filter(status='pending').values_list('id', flat=True):
+        try:
+            review_proof(proof_id, 'validated', moderator=request.user, require_claim=False)
+            validated_count += 1
+        except ModerationError:
+            pass
     modeladmin.message_user(request, f"{validated_count} preuve(s) ont été validées avec succès.")
 
 @admin.action(description='Rejeter les preuves sélectionnées')
 def reject_proofs(modeladmin, request, queryset):
     # On ne peut rejeter que les preuves en attente
-    proofs_to_reject = queryset.filter(status='pending')
     # Note : Pour ajouter une raison de rejet en masse, une page intermédiaire serait nécessaire.
     # Pour l'instant, le rejet met à jour le statut. La raison peut être ajoutée en modifiant la preuve individuellement.
-    rejected_count = proofs_to_reject.update(status='rejected', reviewed_at=timezone.now())
+    rejected_count = 0
+    for proof_id in queryset.filter(status='pending').values_list('id', flat=True):
+        try:
+            review_proof(proof_id, 'rejected', moderator=request.user, require_claim=False)
+            rejected_count += 1
+        except ModerationError:
+            pass
     modeladmin.message_user(request, f"{rejected_count} preuve(s) ont été rejetées.")
 
+class MissionListFilter(admin.SimpleListFilter):
+    """Filtre par mission à partir de la table des missions, sans DISTINCT sur toutes les preuves."""
+    title = 'mission'
+    parameter_name = 'mission'
+
+    def lookups(self, request, model_admin):
+        return Mission.objects.filter(is_active=True).order_by('title').values_list('id', 'title')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(session__mission_id=self.value())
+        return queryset
+
 class ProofAdmin(admin.ModelAdmin):
-    list_display = ('mission_title', 'user_link', 'photo_thumbnail', 'status', 'submitted_at', 'reviewed_at')
-    list_filter = ('status', 'session__mission__title')
+    list_display = ('mission_title', 'user_link', 'photo_thumbnail', 'status', 'risk_score', 'submitted_at', 'reviewed_at', 'reviewed_by', 'claimed_by')
+    list_filter = ('status', MissionListFilter)
     search_fields = ('session__user__username', 'session__mission__title', 'location')
-    list_select_related = ('session__user', 'session__mission')
-    readonly_fields = ('photo_thumbnail', 'submitted_at', 'reviewed_at')
+    list_select_related = ('session__user', 'session__mission', 'reviewed_by', 'claimed_by')
+    readonly_fields = (
+        'photo_thumbnail', 'submitted_at', 'reviewed_at', 'reviewed_by', 'claimed_by', 'claim_expires_at',
+        'risk_score', 'risk_flags', 'exif_taken_at', 'exif_latitude', 'exif_longitude', 'screened_at',
+    )
     actions = [validate_proofs, reject_proofs]
     
     fieldsets = (
-        ('Information', {'fields': ('session', 'status', 'submitted_at', 'reviewed_at')}),
+        ('Information', {'fields': ('session', 'status', 'submitted_at', 'reviewed_at', 'reviewed_by')}),
         ('Contenu de la preuve', {'fields': ('photo_thumbnail', 'photo', 'location')}),
-        ('Modération', {'fields': ('rejection_reason',)}),
+        ('Modération', {'fields': ('rejection_reason', 'claimed_by', 'claim_expires_at')}),
+        ('Pré-filtrage', {'fields': ('risk_score', 'risk_flags', 'exif_taken_at', 'exif_latitude', 'exif_longitude', 'screened_at')}),
     )
 
+    def get_urls(self):
+        urls = [
+            path('queue/', self.admin_site.admin_view(self.moderation_queue_view), name='missions_proof_queue'),
+        ]
+        return urls + super().get_urls()
+
+    def moderation_queue_view(self, request):
+        """Lot de preuves réservé au modérateur connecté (voir missions/moderation.py)."""
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        if request.method == 'POST':
+            if 'release' in request.POST:
+                release_claims(request.user)
+                return redirect('admin:missions_proof_changelist')
+            try:
+                review_proof(
+                    request.POST.get('proof_id'), request.POST.get('decision'), moderator=request.user,
+                    reason=request.POST.get('rejection_reason') or None,
+                )
+            except ModerationError as e:
+                self.message_user(request, str(e), messages.WARNING)
+            return redirect('admin:missions_proof_queue')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'File de modération',
+            'proofs': claim_batch(request.user),
+            'stats': moderation_stats(),
+        }
+        return TemplateResponse(request, 'admin/missions/proof/moderation_queue.html', context)
+
     @admin.display(description='Mission', ordering='session__mission__title')
     def mission_title(self, obj):
         return obj.session.mission.title
@@ -169,7 +228,6 @@ class ProofAdmin(admin.ModelAdmin):
 
 
 
-admin.site.register(Mission)
 admin.site.register(Proof, ProofAdmin)
 admin.site.register(UserProfile)
 admin.site.register(UserSession)
@@ -184,5 +242,37 @@ class ProductAdmin(admin.ModelAdmin):
 class PurchaseAdmin(admin.ModelAdmin):
     list_display = ('id', 'product', 'buyer', 'seller', 'status', 'total_price', 'created_at', 'updated_at')
     list_filter = ('status',)   
+    # Le statut ne change que via les actions, qui passent par la machine à états
+    readonly_fields = ('status', 'audit_history')
     actions = [confirm_payment_manually, force_complete_purchase, resolve_in_favor_of_seller, resolve_in_favor_of_buyer]
-    search_fields = ('product__name', 'buyer__username', 'seller__username')
\ No newline at end of file
+    search_fields = ('product__name', 'buyer__username', 'seller__username')
+
+    @admin.display(description='Historique')
+    def audit_history(self, obj):
+        if obj.pk is None:
+            return '-'
+        events = audit.history('purchase', obj.pk).select_related('actor')
+        return format_html_join(
+            '', '<div>{} — {} {} → {} ({}) {}</div>',
+            ((e.created_at, e.action, e.source or '', e.target or '', e.actor or 'système', e.data or '') for e in events),
+        ) or '-'
+
+
+@admin.register(AuditEvent)
+class AuditEventAdmin(admin.ModelAdmin):
+    """Journal en lecture seule : ni ajout, ni modification, ni suppression depuis l'admin."""
+    list_display = ('created_at', 'entity_type', 'entity_id', 'action', 'source', 'target', 'actor')
+    list_filter = ('entity_type', 'action')
+    search_fields = ('=entity_id',)
+    list_select_related = ('actor',)
+    # Un COUNT(*) sur toutes les partitions à chaque affichage serait coûteux
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,234 @@
+"""
+Archivage à froid des notifications lues et des sessions de mission closes.
+
+Les lignes anciennes sont écrites dans des segments JSONL compressés
+(ARCHIVE_ROOT/<type>/AAAA/MM/…jsonl.gz), puis supprimées des tables par lots :
+les tables chaudes et leurs index gardent une taille bornée. Chaque segment
+est une suite de membres gzip, un par utilisateur. Le fichier d'index voisin
+(`.idx.json`) donne la position de chaque membre : la recherche pour un
+utilisateur ne décompresse que ses lignes. ArchiveSegment recense les
+segments (type, plage d'ids et de dates).
+
+Un segment est écrit sous un nom temporaire, synchronisé sur disque puis
+renommé avant toute suppression : une ligne supprimée est toujours archivée.
+Les suppressions contournent les signaux (pas de notification « preuve
+supprimée », pas de place libérée, pas de référence média rendue). Les photos
+des preuves archivées restent dans le stockage : une restauration les retrouve.
+
+Une session est close quand sa mission est désactivée (choose_mission refuse
+alors une nouvelle participation) et que toutes ses preuves sont tranchées :
+elle n'est archivée que si aucune preuve n'est en attente ni n'a bougé depuis
+la date limite.
+"""
+import gzip
+import json
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import ArchiveSegment, Notification, Proof, UserSession
+
+KINDS = ('notifications', 'sessions')
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """Comme DjangoJSONEncoder, sans tronquer les dates à la milliseconde : la restauration est exacte."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _root():
+    return str(getattr(settings, 'ARCHIVE_ROOT', settings.BASE_DIR / 'archive'))
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _restore_row(model, row):
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.attname in row:
+            value = row[field.attname]
+            values[field.attname] = field.to_python(value) if value is not None else None
+    return model(**values)
+
+
+def notification_candidates(now=None):
+    days = getattr(settings, 'ARCHIVE_NOTIFICATION_DAYS', 90)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+
+
+def session_candidates(now=None):
+    days = getattr(settings, 'ARCHIVE_SESSION_DAYS', 180)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    recent = Proof.objects.filter(session=OuterRef('pk')).filter(
+        Q(status='pending') | Q(submitted_at__gte=cutoff) | Q(reviewed_at__gte=cutoff)
+    )
+    return UserSession.objects.filter(mission__is_active=False, started_at__lt=cutoff).exclude(Exists(recent))
+
+
+# --- Écriture -----------------------------------------------------------------
+
+def _fetch(kind, ids):
+    """Lignes à archiver, groupées par utilisateur : {user_id: [ligne, ...]} triées par id."""
+    rows = defaultdict(list)
+    if kind == 'notifications':
+        for row in Notification.objects.filter(pk__in=ids).order_by('id').values(*_columns(Notification)):
+            rows[row['user_id']].append(row)
+        return rows
+    proofs = defaultdict(list)
+    for row in Proof.objects.filter(session_id__in=ids).order_by('id').values(*_columns(Proof)):
+        proofs[row['session_id']].append(row)
+    for row in UserSession.objects.filter(pk__in=ids).order_by('id').values(*_columns(UserSession)):
+        row['proofs'] = proofs.get(row['id'], [])
+        rows[row['user_id']].append(row)
+    return rows
+
+
+def _write_segment(kind, rows, now):
+    """Écrit le segment et son index ; retourne le chemin relatif du segment."""
+    relative = os.path.join(kind, f'{now:%Y}', f'{now:%m}', f'{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.jsonl.gz')
+    path = os.path.join(_root(), relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    members = {}
+    temporary = f'{path}.part'
+    with open(temporary, 'wb') as handle:
+        for user_id in sorted(rows):
+            lines = ''.join(json.dumps(row, cls=ArchiveEncoder) + '\n' for row in rows[user_id])
+            data = gzip.compress(lines.encode(), mtime=0)
+            members[str(user_id)] = [handle.tell(), len(data), len(rows[user_id])]
+            handle.write(data)
+        handle.flush()
+        os.fsync(handle.fileno())
+    with open(f'{temporary}.idx', 'w') as handle:
+        json.dump(members, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(f'{temporary}.idx', f'{path}.idx.json')
+    os.replace(temporary, path)
+    return relative
+
+
+def _delete_rows(model, column, ids):
+    """DELETE ... WHERE column IN (ids), sans charger les lignes ni émettre post_delete."""
+    if not ids:
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(model._meta.db_table)} WHERE {qn(column)} IN ({', '.join(['%s'] * len(ids))})",
+            ids,
+        )
+
+
+def _delete(candidates, kind, ids, chunk_size):
+    """
+    Supprime les lignes archivées, par lots. Une ligne redevenue active entre-temps
+    (notification marquée non lue...) reste en place ; sa copie archivée est
+    ignorée à la restauration.
+    """
+    for start in range(0, len(ids), chunk_size):
+        with transaction.atomic():
+            chunk = list(candidates.filter(pk__in=ids[start:start + chunk_size]).select_for_update(of=('self',)).values_list('id', flat=True))
+            if kind == 'notifications':
+                _delete_rows(Notification, 'id', chunk)
+            else:
+                # Les preuves d'abord : la clé étrangère vers la session
+                _delete_rows(Proof, Proof._meta.get_field('session').column, chunk)
+                _delete_rows(UserSession, 'id', chunk)
+
+
+def archive(kind, now=None, segment_rows=None, chunk_size=None):
+    """Archive toutes les lignes éligibles de `kind` ; retourne (segments écrits, lignes archivées)."""
+    now = now or timezone.now()
+    segment_rows = segment_rows or getattr(settings, 'ARCHIVE_SEGMENT_ROWS', 50000)
+    chunk_size = chunk_size or getattr(settings, 'ARCHIVE_DELETE_CHUNK', 1000)
+    candidates = notification_candidates(now) if kind == 'notifications' else session_candidates(now)
+    order = ('created_at', 'id') if kind == 'notifications' else ('id',)
+
+    segments = archived = 0
+    while True:
+        ids = list(candidates.order_by(*order).values_list('id', flat=True)[:segment_rows])
+        if not ids:
+            return segments, archived
+        rows = _fetch(kind, ids)
+        flat = [row for user_rows in rows.values() for row in user_rows]
+        dates = [row['created_at' if kind == 'notifications' else 'started_at'] for row in flat]
+        relative = _write_segment(kind, rows, now)
+        ArchiveSegment.objects.create(
+            kind=kind, path=relative, rows=len(flat),
+            first_id=min(ids), last_id=max(ids), first_at=min(dates), last_at=max(dates),
+        )
+        _delete(candidates, kind, ids, chunk_size)
+        segments += 1
+        archived += len(flat)
+
+
+# --- Lecture et restauration --------------------------------------------------
+
+def _read_member(path, offset, size):
+    with open(path, 'rb') as handle:
+        handle.seek(offset)
+        return gzip.decompress(handle.read(size))
+
+
+def lookup(kind, user_id=None, object_id=None):
+    """
+    Lignes archivées d'un utilisateur et/ou d'un objet (id de notification ou de
+    session). Une ligne archivée deux fois (restaurée puis réarchivée) n'apparaît
+    qu'une fois, dans sa version la plus récente.
+    """
+    segments = ArchiveSegment.objects.filter(kind=kind)
+    if object_id is not None:
+        segments = segments.filter(first_id__lte=object_id, last_id__gte=object_id)
+    found = {}
+    for segment in segments.order_by('created_at', 'id'):
+        path = os.path.join(_root(), segment.path)
+        if user_id is not None:
+            with open(f'{path}.idx.json') as handle:
+                member = json.load(handle).get(str(user_id))
+            if member is None:
+                continue
+            data = _read_member(path, member[0], member[1])
+        else:
+            with gzip.open(path, 'rb') as handle:
+                data = handle.read()
+        for line in data.splitlines():
+            row = json.loads(line)
+            if object_id is None or row['id'] == object_id:
+                found[row['id']] = row
+    return [found[pk] for pk in sorted(found)]
+
+
+def _bulk_restore(model, rows):
+    objects = [_restore_row(model, row) for row in rows]
+    model.objects.bulk_create(objects)
+    # bulk_create impose l'heure courante aux champs auto_now_add : on remet les dates d'origine
+    fixed = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)]
+    for row in rows:
+        model.objects.filter(pk=row['id']).update(**{field.attname: field.to_python(row[field.attname]) for field in fixed})
+
+
+def restore(kind, rows):
+    """Réinsère des lignes retournées par lookup() ; celles encore présentes sont ignorées. Retourne le nombre réinséré."""
+    model = Notification if kind == 'notifications' else UserSession
+    existing = set(model.objects.filter(pk__in=[row['id'] for row in rows]).values_list('id', flat=True))
+    rows = [row for row in rows if row['id'] not in existing]
+    with transaction.atomic():
+        _bulk_restore(model, rows)
+        if kind == 'sessions':
+            _bulk_restore(Proof, [proof for row in rows for proof in row['proofs']])
+    return len(rows)
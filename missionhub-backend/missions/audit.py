@@ -0,0 +1,141 @@
+"""
+Journal d'audit des achats et des preuves.
+
+Chaque transition de statut, paiement, remboursement ou décision de
+modération ajoute une ligne AuditEvent, dans la transaction qui modifie
+l'état : un rollback n'en laisse aucune trace, un état validé a toujours son
+historique. Les événements d'une même opération (transition en masse) sont
+écrits par un seul INSERT multi-lignes. Les échecs dont la transaction est
+annulée (paiement Pi refusé...) sont journalisés par l'appelant après le
+rollback.
+
+Sur PostgreSQL la table est partitionnée par mois (RANGE sur `created_at`,
+migration 0023) : une partition ancienne se détache ou se supprime sans
+DELETE ni VACUUM. Les partitions à venir sont créées par la commande
+audit_partitions ; une partition DEFAULT reçoit les lignes hors plage. Sur les
+autres bases la table est ordinaire et l'élagage supprime les lignes par lots.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import AuditEvent
+
+TABLE = AuditEvent._meta.db_table
+_PARTITION = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def event(entity_type, entity_id, action, source=None, target=None, actor=None, **data):
+    """AuditEvent non enregistré ; `actor` peut être un utilisateur anonyme ou None (système)."""
+    return AuditEvent(
+        entity_type=entity_type, entity_id=entity_id, action=action, source=source, target=target,
+        actor_id=getattr(actor, 'pk', None),
+        data={key: value for key, value in data.items() if value is not None},
+    )
+
+
+def write(events):
+    """Écrit les événements par lots (un INSERT multi-lignes par lot)."""
+    return AuditEvent.objects.bulk_create(events, batch_size=getattr(settings, 'AUDIT_BATCH_SIZE', 500))
+
+
+def record(entity_type, entity_ids, action, **kwargs):
+    """Même événement pour une ou plusieurs entités (id ou liste d'ids)."""
+    if isinstance(entity_ids, (int, str)):
+        entity_ids = [entity_ids]
+    return write([event(entity_type, entity_id, action, **kwargs) for entity_id in entity_ids])
+
+
+def history(entity_type, entity_id):
+    """Historique d'une entité, du plus ancien au plus récent (index auditevent_entity_idx)."""
+    return AuditEvent.objects.filter(entity_type=entity_type, entity_id=entity_id).order_by('created_at', 'id')
+
+
+# --- Partitions (PostgreSQL) -------------------------------------------------
+
+def month_start(moment, offset=0):
+    """Premier jour (UTC) du mois de `moment`, décalé de `offset` mois."""
+    index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partitions():
+    """Partitions mensuelles attachées : liste triée de (mois, nom de table)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    found = []
+    for name in names:
+        match = _PARTITION.match(name)
+        if match:
+            found.append((datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc), name))
+    return sorted(found)
+
+
+def ensure_partitions(now, months_ahead):
+    """Crée les partitions du mois courant et des `months_ahead` suivants ; retourne les noms créés."""
+    existing = {name for _, name in partitions()}
+    qn = connection.ops.quote_name
+    created = []
+    for offset in range(months_ahead + 1):
+        month = month_start(now, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} PARTITION OF {qn(TABLE)} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{month_start(month, 1).isoformat()}')"
+            )
+        created.append(name)
+    return created
+
+
+def drop_partitions(before, detach_only=False):
+    """
+    Retire les partitions entièrement antérieures à `before`. Avec `detach_only`,
+    elles restent en tables autonomes (à archiver avec pg_dump puis supprimer).
+    """
+    qn = connection.ops.quote_name
+    removed = []
+    for month, name in partitions():
+        if month_start(month, 1) > before:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}")
+            if not detach_only:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+        removed.append(name)
+    return removed
+
+
+def prune_rows(before, chunk_size=5000):
+    """Repli sans partitions : supprime par lots les événements antérieurs à `before`."""
+    deleted = 0
+    while True:
+        ids = list(AuditEvent.objects.filter(created_at__lt=before).order_by('created_at').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        # QuerySet.delete() : AuditEvent.delete() refuse les suppressions unitaires
+        deleted += AuditEvent.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,166 @@
+"""
+Authentification JWT sans requête SQL sur les chemins chauds de l'API.
+
+Le principal (User + UserProfile) est résolu à partir des claims du jeton
+(`user_id`, `pseudo`) au travers d'un cache LRU borné, en mémoire du processus,
+avec une durée de vie limitée. Le cache est invalidé explicitement à chaque
+modification d'un utilisateur ou de son profil (voir signals.py).
+
+L'invalidation ne vide que le cache du processus courant : les autres workers
+continuent de servir l'ancien principal (compte désactivé, mot de passe changé,
+solde) jusqu'à l'expiration de leur entrée. PRINCIPAL_CACHE_TTL est donc le
+délai maximal de propagation d'une modification et doit rester court.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import UserProfile
+
+
+class PrincipalCache:
+    """
+    Cache LRU thread-safe avec expiration.
+
+    Un compteur de version global protège contre la réinsertion d'une valeur
+    lue avant une invalidation concurrente.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            if version is not None and version != self._version:
+                # Une invalidation a eu lieu pendant le chargement : la valeur est peut-être périmée.
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._version += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+principal_cache = PrincipalCache(
+    max_size=getattr(settings, 'PRINCIPAL_CACHE_MAX_SIZE', 10000),
+    ttl=getattr(settings, 'PRINCIPAL_CACHE_TTL', 60),
+)
+
+
+def invalidate_principal(user_id):
+    """
+    Retire un utilisateur du cache (à appeler après toute écriture hors save()).
+    Seul le cache de ce processus est vidé : les autres workers gardent leur
+    entrée jusqu'au TTL.
+    """
+    principal_cache.invalidate(str(user_id))
+
+
+def _field_names(model):
+    return [f.attname for f in model._meta.concrete_fields]
+
+
+def _snapshot(user):
+    """Fige les valeurs de l'utilisateur et de son profil sous forme de tuples immuables."""
+    profile = getattr(user, 'profile', None)
+    return (
+        user._state.db,
+        tuple(getattr(user, name) for name in _field_names(User)),
+        tuple(getattr(profile, name) for name in _field_names(UserProfile)) if profile else None,
+    )
+
+
+def _restore(snapshot):
+    """Reconstruit des instances neuves à chaque requête : aucun objet n'est partagé entre threads."""
+    db, user_values, profile_values = snapshot
+    user = User.from_db(db, _field_names(User), user_values)
+    if profile_values is not None:
+        user.profile = UserProfile.from_db(db, _field_names(UserProfile), profile_values)
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Variante de JWTAuthentication qui résout le principal via `principal_cache`.
+
+    Sur un cache chaud, l'authentification ne fait aucune requête et
+    `request.user.profile` est déjà chargé.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        # Le claim peut être un entier ou une chaîne selon la version de simplejwt
+        key = str(user_id)
+        snapshot = principal_cache.get(key)
+        if snapshot is not None:
+            user = _restore(snapshot)
+            # Le pseudo est embarqué dans le jeton : un écart signale une entrée périmée.
+            pseudo = validated_token.get('pseudo')
+            if pseudo is None or getattr(getattr(user, 'profile', None), 'pseudo', None) == pseudo:
+                return self._check_user(user, validated_token)
+
+        version = principal_cache.version
+        try:
+            user = (
+                self.user_model.objects
+                .select_related('profile')
+                .get(**{api_settings.USER_ID_FIELD: user_id})
+            )
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        principal_cache.set(key, _snapshot(user), version=version)
+        return self._check_user(user, validated_token)
+
+    def _check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
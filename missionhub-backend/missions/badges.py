@@ -0,0 +1,109 @@
+"""
+Règles d'attribution des badges.
+
+Chaque règle est une requête ensembliste : elle retourne, pour tous les
+utilisateurs à la fois, les profils qui remplissent la condition (colonne
+`profile`). Le même code sert à l'attribution au fil de l'eau
+(check_and_award_badges, restreinte à un profil) et à l'attribution
+rétroactive d'un nouveau badge (commande backfill_badge, par lots de profils).
+Un badge est relié à sa règle par `Badge.rule`.
+
+Une attribution verrouille les profils concernés avant de lire leurs badges :
+la validation d'une preuve (qui met à jour le profil dans sa transaction) et un
+rattrapage simultané ne créditent jamais deux fois la même récompense.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .authentication import invalidate_principal
+from .events import publish_notification
+from .models import Notification, Proof, UserBadge, UserProfile
+
+RULES = {}
+
+
+def rule(key, label):
+    """Enregistre une règle : fonction sans argument retournant un queryset de dicts {'profile': id}."""
+    def register(function):
+        RULES[key] = (label, function)
+        return function
+    return register
+
+
+def choices():
+    return [(key, label) for key, (label, _) in RULES.items()]
+
+
+def _validated_proofs():
+    return Proof.objects.filter(status='validated').annotate(profile=F('session__user__profile')).values('profile')
+
+
+@rule('first_validated_proof', "Au moins une preuve validée")
+def first_validated_proof():
+    return _validated_proofs().distinct()
+
+
+@rule('explorer', "Preuves validées dans au moins 3 catégories")
+def explorer():
+    return _validated_proofs().annotate(categories=Count('session__mission__category', distinct=True)).filter(categories__gte=3)
+
+
+def eligible(badge, after=None, profile=None):
+    """Ids des profils éligibles à `badge`, croissants ; `after` pour reprendre un parcours."""
+    queryset = RULES[badge.rule][1]()
+    if after is not None:
+        queryset = queryset.filter(profile__gt=after)
+    if profile is not None:
+        queryset = queryset.filter(profile=profile)
+    return queryset.order_by('profile').values_list('profile', flat=True)
+
+
+def award(badge, profile_ids, batch_size=1000):
+    """
+    Attribue `badge` aux profils qui ne l'ont pas encore : UserBadge insérés en
+    masse, récompense créditée par un seul UPDATE, notifications par lots.
+    Retourne les ids de profils effectivement récompensés.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        users = dict(UserProfile.objects.select_for_update().filter(pk__in=profile_ids).values_list('pk', 'user_id'))
+        owned = set(UserBadge.objects.filter(badge=badge, user_id__in=users).values_list('user_id', flat=True))
+        new = [profile_id for profile_id in users if profile_id not in owned]
+        if not new:
+            return []
+        UserBadge.objects.bulk_create(
+            [UserBadge(user_id=profile_id, badge=badge) for profile_id in new],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        if badge.reward_value:
+            UserProfile.objects.filter(pk__in=new).update(score=F('score') + badge.reward_value, updated_at=now)
+        message = f"Félicitations ! Vous avez débloqué le badge : '{badge.name}'."
+        # bulk_create n'émet pas post_save : invalidation du cache et envoi SSE faits ici, après commit
+        notifications = Notification.objects.bulk_create(
+            [Notification(user_id=users[profile_id], message=message) for profile_id in new],
+            batch_size=batch_size,
+        )
+        transaction.on_commit(lambda: _after_award(notifications))
+    return new
+
+
+def _after_award(notifications):
+    for notification in notifications:
+        invalidate_principal(notification.user_id)
+        publish_notification(notification)
+
+
+def backfill(badge, after=0, chunk_size=5000):
+    """
+    Attribution rétroactive, un lot de profils éligibles par transaction.
+    Génère (dernier profil traité, nombre de profils récompensés) après chaque
+    lot : le dernier id permet de reprendre un rattrapage interrompu.
+    """
+    while True:
+        chunk = list(eligible(badge, after=after)[:chunk_size])
+        if not chunk:
+            return
+        awarded = award(badge, chunk)
+        after = chunk[-1]
+        yield after, len(awarded)
@@ -0,0 +1,314 @@
+"""
+Diffusion en temps réel des notifications et des changements de statut d'achat (SSE).
+
+Les événements produits par ce processus passent par un pub/sub en mémoire
+(`broker`). Pour les déploiements multi-workers, un seul `poller` par
+processus interroge la base toutes les `SSE_POLL_INTERVAL` secondes, pour
+l'ensemble des utilisateurs connectés, et redistribue par le broker les
+événements produits par les autres processus ; chaque flux déduplique sur l'id
+de notification et le dernier statut envoyé par achat.
+
+Un id ou un `updated_at` est attribué avant le commit : une ligne peut devenir
+visible après une ligne plus récente. Chaque poll relit donc une fenêtre de
+`SSE_POLL_OVERLAP` secondes et le poller ne republie que les versions
+(id de notification, ou id/statut/`updated_at` d'achat) pas encore diffusées.
+
+Une connexion inactive ne coûte qu'une coroutine en attente sur une file : le
+nombre de requêtes par intervalle ne dépend pas du nombre de connexions. Seule
+une reconnexion (Last-Event-ID) ou un débordement de file déclenche une lecture
+propre au flux.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Notification, Purchase
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, user_id, loop, maxsize):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        # Positionné quand la file déborde : le flux se resynchronise via la base
+        self.overflowed = False
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventBroker:
+    """Pub/sub en mémoire, indexé par utilisateur. `publish` est appelable depuis n'importe quel thread."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def user_ids(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for subscription in subscribers:
+            if subscription.loop is running:
+                # Même boucle (poller) : l'événement est en file avant le prochain await
+                subscription._put(event)
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # Boucle fermée : le flux est en train de se terminer
+                pass
+
+
+broker = EventBroker()
+
+
+def notification_event(notification):
+    return {
+        'type': 'notification',
+        'id': notification.id,
+        'message': notification.message,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def purchase_event(purchase, user_id):
+    return {
+        'type': 'purchase',
+        'id': purchase.id,
+        'status': purchase.status,
+        'role': 'buyer' if purchase.buyer_id == user_id else 'seller',
+        'updated_at': purchase.updated_at.isoformat() if purchase.updated_at else None,
+    }
+
+
+def publish_notification(notification):
+    broker.publish(notification.user_id, notification_event(notification))
+
+
+def publish_purchase(purchase):
+    for user_id in {purchase.buyer_id, purchase.seller_id}:
+        broker.publish(user_id, purchase_event(purchase, user_id))
+
+
+def encode_cursor(last_notification_id, since):
+    """Curseur transmis dans le champ `id` SSE, renvoyé par le client via Last-Event-ID."""
+    return f"{last_notification_id}.{int(since.timestamp() * 1000)}"
+
+
+def decode_cursor(value):
+    try:
+        notification_id, millis = value.split('.')
+        return int(notification_id), datetime.fromtimestamp(int(millis) / 1000, tz=dt_timezone.utc)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _format(event, cursor):
+    return f"event: {event['type']}\nid: {cursor}\ndata: {json.dumps(event)}\n\n"
+
+
+def _overlap():
+    return timedelta(seconds=getattr(settings, 'SSE_POLL_OVERLAP', 10))
+
+
+def event_key(event):
+    """Version d'un événement : deux événements de même clé sont des doublons."""
+    if event['type'] == 'notification':
+        return ('notification', event['id'])
+    return ('purchase', event['id'], event['status'], event['updated_at'])
+
+
+async def poll(user_ids, last_notification_id, since, chunk_size=500):
+    """
+    Événements des utilisateurs `user_ids` produits depuis le dernier passage (y
+    compris par d'autres workers) : liste de (user_id, événement), deux requêtes
+    indexées par lot d'utilisateurs. `since` inclut déjà la fenêtre de
+    recouvrement ; les doublons sont à filtrer par l'appelant.
+    """
+    user_ids = list(user_ids)
+    window = since
+    recent = Q(id__gt=last_notification_id) | Q(updated_at__gt=window, created_at__gt=window)
+    events = []
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        events += [
+            (n.user_id, notification_event(n))
+            async for n in Notification.objects.filter(recent, user_id__in=chunk).order_by('id')
+        ]
+        wanted = set(chunk)
+        async for p in Purchase.objects.filter(
+            Q(buyer_id__in=chunk) | Q(seller_id__in=chunk), updated_at__gt=window
+        ).only('id', 'status', 'buyer_id', 'seller_id', 'updated_at').order_by('updated_at'):
+            events += [(user_id, purchase_event(p, user_id)) for user_id in {p.buyer_id, p.seller_id} & wanted]
+    return events
+
+
+async def _poll(user_id, last_notification_id, since):
+    return [event for _, event in await poll([user_id], last_notification_id, since - _overlap())]
+
+
+class Poller:
+    """
+    Poll unique de la base pour tous les flux ouverts de la boucle, démarré par
+    le premier abonné et arrêté quand il n'en reste plus. `covered_until` est
+    l'instant jusqu'auquel les changements d'achats ont été redistribués.
+    `published` retient, par (user_id, version), l'instant de diffusion des
+    événements encore dans la fenêtre de recouvrement.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.covered_until = None
+        self.published = {}
+        self._task = None
+
+    def ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        interval = getattr(settings, 'SSE_POLL_INTERVAL', 15)
+        started_at = since = timezone.now()
+        last_notification_id = (await Notification.objects.aaggregate(last=Max('id')))['last'] or 0
+        self.covered_until = since
+        self.published = {}
+        while True:
+            await asyncio.sleep(interval)
+            user_ids = self.broker.user_ids()
+            if not user_ids:
+                # Aucun await entre ce test et la fin : un nouvel abonné relance le poller
+                self._task = None
+                return
+            polled_at = timezone.now()
+            try:
+                # Rien avant le démarrage : les flux ouverts depuis n'attendent que du neuf
+                events = await poll(user_ids, last_notification_id, max(since - _overlap(), started_at))
+            except Exception:
+                # Base indisponible : on retente au prochain intervalle
+                logger.exception("Échec du poll SSE")
+                continue
+            for user_id, event in events:
+                if event['type'] == 'notification':
+                    last_notification_id = max(last_notification_id, event['id'])
+                key = (user_id, event_key(event))
+                if key in self.published:
+                    continue
+                self.published[key] = polled_at
+                self.broker.publish(user_id, event)
+            since = self.covered_until = polled_at
+            # Une version diffusée avant `since - overlap` ne peut plus être relue
+            horizon = since - _overlap()
+            self.published = {key: at for key, at in self.published.items() if at >= horizon}
+
+
+poller = Poller(broker)
+
+
+async def stream_events(user_id, cursor=None, once=False):
+    """
+    Générateur asynchrone du flux SSE d'un utilisateur.
+
+    `cursor` est le tuple (dernier id de notification, horodatage) décodé du
+    Last-Event-ID. Avec `once=True` (serveur WSGI), renvoie les événements en
+    attente puis se termine ; EventSource se reconnecte après le délai `retry`.
+    """
+    poll_interval = getattr(settings, 'SSE_POLL_INTERVAL', 15)
+    max_duration = getattr(settings, 'SSE_MAX_DURATION', 300)
+
+    subscription = broker.subscribe(user_id)
+    if not once:
+        poller.ensure_running()
+    try:
+        if cursor is None:
+            last_notification_id = (
+                await Notification.objects.filter(user_id=user_id).aaggregate(last=Max('id'))
+            )['last'] or 0
+            since = timezone.now()
+            events = []
+        else:
+            last_notification_id, since = cursor
+            polled_at = timezone.now()
+            events = await _poll(user_id, last_notification_id, since)
+            since = polled_at
+        sent_statuses = {}
+        sent_notifications = set()
+        # Sous le curseur, seules les notifications créées dans la fenêtre de
+        # recouvrement peuvent être des commits tardifs ; le client déduplique sur l'id
+        horizon = since if cursor is None else since - _overlap()
+        yield f"retry: {int(poll_interval * 1000)}\nid: {encode_cursor(last_notification_id, since)}\n\n"
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_duration
+        while True:
+            sent = False
+            for event in events:
+                if event['type'] == 'notification':
+                    if event['id'] in sent_notifications or (
+                        event['id'] <= last_notification_id
+                        and datetime.fromisoformat(event['created_at']) <= horizon
+                    ):
+                        continue
+                    sent_notifications.add(event['id'])
+                    last_notification_id = max(last_notification_id, event['id'])
+                elif sent_statuses.get(event['id']) == event['status']:
+                    continue
+                else:
+                    sent_statuses[event['id']] = event['status']
+                sent = True
+                yield _format(event, encode_cursor(last_notification_id, since))
+            if once or loop.time() >= deadline:
+                return
+            if not sent:
+                yield ': keepalive\n\n'
+
+            if subscription.overflowed:
+                polled_at = timezone.now()
+                subscription.overflowed = False
+                events = await _poll(user_id, last_notification_id, since)
+                since = polled_at
+                continue
+            try:
+                events = [await asyncio.wait_for(subscription.queue.get(), timeout=poll_interval)]
+            except asyncio.TimeoutError:
+                # File vide : tout ce que le poller a redistribué a été envoyé
+                events = []
+                if poller.covered_until is not None and poller.covered_until > since:
+                    since = poller.covered_until
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,157 @@
+"""
+Géolocalisation sans PostGIS : geohash, voisinage et distances.
+
+Un geohash découpe le globe en cellules imbriquées : deux points proches
+partagent le plus souvent un long préfixe. Une recherche par rayon se ramène
+donc à quelques parcours d'intervalle sur un index B-tree ordinaire (la
+cellule du centre et ses 8 voisines, à une précision au moins aussi large
+que le rayon), suivis d'un filtrage exact par distance.
+"""
+import math
+import re
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+STORED_PRECISION = 9  # environ 5 m
+EARTH_RADIUS_KM = 6371.0
+
+# Hauteur (km) des cellules par précision ; la largeur vaut la même chose
+# aux précisions impaires, la moitié aux précisions paires, fois cos(latitude).
+_CELL_HEIGHT_KM = {1: 5000, 2: 625, 3: 156, 4: 19.5, 5: 4.89, 6: 0.61, 7: 0.153, 8: 0.019, 9: 0.0048}
+
+_COORDINATES = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[,;]\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def encode(lat, lon, precision=STORED_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, value = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def bounds(geohash):
+    """(lat_min, lat_max, lon_min, lon_max) de la cellule."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def neighbors(geohash):
+    """Les 8 cellules voisines (moins aux pôles), à la même précision."""
+    lat_min, lat_max, lon_min, lon_max = bounds(geohash)
+    height, width = lat_max - lat_min, lon_max - lon_min
+    lat, lon = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlon in (-width, 0, width):
+            if (dlat or dlon) and -90 < lat + dlat < 90:
+                cells.add(encode(lat + dlat, (lon + dlon + 180) % 360 - 180, len(geohash)))
+    return cells
+
+
+def precision_for_radius(radius_km, lat):
+    """Précision la plus fine dont les cellules couvrent le rayon dans les deux directions."""
+    shrink = max(math.cos(math.radians(lat)), 0.01)
+    best = 1
+    for precision, height in _CELL_HEIGHT_KM.items():
+        width = (height if precision % 2 else height * 2) * shrink
+        if min(height, width) >= radius_km:
+            best = precision
+    return best
+
+
+def cover(lat, lon, radius_km):
+    """Cellules (centre + voisines) contenant tous les points à moins de `radius_km`."""
+    center = encode(lat, lon, precision_for_radius(radius_km, lat))
+    return {center} | neighbors(center)
+
+
+def _successor(prefix):
+    """Plus petite chaîne supérieure à tous les geohash commençant par `prefix` (None si aucune)."""
+    while prefix:
+        index = BASE32.index(prefix[-1])
+        if index + 1 < len(BASE32):
+            return prefix[:-1] + BASE32[index + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def prefix_q(cells, field='geohash'):
+    """
+    Condition « le geohash commence par l'une des cellules », exprimée en
+    intervalles (>= / <) pour que l'index B-tree serve sur PostgreSQL comme sur
+    SQLite, quelle que soit la collation, contrairement à LIKE 'abc%'.
+    """
+    condition = Q()
+    for cell in cells:
+        upper = _successor(cell)
+        term = Q(**{f'{field}__gte': cell})
+        if upper is not None:
+            term &= Q(**{f'{field}__lt': upper})
+        condition |= term
+    return condition
+
+
+def bounding_box_q(lat, lon, radius_km, lat_field='latitude', lon_field='longitude'):
+    """Filtre grossier (rectangle englobant) appliqué en SQL après l'index geohash."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return Q(**{
+        f'{lat_field}__gte': lat - dlat, f'{lat_field}__lte': lat + dlat,
+        f'{lon_field}__gte': lon - dlon, f'{lon_field}__lte': lon + dlon,
+    })
+
+
+def haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def parse_coordinates(text):
+    """Coordonnées « lat, lon » saisies dans un champ texte, ou None."""
+    match = _COORDINATES.match(text or '')
+    if match:
+        lat, lon = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return lat, lon
+    return None
+
+
+def nearby(queryset, lat, lon, radius_km, limit=None):
+    """
+    Objets du queryset (champs latitude, longitude, geohash) à moins de
+    `radius_km`, triés par distance croissante. Chaque objet reçoit `distance_km`.
+    """
+    candidates = queryset.filter(prefix_q(cover(lat, lon, radius_km)), bounding_box_q(lat, lon, radius_km)).order_by()
+    results = []
+    for obj in candidates:
+        obj.distance_km = haversine_km((lat, lon), (obj.latitude, obj.longitude))
+        if obj.distance_km <= radius_km:
+            results.append(obj)
+    results.sort(key=lambda obj: obj.distance_km)
+    return results[:limit] if limit else results
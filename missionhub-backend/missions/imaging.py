@@ -0,0 +1,74 @@
+"""
+Analyse d'image pour le pré-filtrage des preuves.
+
+Ce module n'importe ni Django ni l'ORM : `analyze_image` est exécutée dans les
+processus du pool de missions/screening.py et ne reçoit que des octets.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageStat, UnidentifiedImageError
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+TAG_DATETIME = 306
+TAG_DATETIME_ORIGINAL = 36867
+
+
+def _dhash(image, size=8):
+    """Empreinte perceptuelle (difference hash) sur 64 bits, en hexadécimal."""
+    small = image.convert('L').resize((size + 1, size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f'{bits:016x}'
+
+
+def _gps_degrees(values, ref):
+    degrees, minutes, seconds = (float(value) for value in values)
+    result = degrees + minutes / 60 + seconds / 3600
+    return -result if ref in ('S', 'W') else result
+
+
+def _gps(exif):
+    gps = exif.get_ifd(GPS_IFD)
+    try:
+        return _gps_degrees(gps[2], gps.get(1)), _gps_degrees(gps[4], gps.get(3))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def analyze_image(data):
+    """
+    Retourne un dict décrivant l'image : sha256, dhash, dimensions, contraste
+    (écart-type des niveaux de gris), date de prise de vue EXIF (chaîne brute)
+    et coordonnées GPS. `error` est renseigné si l'image est illisible.
+    """
+    result = {
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'dhash': '',
+        'width': 0,
+        'height': 0,
+        'stddev': 0.0,
+        'taken_at': None,
+        'gps': None,
+        'error': None,
+    }
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            result['width'], result['height'] = image.size
+            exif = image.getexif()
+            result['taken_at'] = exif.get_ifd(EXIF_IFD).get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)
+            result['gps'] = _gps(exif)
+            image.draft('L', (256, 256))
+            gray = image.convert('L')
+            gray.thumbnail((256, 256))
+            result['stddev'] = ImageStat.Stat(gray).stddev[0]
+            result['dhash'] = _dhash(gray)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        result['error'] = str(e)
+    return result
@@ -0,0 +1,156 @@
+"""
+Classements par période (jour, semaine ISO, mois).
+
+Chaque gain de points écrit une ligne Score et incrémente, par un seul
+INSERT ... ON CONFLICT DO UPDATE, le total de l'utilisateur dans les trois
+périodes en cours (LeaderboardBucket). « Top de la semaine » et « mon rang ce
+mois-ci » se lisent alors sur l'index (période, début, points décroissants),
+sans parcourir l'historique des Score.
+
+Une période terminée est figée par la commande freeze_leaderboards : rangs
+calculés une fois (RANK() OVER), écrits dans LeaderboardSnapshot, puis les
+compteurs de la période sont supprimés. Les périodes se calculent dans le
+fuseau TIME_ZONE.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import DateField, F, Sum, Window
+from django.db.models.functions import Rank, Trunc
+from django.utils import timezone
+
+from .models import PERIOD_CHOICES, LeaderboardBucket, LeaderboardSnapshot, Score
+
+PERIODS = [period for period, _ in PERIOD_CHOICES]
+
+
+def period_start(period, day):
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(period, start):
+    """Premier jour de la période suivante."""
+    if period == 'day':
+        return start + timedelta(days=1)
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def _increment(user_id, points, day):
+    meta = LeaderboardBucket._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    rows, params = [], []
+    for period in PERIODS:
+        rows.append('(%s, %s, %s, %s)')
+        params += [period, period_start(period, day), user_id, points]
+    # Même syntaxe sur PostgreSQL et SQLite (>= 3.24)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (period, period_start, user_id, points) VALUES {', '.join(rows)} "
+            f"ON CONFLICT (period, period_start, user_id) DO UPDATE SET points = {table}.points + excluded.points",
+            params,
+        )
+
+
+def award(user_id, mission_id, points, at=None):
+    """Enregistre un gain et met à jour les classements en cours, dans la transaction de l'appelant."""
+    at = at or timezone.now()
+    # Sans point de sauvegarde dans une transaction ouverte : une erreur annule l'appelant
+    with transaction.atomic(savepoint=False):
+        Score.objects.create(user_id=user_id, mission_id=mission_id, points=points, validated_at=at)
+        _increment(user_id, points, timezone.localdate(at))
+
+
+def _frozen(period, start):
+    return LeaderboardSnapshot.objects.filter(period=period, period_start=start)
+
+
+def top(period, start=None, limit=10):
+    """Meilleurs totaux de la période (en cours par défaut) : liste de dicts rank, user_id, pseudo, points."""
+    start = start or period_start(period, timezone.localdate())
+    snapshot = _frozen(period, start)
+    if snapshot.exists():
+        return list(
+            snapshot.order_by('rank', 'user_id')
+            .values('rank', 'user_id', 'points', pseudo=F('user__profile__pseudo'))[:limit]
+        )
+    rows = list(
+        LeaderboardBucket.objects.filter(period=period, period_start=start)
+        .order_by('-points', 'user_id').values('user_id', 'points', pseudo=F('user__profile__pseudo'))[:limit]
+    )
+    # Rang « olympique » (ex aequo au même rang), comme RANK() dans les classements figés
+    for index, row in enumerate(rows):
+        row['rank'] = rows[index - 1]['rank'] if index and row['points'] == rows[index - 1]['points'] else index + 1
+    return rows
+
+
+def rank(user_id, period, start=None):
+    """(rang, points) de l'utilisateur sur la période, None s'il n'a rien gagné."""
+    start = start or period_start(period, timezone.localdate())
+    frozen = _frozen(period, start).filter(user_id=user_id).values_list('rank', 'points').first()
+    if frozen is not None or _frozen(period, start).exists():
+        return frozen
+    buckets = LeaderboardBucket.objects.filter(period=period, period_start=start)
+    points = buckets.filter(user_id=user_id).values_list('points', flat=True).first()
+    if points is None:
+        return None
+    return buckets.filter(points__gt=points).count() + 1, points
+
+
+def freeze(today=None):
+    """
+    Fige les périodes terminées depuis au moins un jour (une transaction ouverte
+    avant minuit a pu incrémenter la veille) ; retourne les (période, début) figés.
+    """
+    today = today or timezone.localdate()
+    frozen = []
+    finished = LeaderboardBucket.objects.order_by().values_list('period', 'period_start').distinct()
+    for period, start in sorted(finished):
+        if period_end(period, start) >= today:
+            continue
+        buckets = LeaderboardBucket.objects.filter(period=period, period_start=start)
+        with transaction.atomic():
+            ranked = buckets.annotate(
+                position=Window(Rank(), order_by=F('points').desc()),
+            ).values_list('user_id', 'points', 'position')
+            LeaderboardSnapshot.objects.bulk_create(
+                [LeaderboardSnapshot(period=period, period_start=start, user_id=user_id, rank=position, points=points)
+                 for user_id, points, position in ranked],
+                batch_size=1000, ignore_conflicts=True,
+            )
+            buckets.delete()
+        frozen.append((period, start))
+    return frozen
+
+
+def rebuild(since):
+    """
+    Recalcule depuis Score (un GROUP BY par période) les compteurs des périodes
+    non figées à partir du jour `since` : réparation après incident. Retourne
+    le nombre de compteurs écrits.
+    """
+    written = 0
+    with transaction.atomic():
+        for period in PERIODS:
+            start = period_start(period, since)
+            frozen = LeaderboardSnapshot.objects.filter(period=period, period_start__gte=start).values('period_start')
+            LeaderboardBucket.objects.filter(period=period, period_start__gte=start).delete()
+            totals = (
+                Score.objects.filter(validated_at__date__gte=start)
+                .annotate(bucket_start=Trunc('validated_at', period, output_field=DateField()))
+                .exclude(bucket_start__in=frozen)
+                .values('bucket_start', 'user_id').annotate(total=Sum('points')).order_by()
+            )
+            buckets = [
+                LeaderboardBucket(period=period, period_start=row['bucket_start'], user_id=row['user_id'], points=row['total'])
+                for row in totals
+            ]
+            LeaderboardBucket.objects.bulk_create(buckets, batch_size=1000)
+            written += len(buckets)
+    return written
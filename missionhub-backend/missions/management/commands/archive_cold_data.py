@@ -0,0 +1,19 @@
+"""
+Archive à froid les notifications lues et les sessions closes (missions/archive.py).
+À planifier quotidiennement (cron) : les tables chaudes gardent une taille bornée.
+"""
+from django.core.management.base import BaseCommand
+
+from missions import archive
+
+
+class Command(BaseCommand):
+    help = "Déplace les notifications lues et les sessions closes anciennes vers des segments compressés."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=archive.KINDS, action='append', help="Par défaut : tous les types.")
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or archive.KINDS:
+            segments, rows = archive.archive(kind)
+            self.stdout.write(f"{kind} : {rows} ligne(s) archivée(s) dans {segments} segment(s).")
@@ -0,0 +1,31 @@
+"""
+Recherche dans les archives à froid pour le support (missions/archive.py) :
+lignes archivées d'un utilisateur ou d'un objet, en JSON, et restauration
+éventuelle dans les tables.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from missions import archive
+
+
+class Command(BaseCommand):
+    help = "Affiche (et restaure avec --restore) des notifications ou sessions archivées."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=archive.KINDS)
+        parser.add_argument('--user', type=int, help="Id de l'utilisateur.")
+        parser.add_argument('--id', type=int, help="Id de la notification ou de la session.")
+        parser.add_argument('--restore', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['user'] is None and options['id'] is None:
+            raise CommandError("Précisez --user et/ou --id.")
+        rows = archive.lookup(options['kind'], user_id=options['user'], object_id=options['id'])
+        for row in rows:
+            self.stdout.write(json.dumps(row, ensure_ascii=False))
+        if options['restore']:
+            self.stdout.write(f"{archive.restore(options['kind'], rows)} ligne(s) restaurée(s).")
+        else:
+            self.stdout.write(f"{len(rows)} ligne(s) archivée(s).")
@@ -0,0 +1,39 @@
+"""
+Entretien du journal d'audit (missions/audit.py). À planifier une fois par
+mois au moins (cron) : crée les partitions mensuelles à venir avant qu'elles
+ne servent, puis retire celles qui dépassent AUDIT_RETENTION_MONTHS.
+`--detach-only` les laisse en tables autonomes, à archiver (pg_dump) puis
+supprimer. Sans PostgreSQL, les anciennes lignes sont supprimées par lots.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from missions import audit
+
+
+class Command(BaseCommand):
+    help = "Crée les partitions à venir du journal d'audit et retire les plus anciennes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.AUDIT_PARTITIONS_AHEAD)
+        parser.add_argument('--retention-months', type=int, default=settings.AUDIT_RETENTION_MONTHS,
+                            help="0 : ne rien retirer.")
+        parser.add_argument('--detach-only', action='store_true')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        retention = options['retention_months']
+        before = audit.month_start(now, -retention) if retention > 0 else None
+
+        if not audit.is_partitioned():
+            if before is not None:
+                self.stdout.write(f"{audit.prune_rows(before)} événement(s) antérieur(s) au {before:%Y-%m-%d} supprimé(s).")
+            return
+
+        for name in audit.ensure_partitions(now, options['ahead']):
+            self.stdout.write(f"Partition créée : {name}")
+        if before is not None:
+            verb = 'détachée' if options['detach_only'] else 'supprimée'
+            for name in audit.drop_partitions(before, detach_only=options['detach_only']):
+                self.stdout.write(f"Partition {verb} : {name}")
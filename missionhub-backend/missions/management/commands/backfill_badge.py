@@ -0,0 +1,33 @@
+"""
+Attribution rétroactive d'un badge (missions/badges.py) à tous les
+utilisateurs qui remplissent déjà sa condition, par lots de profils.
+Interrompue, la commande se relance avec `--after <dernier profil affiché>` ;
+la relancer depuis le début est sans risque (un badge n'est jamais attribué deux fois).
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from missions import badges
+from missions.models import Badge
+
+
+class Command(BaseCommand):
+    help = "Attribue un badge à tous les utilisateurs déjà éligibles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('badge', type=int, help="Id du badge.")
+        parser.add_argument('--after', type=int, default=0, help="Reprendre après ce profil.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            badge = Badge.objects.get(pk=options['badge'])
+        except Badge.DoesNotExist:
+            raise CommandError(f"Badge #{options['badge']} introuvable.")
+        if badge.rule not in badges.RULES:
+            raise CommandError(f"Le badge '{badge.name}' n'a pas de règle d'attribution.")
+
+        total = 0
+        for last_profile, awarded in badges.backfill(badge, after=options['after'], chunk_size=options['chunk_size']):
+            total += awarded
+            self.stdout.write(f"Profils jusqu'à #{last_profile} : {awarded} badge(s) attribué(s).")
+        self.stdout.write(f"'{badge.name}' : {total} badge(s) attribué(s) au total.")
@@ -0,0 +1,66 @@
+"""
+Mesure le coût de sérialisation d'une liste de missions : sérialiseur DRF,
+rendu JSON (stock puis orjson) et compression. Aucune donnée n'est écrite en base.
+"""
+import gzip
+import io
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from missions.middleware import brotli
+from missions.models import Mission
+from missions.renderers import ORJSONParser, ORJSONRenderer
+from missions.serializers import MissionSerializer
+
+
+def _timed(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+class Command(BaseCommand):
+    help = "Compare JSONRenderer et ORJSONRenderer sur une liste de missions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        missions = [
+            Mission(
+                id=i, title=f"Mission {i}", description="Ramasser les déchets du parc " * 4,
+                category='environnement', difficulty='facile', reward=Decimal('1.2500000') * i,
+                duration_minutes=30, created_at=now - timedelta(minutes=i), is_active=True,
+                latitude=48.85 + i / 1e4, longitude=2.35, capacity=None, participant_count=i % 7,
+            )
+            for i in range(options['rows'])
+        ]
+        repeat = options['repeat']
+
+        elapsed, data = _timed(lambda: MissionSerializer(missions, many=True).data, repeat)
+        self.stdout.write(f"Sérialiseur DRF ({len(missions)} lignes) : {elapsed:.1f} ms")
+
+        stock_ms, stock = _timed(lambda: JSONRenderer().render(data), repeat)
+        fast_ms, fast = _timed(lambda: ORJSONRenderer().render(data), repeat)
+        self.stdout.write(f"JSONRenderer   : {stock_ms:.2f} ms, {len(stock)} octets")
+        self.stdout.write(f"ORJSONRenderer : {fast_ms:.2f} ms, {len(fast)} octets (x{stock_ms / fast_ms:.1f})")
+
+        parse_ms, _ = _timed(lambda: ORJSONParser().parse(io.BytesIO(fast)), repeat)
+        self.stdout.write(f"ORJSONParser   : {parse_ms:.2f} ms")
+
+        gzip_ms, compressed = _timed(lambda: gzip.compress(fast, compresslevel=6, mtime=0), repeat)
+        self.stdout.write(f"gzip           : {gzip_ms:.2f} ms, {len(compressed)} octets")
+        if brotli is not None:
+            br_ms, compressed = _timed(lambda: brotli.compress(fast, quality=4), repeat)
+            self.stdout.write(f"brotli         : {br_ms:.2f} ms, {len(compressed)} octets")
+
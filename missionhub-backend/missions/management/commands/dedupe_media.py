@@ -0,0 +1,49 @@
+"""
+Range les médias existants dans le stockage adressé par contenu : chaque
+fichier est réenregistré sous son empreinte (doublons fusionnés), la ligne est
+mise à jour, puis l'ancien fichier est supprimé.
+"""
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from missions.models import Product, Proof
+
+HASHED = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class Command(BaseCommand):
+    help = "Migre les photos de preuves et images de produits vers le stockage dédupliqué."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        for model, field_name in ((Proof, 'photo'), (Product, 'image')):
+            moved = missing = 0
+            last_id = 0
+            while True:
+                rows = list(
+                    model.objects.filter(id__gt=last_id).exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                    .order_by('id').values_list('id', field_name)[:options['batch_size']]
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                storage = model._meta.get_field(field_name).storage
+                for pk, name in rows:
+                    if HASHED.search(name):
+                        continue
+                    try:
+                        with storage.open(name, 'rb') as content:
+                            with transaction.atomic():
+                                new_name = storage.save(name, content)
+                                # update() : pas de signaux, l'ancien nom n'a pas de référence à rendre
+                                model.objects.filter(pk=pk).update(**{field_name: new_name})
+                    except FileNotFoundError:
+                        missing += 1
+                        continue
+                    storage.delete(name)
+                    moved += 1
+            self.stdout.write(f"{model.__name__}.{field_name} : {moved} fichier(s) migré(s), {missing} introuvable(s).")
@@ -0,0 +1,23 @@
+"""
+Fige les classements des périodes terminées (missions/leaderboard.py) et
+libère leurs compteurs. À planifier quotidiennement (cron). `--rebuild-since`
+recalcule d'abord depuis Score les compteurs des périodes en cours.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from missions import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Fige les classements jour / semaine / mois terminés."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-since', type=date.fromisoformat, help="AAAA-MM-JJ")
+
+    def handle(self, *args, **options):
+        if options['rebuild_since']:
+            self.stdout.write(f"{leaderboard.rebuild(options['rebuild_since'])} compteur(s) recalculé(s).")
+        for period, start in leaderboard.freeze():
+            self.stdout.write(f"Classement figé : {period} du {start:%Y-%m-%d}")
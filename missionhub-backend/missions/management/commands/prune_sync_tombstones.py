@@ -0,0 +1,15 @@
+"""
+Purge les traces de suppression (SyncTombstone) plus anciennes que
+SYNC_TOMBSTONE_DAYS. Un client dont le jeton est plus ancien reçoit de toute
+façon un instantané complet. À planifier quotidiennement (cron).
+"""
+from django.core.management.base import BaseCommand
+
+from missions.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = "Supprime les traces de suppression expirées de la synchronisation mobile."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{prune_tombstones()} trace(s) supprimée(s).")
@@ -0,0 +1,30 @@
+"""
+Resynchronise les compteurs de participants des missions depuis UserSession.
+
+À planifier régulièrement (cron) : les missions à compteurs répartis ne mettent
+à jour `participant_count` qu'ici.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from missions.models import Mission
+from missions.quotas import reconcile, reconcile_all
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de participants des missions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mission', type=int, help="Ne réconcilie que cette mission.")
+
+    def handle(self, *args, **options):
+        if options['mission']:
+            try:
+                mission = Mission.objects.get(pk=options['mission'])
+            except Mission.DoesNotExist:
+                raise CommandError(f"Mission #{options['mission']} introuvable.")
+            results = {mission.pk: reconcile(mission)}
+        else:
+            results = reconcile_all()
+        for mission_id, total in results.items():
+            self.stdout.write(f"Mission #{mission_id} : {total} participant(s).")
+        self.stdout.write(f"{len(results)} mission(s) réconciliée(s).")
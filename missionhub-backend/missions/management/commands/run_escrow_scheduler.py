@@ -0,0 +1,113 @@
+"""
+Planificateur du séquestre.
+
+- Libère automatiquement les fonds des achats expédiés depuis plus de
+  `ESCROW_AUTO_RELEASE_DAYS` jours (même traitement que force_complete_purchase).
+- Annule les achats restés en `awaiting_payment` plus de
+  `UNPAID_PURCHASE_TIMEOUT_HOURS` heures. Un achat réservé par le webhook Pi
+  (`processing`) n'est jamais annulé ici.
+
+Les achats sont parcourus par lots sur l'index (status, updated_at). Chaque
+achat change d'état par un UPDATE conditionnel et les annulations verrouillent
+avec SKIP LOCKED : plusieurs instances peuvent tourner en parallèle, une ligne
+déjà traitée ailleurs est simplement sautée.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from missions.models import Notification, Purchase
+from missions.transitions import bulk_transition, transition_purchase
+from missions.views import release_funds_to_seller
+
+
+def _candidates(status, cutoff, batch_size, after=None):
+    """Lot suivant d'achats `status` plus anciens que `cutoff`, par (updated_at, id) croissants."""
+    queryset = Purchase.objects.filter(status=status, updated_at__lt=cutoff)
+    if after is not None:
+        updated_at, pk = after
+        queryset = queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+    return list(queryset.order_by('updated_at', 'id').values_list('id', 'updated_at')[:batch_size])
+
+
+def auto_release(cutoff, batch_size):
+    """
+    Finalise les achats expédiés avant `cutoff` et paie les vendeurs.
+
+    La transition shipped -> completed est validée avant l'appel Pi : quoi qu'il
+    arrive ensuite (exception, commit en échec), l'achat n'est plus `shipped` et
+    une nouvelle passe ne peut pas payer le vendeur une seconde fois. Si le
+    paiement échoue, l'achat passe en litige pour un traitement manuel.
+    Retourne (finalisés, passés en litige).
+    """
+    released, disputed = 0, 0
+    after = None
+    while True:
+        batch = _candidates('shipped', cutoff, batch_size, after)
+        if not batch:
+            return released, disputed
+        after = (batch[-1][1], batch[-1][0])
+        for purchase_id, _ in batch:
+            if not transition_purchase(purchase_id, 'shipped', 'completed', reason='auto_release'):
+                continue
+            purchase = Purchase.objects.select_related('product', 'seller').get(id=purchase_id)
+            try:
+                success, message = release_funds_to_seller(purchase)
+            except Exception as e:
+                success, message = False, str(e)
+            if not success:
+                if transition_purchase(purchase, 'completed', 'disputed', reason=f'payout_failed: {message}'):
+                    disputed += 1
+                continue
+            released += 1
+            Notification.objects.bulk_create([
+                Notification(user_id=purchase.seller_id, message=f"Paiement reçu pour la vente de '{purchase.product.name}' (libération automatique)."),
+                Notification(user_id=purchase.buyer_id, message=f"Votre achat de '{purchase.product.name}' a été finalisé automatiquement."),
+            ])
+
+
+def cancel_unpaid(cutoff, batch_size):
+    """Annule les achats jamais payés créés avant `cutoff`. Un UPDATE par lot ; retourne le nombre annulé."""
+    cancelled = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Purchase.objects.select_for_update(skip_locked=True)
+                .filter(status='awaiting_payment', updated_at__lt=cutoff)
+                .order_by('updated_at', 'id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return cancelled
+            ids = bulk_transition(Purchase.objects.filter(id__in=ids), 'awaiting_payment', 'cancelled', reason='unpaid')
+        cancelled += len(ids)
+        Notification.objects.bulk_create([
+            Notification(user_id=buyer_id, message=f"Votre commande de '{name}' a été annulée : paiement non reçu.")
+            for buyer_id, name in Purchase.objects.filter(id__in=ids).values_list('buyer_id', 'product__name')
+        ])
+
+
+class Command(BaseCommand):
+    help = "Libère les séquestres expirés et annule les achats non payés."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--release-after-days', type=float, default=settings.ESCROW_AUTO_RELEASE_DAYS)
+        parser.add_argument('--cancel-after-hours', type=float, default=settings.UNPAID_PURCHASE_TIMEOUT_HOURS)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Tourne en continu au lieu d'une seule passe.")
+        parser.add_argument('--interval', type=int, default=300, help="Secondes entre deux passes avec --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            now = timezone.now()
+            released, disputed = auto_release(now - timedelta(days=options['release_after_days']), options['batch_size'])
+            cancelled = cancel_unpaid(now - timedelta(hours=options['cancel_after_hours']), options['batch_size'])
+            self.stdout.write(f"{released} achat(s) finalisé(s), {disputed} en litige, {cancelled} annulé(s).")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
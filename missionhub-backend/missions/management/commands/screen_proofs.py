@@ -0,0 +1,43 @@
+"""
+Pré-filtre les preuves en attente qui n'ont pas encore de score de risque
+(soumises pendant un redémarrage, ou avant la mise en place du pré-filtrage).
+"""
+from django.core.management.base import BaseCommand
+
+from missions.imaging import analyze_image
+from missions.models import Proof
+from missions.screening import apply_screening, get_executor, read_photo
+
+
+class Command(BaseCommand):
+    help = "Calcule le score de risque des preuves en attente non analysées."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Réanalyse aussi les preuves déjà notées.")
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        queryset = Proof.objects.filter(status='pending')
+        if not options['all']:
+            queryset = queryset.filter(screened_at__isnull=True)
+        executor = get_executor()
+        screened = rejected = 0
+        last_id = 0
+        while True:
+            proofs = list(queryset.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+            if not proofs:
+                break
+            last_id = proofs[-1].id
+            # Les images d'un lot sont décodées en parallèle, les résultats appliqués ici
+            photos = []
+            for proof in proofs:
+                try:
+                    photos.append((proof.id, read_photo(proof)))
+                except OSError as e:
+                    self.stderr.write(f"Preuve #{proof.id} : photo introuvable ({e}).")
+            for (proof_id, _), analysis in zip(photos, executor.map(analyze_image, [data for _, data in photos])):
+                score = apply_screening(proof_id, analysis)
+                if score is not None:
+                    screened += 1
+                    rejected += Proof.objects.filter(pk=proof_id, status='rejected').exists()
+        self.stdout.write(f"{screened} preuve(s) analysée(s), {rejected} rejetée(s) automatiquement.")
@@ -0,0 +1,151 @@
+"""
+Service des médias en production.
+
+Les images de produits sont publiques ; une photo de preuve n'est visible que
+par son auteur et l'équipe. Une fois l'accès vérifié, le transfert est confié
+au serveur frontal si possible (`X-Accel-Redirect` pour nginx, `X-Sendfile`
+pour Apache/lighttpd). À défaut, FileResponse : le serveur WSGI envoie le
+fichier par sendfile() (sans copie), y compris une requête Range jusqu'à la
+fin du fichier.
+
+Les fichiers adressés par contenu (missions/storage.py) ne changent jamais :
+ETag = empreinte, cache d'un an `immutable`.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Proof
+
+PUBLIC_PREFIXES = ('products/',)
+PRIVATE_PREFIXES = ('proofs/',)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MUTABLE_MAX_AGE = 3600
+
+_HASHED = re.compile(r'/([0-9a-f]{64})(\.\w+)?$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def clean_name(path):
+    """Chemin demandé normalisé ; Http404 s'il sort de MEDIA_ROOT."""
+    name = os.path.normpath(path).replace(os.sep, '/')
+    if name.startswith(('../', '/')) or name in ('.', '..'):
+        raise Http404
+    return name
+
+
+def can_access(user, name):
+    if name.startswith(PUBLIC_PREFIXES):
+        return True
+    if not name.startswith(PRIVATE_PREFIXES) or not user.is_authenticated:
+        return False
+    return user.is_staff or Proof.objects.filter(photo=name, session__user=user).exists()
+
+
+def parse_range(header, size):
+    """(début, fin incluse) d'une plage unique, None si absente ou multiple, ValueError si insatisfiable."""
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N : les N derniers octets
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def _bounded(handle, length, chunk=64 * 1024):
+    with handle:
+        while length > 0:
+            data = handle.read(min(chunk, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _validators(name, stat):
+    hashed = _HASHED.search(name)
+    etag = f'"{hashed.group(1)}"' if hashed else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    return etag, int(stat.st_mtime), hashed is not None
+
+
+def media_response(request, name):
+    """Réponse pour le média `name` (normalisé par clean_name), accès déjà vérifié."""
+    try:
+        path = default_storage.path(name)
+        stat = os.stat(path)
+    except (OSError, NotImplementedError):
+        raise Http404
+
+    etag, last_modified, immutable = _validators(name, stat)
+    visibility = 'public' if name.startswith(PUBLIC_PREFIXES) else 'private'
+    max_age = IMMUTABLE_MAX_AGE if immutable else MUTABLE_MAX_AGE
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': f"{visibility}, max-age={max_age}" + (', immutable' if immutable else ''),
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '')
+    if accel_prefix or getattr(settings, 'MEDIA_SENDFILE', False):
+        # Le frontal gère lui-même Range et l'envoi du fichier
+        response = HttpResponse(content_type=content_type)
+        if accel_prefix:
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + name
+        else:
+            response['X-Sendfile'] = path
+    else:
+        response = _file_response(request, path, stat.st_size, etag, last_modified, content_type)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def _file_response(request, path, size, etag, last_modified, content_type):
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None or if_range in (etag, http_date(last_modified)):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    handle = open(path, 'rb')
+    if byte_range is None:
+        return FileResponse(handle, content_type=content_type)
+
+    start, end = byte_range
+    handle.seek(start)
+    length = end - start + 1
+    if end == size - 1:
+        # Jusqu'à la fin : le fichier positionné reste éligible à sendfile()
+        response = FileResponse(handle, content_type=content_type, status=206)
+    else:
+        response = StreamingHttpResponse(_bounded(handle, length), content_type=content_type, status=206)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,218 @@
+import gzip
+import re
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import routers
+from .models import UserProfile
+
+try:
+    import brotli
+except ImportError:  # Brotli est facultatif : gzip seul
+    brotli = None
+
+# Profils déjà chargés pendant la requête courante, indexés par user_id.
+# Partagé entre vues, templates et gestionnaires de signaux.
+_request_profiles = ContextVar('request_profiles', default=None)
+
+
+def get_profile(user):
+    """
+    Retourne le UserProfile de `user` en évitant toute requête redondante.
+
+    Ordre de résolution : cache de l'instance (select_related ou accès précédent),
+    puis profils déjà chargés pendant la requête, puis base de données.
+    """
+    if User.profile.is_cached(user):
+        profile = user.profile
+    else:
+        profiles = _request_profiles.get()
+        profile = profiles.get(user.pk) if profiles is not None else None
+        if profile is None:
+            profile = UserProfile.objects.get(user_id=user.pk)
+        user.profile = profile
+
+    profiles = _request_profiles.get()
+    if profiles is not None:
+        profiles.setdefault(user.pk, profile)
+    return profile
+
+
+class ProfilePreloadMiddleware:
+    """
+    Ouvre le cache de profils de la requête, lu par get_profile().
+
+    Combiné à ProfileModelBackend, l'utilisateur et son profil sont chargés
+    en une seule requête jointe.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _prepare(self, request):
+        return _request_profiles.set({})
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self._prepare(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request_profiles.reset(token)
+
+    async def __acall__(self, request):
+        token = self._prepare(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request_profiles.reset(token)
+
+
+def request_identity(request):
+    """
+    Identifie l'auteur de la requête sans requête SQL : id de session,
+    sinon claim du jeton JWT. Retourne None pour un visiteur anonyme.
+    """
+    session = getattr(request, 'session', None)
+    if session is not None:
+        user_id = session.get(SESSION_KEY)
+        if user_id is not None:
+            return str(user_id)
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    return str(user_id) if user_id is not None else None
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Garantit la lecture de ses propres écritures avec les réplicas en lecture.
+
+    Les méthodes non sûres (POST, PUT...) lisent sur la primaire. Après une
+    requête ayant écrit, l'utilisateur reste épinglé à la primaire pendant
+    `DATABASE_REPLICA_PIN_SECONDS` secondes (clé dans le cache partagé).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _cache_key(identity):
+        return f'db-pin:{identity}'
+
+    def _begin(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            return None, None
+        use_primary = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        if not use_primary:
+            identity = request_identity(request)
+            use_primary = identity is not None and cache.get(self._cache_key(identity)) is not None
+        return routers.begin_request(use_primary)
+
+    def _end(self, request, state, token):
+        if token is None:
+            return
+        routers.end_request(token)
+        if state.wrote:
+            # L'identité est relue après la vue : une connexion vient peut-être d'ouvrir la session
+            identity = request_identity(request)
+            if identity is not None:
+                cache.set(self._cache_key(identity), 1, getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self._begin(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self._end(request, state, token)
+
+    async def __acall__(self, request):
+        state, token = self._begin(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self._end(request, state, token)
+
+
+_ACCEPT_ENCODING = re.compile(r'(?:^|,)\s*(br|gzip)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*(?=,|$)')
+
+
+def negotiate_encoding(accept_encoding):
+    """Encodage le mieux noté dans Accept-Encoding ('br' à égalité), ou None."""
+    offered = {}
+    for name, quality in _ACCEPT_ENCODING.findall(accept_encoding.lower()):
+        if name == 'br' and brotli is None:
+            continue
+        try:
+            offered[name] = float(quality) if quality else 1.0
+        except ValueError:
+            continue
+    best = max(('br', 'gzip'), key=lambda name: offered.get(name, 0))
+    return best if offered.get(best, 0) > 0 else None
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresse (Brotli ou gzip, selon Accept-Encoding) les réponses de l'API.
+
+    Seuls les types COMPRESSION_CONTENT_TYPES au-delà de COMPRESSION_MIN_SIZE
+    octets sont compressés : les pages HTML (jeton CSRF, BREACH), les fichiers
+    statiques (déjà compressés par WhiteNoise) et les flux SSE sont laissés tels quels.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in getattr(settings, 'COMPRESSION_CONTENT_TYPES', ('application/json',)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=4)
+        else:
+            compressed = gzip.compress(response.content, compresslevel=6, mtime=0)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            # ETag faible : la représentation compressée n'est pas identique octet pour octet
+            etag = response['ETag']
+            if not etag.startswith('W/'):
+                response['ETag'] = 'W/' + etag
+        return response
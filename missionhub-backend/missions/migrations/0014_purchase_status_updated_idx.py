@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0013_product_category'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['status', 'updated_at'], name='purchase_status_updated_idx'),
+        ),
+    ]
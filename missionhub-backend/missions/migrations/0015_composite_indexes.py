@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0014_purchase_status_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['-created_at'], name='product_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proof',
+            index=models.Index(fields=['status', 'submitted_at'], name='proof_status_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proof',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['submitted_at'], name='proof_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['status', 'created_at'], name='purchase_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['buyer', '-created_at'], name='purchase_buyer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['seller', '-created_at'], name='purchase_seller_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['user', 'mission'], name='usersession_user_mission_idx'),
+        ),
+    ]
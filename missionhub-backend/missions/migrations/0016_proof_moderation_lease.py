@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0015_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proof',
+            name='claim_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_proofs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='reviewed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reviewed_proofs', to=settings.AUTH_USER_MODEL, verbose_name='Modérateur'),
+        ),
+        migrations.AddIndex(
+            model_name='proof',
+            index=models.Index(fields=['reviewed_at', 'reviewed_by'], name='proof_reviewed_idx'),
+        ),
+    ]
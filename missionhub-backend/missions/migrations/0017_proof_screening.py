@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0016_proof_moderation_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proof',
+            name='exif_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='exif_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='exif_taken_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='photo_dhash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='photo_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='risk_flags',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='risk_score',
+            field=models.FloatField(blank=True, null=True, verbose_name='Score de risque'),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='screened_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+from missions import geo
+
+
+def geocode_proofs(apps, schema_editor):
+    """Renseigne les coordonnées des preuves dont le lieu a été saisi sous la forme « lat, lon »."""
+    Proof = apps.get_model('missions', 'Proof')
+    batch = []
+    for proof in Proof.objects.filter(location__contains=',').only('id', 'location').iterator(chunk_size=2000):
+        coordinates = geo.parse_coordinates(proof.location)
+        if coordinates:
+            proof.latitude, proof.longitude = coordinates
+            proof.geohash = geo.encode(*coordinates)
+            batch.append(proof)
+        if len(batch) >= 1000:
+            Proof.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+            batch = []
+    Proof.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0017_proof_screening'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mission',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='radius_km',
+            field=models.FloatField(default=1.0, help_text='Distance maximale entre la preuve et le lieu de la mission'),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proof',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(geocode_proofs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_participants(apps, schema_editor):
+    Mission = apps.get_model('missions', 'Mission')
+    UserSession = apps.get_model('missions', 'UserSession')
+    sessions = UserSession.objects.filter(mission=OuterRef('pk')).order_by().values('mission').annotate(n=Count('pk')).values('n')
+    Mission.objects.update(participant_count=Coalesce(Subquery(sessions), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0018_geolocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mission',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Nombre maximal de participants (vide = illimité)', null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Compteurs répartis sur N lignes pour les missions très demandées'),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='MissionCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('capacity', models.PositiveIntegerField(blank=True, null=True)),
+                ('mission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shard_set', to='missions.mission')),
+            ],
+            options={
+                'unique_together': {('mission', 'shard')},
+            },
+        ),
+        migrations.RunPython(count_participants, migrations.RunPython.noop),
+    ]
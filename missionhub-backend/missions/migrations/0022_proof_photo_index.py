@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0021_media_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='proof',
+            name='photo',
+            field=models.ImageField(db_index=True, upload_to='proofs/'),
+        ),
+    ]
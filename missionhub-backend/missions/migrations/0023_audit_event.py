@@ -0,0 +1,105 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:18
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# Sur PostgreSQL : table partitionnée par mois. La clé primaire d'une table
+# partitionnée doit contenir la clé de partition, d'où (id, created_at) ; Django
+# continue d'adresser les lignes par `id` seul.
+PARTITIONED_TABLE = [
+    """
+    CREATE TABLE missions_auditevent (
+        id bigserial NOT NULL,
+        entity_type varchar(20) NOT NULL,
+        entity_id bigint NOT NULL,
+        action varchar(30) NOT NULL,
+        source varchar(20) NULL,
+        target varchar(20) NULL,
+        actor_id integer NULL,
+        data jsonb NOT NULL,
+        created_at timestamp with time zone NOT NULL,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at)
+    """,
+    "CREATE TABLE missions_auditevent_default PARTITION OF missions_auditevent DEFAULT",
+    "CREATE INDEX auditevent_entity_idx ON missions_auditevent (entity_type, entity_id, created_at)",
+    # Ajout seul : UPDATE et DELETE refusés ; détacher ou supprimer une partition reste possible
+    """
+    CREATE FUNCTION missions_auditevent_append_only() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'missions_auditevent est en ajout seul';
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER auditevent_append_only BEFORE UPDATE OR DELETE ON missions_auditevent
+        FOR EACH ROW EXECUTE FUNCTION missions_auditevent_append_only()
+    """,
+]
+
+
+def create_table(apps, schema_editor):
+    AuditEvent = apps.get_model('missions', 'AuditEvent')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(AuditEvent)
+        return
+    for statement in PARTITIONED_TABLE:
+        schema_editor.execute(statement)
+    # Mois courant et suivant ; la commande audit_partitions prend le relais
+    now = timezone.now()
+    for offset in range(2):
+        index = now.year * 12 + now.month - 1 + offset
+        start = datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+        end = datetime((index + 1) // 12, (index + 1) % 12 + 1, 1, tzinfo=dt_timezone.utc)
+        schema_editor.execute(
+            f"CREATE TABLE missions_auditevent_p{start:%Y%m} PARTITION OF missions_auditevent "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+
+def drop_table(apps, schema_editor):
+    AuditEvent = apps.get_model('missions', 'AuditEvent')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.delete_model(AuditEvent)
+        return
+    schema_editor.execute("DROP TABLE missions_auditevent CASCADE")
+    schema_editor.execute("DROP FUNCTION missions_auditevent_append_only()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0022_proof_photo_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='AuditEvent',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('entity_type', models.CharField(max_length=20)),
+                        ('entity_id', models.BigIntegerField()),
+                        ('action', models.CharField(max_length=30)),
+                        ('source', models.CharField(blank=True, max_length=20, null=True)),
+                        ('target', models.CharField(blank=True, max_length=20, null=True)),
+                        ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                        ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('actor', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'indexes': [models.Index(fields=['entity_type', 'entity_id', 'created_at'], name='auditevent_entity_idx')],
+                    },
+                ),
+            ],
+        ),
+        # La table elle-même, une fois le modèle connu de l'état des migrations
+        migrations.RunPython(create_table, drop_table),
+    ]
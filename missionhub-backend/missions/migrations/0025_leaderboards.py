@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0024_cold_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Jour'), ('week', 'Semaine'), ('month', 'Mois')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('points', models.DecimalField(decimal_places=7, default=0, max_digits=19)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Jour'), ('week', 'Semaine'), ('month', 'Mois')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('rank', models.PositiveIntegerField()),
+                ('points', models.DecimalField(decimal_places=7, max_digits=19)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='score',
+            name='points',
+            field=models.DecimalField(decimal_places=7, max_digits=19),
+        ),
+        migrations.AlterField(
+            model_name='score',
+            name='validated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['validated_at'], name='score_validated_idx'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardbucket',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='leaderboardsnapshot',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardbucket',
+            index=models.Index(fields=['period', 'period_start', '-points'], name='leaderboardbucket_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardbucket',
+            constraint=models.UniqueConstraint(fields=('period', 'period_start', 'user'), name='leaderboardbucket_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardsnapshot',
+            index=models.Index(fields=['period', 'period_start', 'rank'], name='leaderboardsnapshot_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardsnapshot',
+            constraint=models.UniqueConstraint(fields=('period', 'period_start', 'user'), name='leaderboardsnapshot_unique'),
+        ),
+    ]
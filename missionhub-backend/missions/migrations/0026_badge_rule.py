@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:27
+
+from django.db import migrations, models
+
+
+# Badges jusqu'ici reconnus par leur nom dans check_and_award_badges
+RULES_BY_NAME = {
+    'Première Preuve Validée': 'first_validated_proof',
+    'Explorateur': 'explorer',
+}
+
+
+def assign_rules(apps, schema_editor):
+    Badge = apps.get_model('missions', 'Badge')
+    for name, rule in RULES_BY_NAME.items():
+        Badge.objects.filter(name=name).update(rule=rule)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0025_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='badge',
+            name='rule',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.RunPython(assign_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0026_badge_rule'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchase',
+            name='status',
+            field=models.CharField(choices=[('awaiting_payment', 'En attente de paiement'), ('processing', 'Paiement en cours'), ('in_escrow', 'Paiement sécurisé (en attente de livraison)'), ('shipped', 'Expédié'), ('completed', 'Terminé'), ('disputed', 'En litige'), ('cancelled', 'Annulé')], default='awaiting_payment', max_length=20),
+        ),
+    ]
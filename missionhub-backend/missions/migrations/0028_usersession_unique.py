@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_sessions(apps, schema_editor):
+    """Regroupe les sessions en double sur la plus ancienne, puis recompte les participants."""
+    Mission = apps.get_model('missions', 'Mission')
+    UserSession = apps.get_model('missions', 'UserSession')
+    Proof = apps.get_model('missions', 'Proof')
+    duplicated = (
+        UserSession.objects.values('user', 'mission').annotate(n=Count('pk'), keep=Min('pk')).filter(n__gt=1)
+    )
+    for row in duplicated.iterator():
+        extra = UserSession.objects.filter(user=row['user'], mission=row['mission']).exclude(pk=row['keep'])
+        if extra.filter(completed=True).exists():
+            UserSession.objects.filter(pk=row['keep']).update(completed=True)
+        Proof.objects.filter(session__in=extra).update(session_id=row['keep'])
+        extra.delete()
+    # Les missions réparties (counter_shards > 1) : manage.py reconcile_mission_counters
+    sessions = UserSession.objects.filter(mission=OuterRef('pk')).order_by().values('mission').annotate(n=Count('pk')).values('n')
+    Mission.objects.update(participant_count=Coalesce(Subquery(sessions), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missions', '0027_purchase_processing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usersession',
+            constraint=models.UniqueConstraint(fields=('user', 'mission'), name='usersession_user_mission_uniq'),
+        ),
+        migrations.RemoveIndex(
+            model_name='usersession',
+            name='usersession_user_mission_idx',
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Q
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django import forms
 
 
@@ -27,6 +30,9 @@ class Badge(models.Model):
     icon = models.CharField(max_length=255, default='badge-default')
     condition = models.CharField(max_length=255, help_text="Description de la condition d'obtention")
     reward_value = models.DecimalField(max_digits=10, decimal_places=7, default=0.0)
+    # Règle d'attribution (missions/badges.py) ; vide : badge attribué à la main
+    rule = models.CharField(max_length=50, blank=True)
+
     def __str__(self):
         return self.name
 
@@ -38,6 +44,10 @@ class UserBadge(models.Model):
     class Meta:
         unique_together = ('user', 'badge')
         ordering = ['acquired_at']
+        indexes = [
+            # Synchronisation incrémentale (missions/sync.py) : un badge n'est jamais modifié
+            models.Index(fields=['user', 'acquired_at'], name='userbadge_user_acquired_idx'),
+        ]
 
 
 class Mission(models.Model):
@@ -65,12 +75,36 @@ class Mission(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     duration_minutes = models.IntegerField(default=30, help_text="Durée estimée en minutes")
+    # Localisation optionnelle ; le geohash est calculé à l'enregistrement (voir missions/geo.py)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    radius_km = models.FloatField(default=1.0, help_text="Distance maximale entre la preuve et le lieu de la mission")
+    # Quotas de participants (voir missions/quotas.py)
+    capacity = models.PositiveIntegerField(null=True, blank=True, help_text="Nombre maximal de participants (vide = illimité)")
+    participant_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_shards = models.PositiveSmallIntegerField(default=1, help_text="Compteurs répartis sur N lignes pour les missions très demandées")
 
     def __str__(self):
         return f"{self.title} ({self.get_difficulty_display()})"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Synchronisation incrémentale (missions/sync.py)
+            models.Index(fields=['updated_at'], name='mission_updated_idx'),
+        ]
+
+
+class MissionCounterShard(models.Model):
+    """Fraction du compteur de participants d'une mission (et de sa capacité)."""
+    mission = models.ForeignKey(Mission, on_delete=models.CASCADE, related_name='counter_shard_set')
+    shard = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('mission', 'shard')
 
 
 class UserMission(models.Model):
@@ -85,10 +119,14 @@ class UserMission(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='en_cours')
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('user', 'mission')
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='usermission_user_updated_idx'),
+        ]
 
 class UserSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -99,6 +137,12 @@ class UserSession(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.mission.title}"
 
+    class Meta:
+        constraints = [
+            # Deux envois simultanés de choose_mission ne créent qu'une session (et une place)
+            models.UniqueConstraint(fields=['user', 'mission'], name='usersession_user_mission_uniq'),
+        ]
+
 class Proof(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -106,31 +150,124 @@ class Proof(models.Model):
         ('rejected', 'Rejected'),
     ]
     session = models.ForeignKey(UserSession, on_delete=models.CASCADE)
-    photo = models.ImageField(upload_to='proofs/')
+    photo = models.ImageField(upload_to='proofs/', db_index=True)  # contrôle d'accès (missions/media.py)
     location = models.CharField(max_length=255)
     submitted_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     rejection_reason = models.TextField(blank=True, null=True, verbose_name="Raison du rejet")
     reviewed_at = models.DateTimeField(null=True, blank=True)
+    reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reviewed_proofs', verbose_name="Modérateur")
+    # Bail de la file de modération (voir missions/moderation.py)
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_proofs')
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+    # Pré-filtrage automatique (voir missions/screening.py) ; risk_score nul = pas encore analysée
+    risk_score = models.FloatField(null=True, blank=True, verbose_name="Score de risque")
+    risk_flags = models.JSONField(default=list, blank=True)
+    photo_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    photo_dhash = models.CharField(max_length=16, blank=True, db_index=True)
+    exif_taken_at = models.DateTimeField(null=True, blank=True)
+    exif_latitude = models.FloatField(null=True, blank=True)
+    exif_longitude = models.FloatField(null=True, blank=True)
+    screened_at = models.DateTimeField(null=True, blank=True)
+    # Coordonnées saisies (« lat, lon » dans location) ou, à défaut, GPS EXIF
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
 
     def __str__(self):
         return f"Preuve de {self.session.user.username} pour {self.session.mission.title}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'submitted_at'], name='proof_status_submitted_idx'),
+            # File de modération : seules les preuves en attente sont indexées
+            models.Index(fields=['submitted_at'], condition=Q(status='pending'), name='proof_pending_idx'),
+            # Débit de modération par modérateur sur une période
+            models.Index(fields=['reviewed_at', 'reviewed_by'], name='proof_reviewed_idx'),
+        ]
+
 class Score(models.Model):
+    """Points gagnés (preuve validée, mission terminée) ; alimente les classements (missions/leaderboard.py)."""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     mission = models.ForeignKey(Mission, on_delete=models.CASCADE)
-    points = models.IntegerField()
-    validated_at = models.DateTimeField(auto_now_add=True)
+    # Même précision que UserProfile.score : les récompenses sont fractionnaires
+    points = models.DecimalField(max_digits=19, decimal_places=7)
+    validated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['validated_at'], name='score_validated_idx'),
+        ]
+
+
+PERIOD_CHOICES = [
+    ('day', 'Jour'),
+    ('week', 'Semaine'),
+    ('month', 'Mois'),
+]
+
+
+class LeaderboardBucket(models.Model):
+    """
+    Total des points d'un utilisateur sur une période en cours (jour, semaine ISO,
+    mois), incrémenté à chaque Score. Les périodes terminées sont figées dans
+    LeaderboardSnapshot puis retirées d'ici.
+    """
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    points = models.DecimalField(max_digits=19, decimal_places=7, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'user'], name='leaderboardbucket_unique'),
+        ]
+        indexes = [
+            # Top N et rang (COUNT des totaux supérieurs) par parcours d'index
+            models.Index(fields=['period', 'period_start', '-points'], name='leaderboardbucket_rank_idx'),
+        ]
+
+
+class LeaderboardSnapshot(models.Model):
+    """Classement figé d'une période terminée ; jamais modifié."""
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveIntegerField()
+    points = models.DecimalField(max_digits=19, decimal_places=7)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'user'], name='leaderboardsnapshot_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start', 'rank'], name='leaderboardsnapshot_rank_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Un classement figé ne se modifie pas.")
+        super().save(*args, **kwargs)
 
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Notification for {self.user.username}"
 
+    class Meta:
+        indexes = [
+            # Badge et liste des notifications non lues
+            models.Index(fields=['user', '-created_at'], condition=Q(is_read=False), name='notification_unread_idx'),
+            models.Index(fields=['user', 'updated_at'], name='notification_user_updated_idx'),
+            # Archivage des notifications lues (missions/archive.py)
+            models.Index(fields=['created_at'], condition=Q(is_read=True), name='notification_read_created_idx'),
+        ]
+
 class ProofForm(forms.ModelForm):
     class Meta:
         model = Proof
@@ -175,6 +312,12 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} ({self.price} π)"
 
+    class Meta:
+        indexes = [
+            # Vitrine de la marketplace : produits disponibles, les plus récents d'abord
+            models.Index(fields=['-created_at'], condition=Q(is_available=True), name='product_available_idx'),
+        ]
+
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
@@ -184,6 +327,7 @@ class Purchase(models.Model):
     """Représente une transaction d'achat sécurisée (escrow)."""
     STATUS_CHOICES = [
         ('awaiting_payment', 'En attente de paiement'),
+        ('processing', 'Paiement en cours'),
         ('in_escrow', 'Paiement sécurisé (en attente de livraison)'),
         ('shipped', 'Expédié'),
         ('completed', 'Terminé'),
@@ -203,3 +347,103 @@ class Purchase(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Parcours par lots du planificateur de séquestre (run_escrow_scheduler)
+            models.Index(fields=['status', 'updated_at'], name='purchase_status_updated_idx'),
+            models.Index(fields=['status', 'created_at'], name='purchase_status_created_idx'),
+            # Listes « mes achats » / « mes ventes » du profil, triées par date
+            models.Index(fields=['buyer', '-created_at'], name='purchase_buyer_created_idx'),
+            models.Index(fields=['seller', '-created_at'], name='purchase_seller_created_idx'),
+            # Synchronisation incrémentale (missions/sync.py)
+            models.Index(fields=['buyer', 'updated_at'], name='purchase_buyer_updated_idx'),
+            models.Index(fields=['seller', 'updated_at'], name='purchase_seller_updated_idx'),
+        ]
+
+
+class MediaBlob(models.Model):
+    """
+    Fichier média stocké une seule fois, nommé par son empreinte SHA-256
+    (missions/storage.py). `refcount` compte les champs qui le référencent.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class SyncTombstone(models.Model):
+    """
+    Trace d'une suppression, pour la synchronisation incrémentale du client
+    mobile (missions/sync.py). `user` vide : suppression visible de tous (mission).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+
+
+class AuditEvent(models.Model):
+    """
+    Journal d'audit en ajout seul (missions/audit.py) : transitions de statut,
+    paiements, remboursements et décisions de modération d'un achat ou d'une
+    preuve. Sur PostgreSQL la table est partitionnée par mois sur `created_at`.
+    """
+    entity_type = models.CharField(max_length=20)
+    entity_id = models.BigIntegerField()
+    action = models.CharField(max_length=30)
+    source = models.CharField(max_length=20, null=True, blank=True)
+    target = models.CharField(max_length=20, null=True, blank=True)
+    # Pas de contrainte : l'historique survit à la suppression d'un compte
+    actor = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, blank=True, related_name='+')
+    data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['entity_type', 'entity_id', 'created_at'], name='auditevent_entity_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_type} #{self.entity_id} : {self.action}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Le journal d'audit est en ajout seul.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Le journal d'audit est en ajout seul.")
+
+
+class ArchiveSegment(models.Model):
+    """
+    Segment d'archive à froid (missions/archive.py) : fichier JSONL compressé
+    sous ARCHIVE_ROOT, avec la plage d'ids et de dates des lignes qu'il contient.
+    """
+    kind = models.CharField(max_length=20)
+    path = models.CharField(max_length=255, unique=True)
+    rows = models.PositiveIntegerField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'first_id', 'last_id'], name='archivesegment_ids_idx'),
+        ]
+
+    def __str__(self):
+        return self.path
@@ -0,0 +1,129 @@
+"""
+File de modération des preuves.
+
+Chaque modérateur réserve un lot de preuves en attente (`claim_batch`). Les
+lignes sont verrouillées avec SKIP LOCKED le temps de poser le bail : deux
+modérateurs ne reçoivent jamais la même preuve et ne s'attendent jamais l'un
+l'autre. Un bail expiré (modérateur parti) remet la preuve dans la file.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import audit, leaderboard
+from .authentication import invalidate_principal
+from .models import Proof, UserProfile
+
+
+QUEUE_ORDER = (F('risk_score').desc(nulls_last=True), 'submitted_at', 'id')
+
+
+class ModerationError(Exception):
+    pass
+
+
+def lease_duration():
+    return timedelta(seconds=getattr(settings, 'MODERATION_LEASE_SECONDS', 600))
+
+
+def _unclaimed(moderator, now):
+    """Preuves en attente sans bail actif, ou dont le bail appartient à `moderator`."""
+    return Proof.objects.filter(status='pending').filter(
+        Q(claim_expires_at__isnull=True) | Q(claim_expires_at__lt=now) | Q(claimed_by=moderator)
+    )
+
+
+def claim_batch(moderator, size=None):
+    """
+    Réserve jusqu'à `size` preuves en attente pour `moderator` et les retourne, par
+    score de risque décroissant puis les plus anciennes d'abord (les preuves pas
+    encore analysées passent en dernier). Les baux déjà détenus par ce modérateur
+    sont prolongés.
+    """
+    size = size or getattr(settings, 'MODERATION_BATCH_SIZE', 10)
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            _unclaimed(moderator, now).select_for_update(skip_locked=True)
+            .order_by(*QUEUE_ORDER).values_list('id', flat=True)[:size]
+        )
+        Proof.objects.filter(id__in=ids).update(claimed_by=moderator, claim_expires_at=now + lease_duration())
+    return list(
+        Proof.objects.filter(id__in=ids).select_related('session__user', 'session__mission').order_by(*QUEUE_ORDER)
+    )
+
+
+def release_claims(moderator):
+    """Rend à la file les preuves encore réservées par `moderator`."""
+    return Proof.objects.filter(status='pending', claimed_by=moderator).update(claimed_by=None, claim_expires_at=None)
+
+
+def review_proof(proof_id, decision, moderator=None, reason=None, require_claim=True):
+    """
+    Valide ou rejette une preuve en attente et crédite l'utilisateur si besoin.
+
+    Avec `require_claim`, le modérateur doit détenir un bail valide sur la preuve ;
+    sinon (actions admin en masse, rejet automatique), seule une preuve réservée
+    par un autre modérateur est refusée. Lève ModerationError si la preuve n'est
+    pas disponible.
+    """
+    if decision not in ('validated', 'rejected'):
+        raise ModerationError(f"Décision inconnue : {decision}")
+    now = timezone.now()
+    with transaction.atomic():
+        if require_claim:
+            queryset = Proof.objects.filter(status='pending', claimed_by=moderator, claim_expires_at__gte=now)
+        else:
+            queryset = _unclaimed(moderator, now)
+        proof = (
+            queryset.select_for_update(of=('self',)).select_related('session__user', 'session__mission')
+            .filter(pk=proof_id).first()
+        )
+        if proof is None:
+            raise ModerationError("Cette preuve a déjà été traitée ou n'est pas réservée par vous.")
+
+        reward = None
+        if decision == 'validated':
+            user_id = proof.session.user_id
+            reward = proof.session.mission.reward
+            UserProfile.objects.filter(user_id=user_id).update(
+                solde=F('solde') + reward, score=F('score') + reward, updated_at=now,
+            )
+            transaction.on_commit(lambda: invalidate_principal(user_id))
+            leaderboard.award(user_id, proof.session.mission_id, reward, now)
+        proof.status = decision
+        proof.rejection_reason = reason if decision == 'rejected' else None
+        proof.reviewed_at = now
+        proof.reviewed_by = moderator
+        proof.claimed_by = None
+        proof.claim_expires_at = None
+        proof.save()
+        audit.record('proof', proof.pk, 'review', source='pending', target=decision, actor=moderator, reason=proof.rejection_reason, reward=reward)
+    return proof
+
+
+def moderation_stats(since=None):
+    """File d'attente actuelle et débit de chaque modérateur depuis `since` (24 h par défaut)."""
+    now = timezone.now()
+    since = since or now - timedelta(hours=24)
+    hours = max((now - since).total_seconds() / 3600, 1 / 60)
+    backlog = Proof.objects.filter(status='pending').aggregate(
+        pending=Count('id'),
+        claimed=Count('id', filter=Q(claim_expires_at__gte=now)),
+    )
+    moderators = list(
+        Proof.objects.filter(reviewed_at__gte=since, reviewed_by__isnull=False)
+        .values('reviewed_by', 'reviewed_by__username')
+        .annotate(
+            reviewed=Count('id'),
+            validated=Count('id', filter=Q(status='validated')),
+            rejected=Count('id', filter=Q(status='rejected')),
+        )
+        .order_by('-reviewed')
+    )
+    for row in moderators:
+        row['per_hour'] = round(row['reviewed'] / hours, 2)
+    return {'since': since, **backlog, 'moderators': moderators}
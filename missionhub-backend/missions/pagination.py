@@ -0,0 +1,16 @@
+"""
+Pagination par curseur de l'API.
+
+Le curseur encode la position de la dernière ligne servie : chaque page est un
+parcours d'index (`WHERE id < position ORDER BY id DESC LIMIT n`), sans OFFSET
+ni COUNT(*), et reste stable quand des lignes sont ajoutées entre deux pages.
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Plus récents d'abord (clé primaire croissante avec la création) ; `?page_size=` borné par API_MAX_PAGE_SIZE."""
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
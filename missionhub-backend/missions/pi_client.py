@@ -0,0 +1,49 @@
+"""
+Accès à l'API serveur de Pi Network.
+
+Les vues asynchrones utilisent `apost()` (httpx.AsyncClient) : une seule boucle
+d'événements peut ainsi maintenir des centaines d'appels Pi en vol. Les helpers
+synchrones (admin, commandes) continuent d'utiliser `requests` avec les mêmes
+URL, en-têtes et délais.
+"""
+import asyncio
+import weakref
+
+import httpx
+from django.conf import settings
+
+PI_API_URL = 'https://api.pi.network/v2'
+
+# Un client par boucle d'événements : sous WSGI, chaque appel async_to_sync crée
+# sa propre boucle, et un pool de connexions httpx ne peut pas en changer.
+_clients = weakref.WeakKeyDictionary()
+
+
+def pi_headers():
+    return {'Authorization': f'Key {settings.PI_API_KEY}'}
+
+
+def pi_timeout():
+    return getattr(settings, 'PI_API_TIMEOUT', 10)
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=PI_API_URL,
+            headers=pi_headers(),
+            timeout=pi_timeout(),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'PI_API_MAX_CONNECTIONS', 200),
+                max_keepalive_connections=50,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def apost(path, json=None):
+    """POST asynchrone sur l'API Pi. Lève httpx.HTTPError en cas d'échec réseau."""
+    return await get_async_client().post(path, json=json)
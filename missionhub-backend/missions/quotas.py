@@ -0,0 +1,110 @@
+"""
+Places limitées sur les missions.
+
+Une place est réservée par un UPDATE conditionnel
+(`... SET participant_count = participant_count + 1 WHERE participant_count < capacity`) :
+pas de COUNT(*) sur UserSession, et la capacité ne peut jamais être dépassée.
+
+Pour les missions très demandées (`counter_shards` > 1), le compteur et la
+capacité sont répartis sur plusieurs lignes MissionCounterShard. Chaque
+réservation commence par une ligne tirée au hasard : les verrous de ligne ne
+se concentrent plus sur une seule ligne. `Mission.participant_count` est alors
+recalculé par `reconcile()` (commande reconcile_mission_counters).
+"""
+import random
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Mission, MissionCounterShard, UserSession
+
+
+def _shard_capacities(capacity, shards):
+    if capacity is None:
+        return [None] * shards
+    return [capacity // shards + (1 if index < capacity % shards else 0) for index in range(shards)]
+
+
+def reserve_slot(mission):
+    """
+    Réserve une place ; retourne False si la mission est complète. À appeler dans
+    la transaction qui crée la UserSession : un rollback libère la place.
+    """
+    if mission.counter_shards <= 1:
+        queryset = Mission.objects.filter(pk=mission.pk)
+        if mission.capacity is not None:
+            queryset = queryset.filter(participant_count__lt=F('capacity'))
+        return queryset.update(participant_count=F('participant_count') + 1) == 1
+
+    shards = list(range(mission.counter_shards))
+    start = random.randrange(len(shards))
+    for shard in shards[start:] + shards[:start]:
+        updated = MissionCounterShard.objects.filter(
+            Q(capacity__isnull=True) | Q(count__lt=F('capacity')), mission_id=mission.pk, shard=shard,
+        ).update(count=F('count') + 1)
+        if updated:
+            return True
+    return False
+
+
+def release_slot(mission):
+    """Libère une place (session supprimée)."""
+    if mission.counter_shards <= 1:
+        Mission.objects.filter(pk=mission.pk, participant_count__gt=0).update(participant_count=F('participant_count') - 1)
+        return
+    shard = MissionCounterShard.objects.filter(mission_id=mission.pk, count__gt=0).order_by('-count').values_list('shard', flat=True).first()
+    if shard is not None:
+        MissionCounterShard.objects.filter(mission_id=mission.pk, shard=shard, count__gt=0).update(count=F('count') - 1)
+
+
+def participant_total(mission):
+    """Nombre exact de places réservées."""
+    if mission.counter_shards <= 1:
+        return Mission.objects.filter(pk=mission.pk).values_list('participant_count', flat=True).get()
+    return MissionCounterShard.objects.filter(mission_id=mission.pk).aggregate(total=Sum('count'))['total'] or 0
+
+
+def reconcile(mission):
+    """
+    Resynchronise les compteurs d'une mission depuis UserSession (source de vérité)
+    et redistribue la capacité entre ses lignes de compteur. Retourne le nombre de participants.
+    """
+    with transaction.atomic():
+        # Verrouiller la mission et ses compteurs bloque les réservations concurrentes le temps du recalcul
+        mission = Mission.objects.select_for_update().get(pk=mission.pk)
+        list(MissionCounterShard.objects.select_for_update().filter(mission=mission))
+        total = UserSession.objects.filter(mission=mission).count()
+
+        if mission.counter_shards <= 1:
+            MissionCounterShard.objects.filter(mission=mission).delete()
+        else:
+            MissionCounterShard.objects.filter(mission=mission, shard__gte=mission.counter_shards).delete()
+            remaining = total
+            shards = mission.counter_shards
+            for shard, capacity in enumerate(_shard_capacities(mission.capacity, shards)):
+                # Un éventuel excédent (capacité réduite après coup) reste sur la dernière ligne
+                # pour que la somme des compteurs soit exacte.
+                if shard == shards - 1:
+                    count = remaining
+                elif capacity is None:
+                    count = remaining // (shards - shard)
+                else:
+                    count = min(remaining, capacity)
+                MissionCounterShard.objects.update_or_create(
+                    mission=mission, shard=shard, defaults={'count': count, 'capacity': capacity},
+                )
+                remaining -= count
+        Mission.objects.filter(pk=mission.pk).update(participant_count=total)
+    return total
+
+
+def reconcile_all():
+    """
+    Réconcilie toutes les missions actives dont le compteur s'écarte des UserSession,
+    ou qui sont réparties. Une mission désactivée ne reçoit plus de réservation, et
+    ses sessions archivées (missions/archive.py) ne doivent pas faire baisser son compteur.
+    """
+    drifted = Mission.objects.filter(is_active=True).annotate(actual=Count('usersession')).exclude(
+        Q(participant_count=F('actual')) & Q(counter_shards__lte=1)
+    )
+    return {mission.pk: reconcile(mission) for mission in drifted.order_by().only('pk')}
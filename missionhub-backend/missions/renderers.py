@@ -0,0 +1,53 @@
+"""
+Rendu et lecture JSON de l'API avec orjson.
+
+orjson sérialise nativement dict, list, str, int, datetime, date et UUID, bien
+plus vite que le module json ; seuls les types qu'il ne connaît pas passent par
+`_default`. Le format reste celui du JSONRenderer de DRF, octet pour octet :
+datetime UTC terminées par « Z », Decimal brut en nombre (les DecimalField des
+sérialiseurs arrivent déjà en chaîne, COERCE_DECIMAL_TO_STRING).
+"""
+from decimal import Decimal
+
+import orjson
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+_fallback = JSONEncoder()
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    # Chaînes paresseuses, QuerySet, timedelta, générateurs... : même conversion que DRF
+    return _fallback.default(obj)
+
+
+def dumps(data, indent=False):
+    return orjson.dumps(data, default=_default, option=OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """Remplace JSONRenderer ; `?indent` dans l'en-tête Accept produit une sortie indentée."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        return dumps(data, indent=bool(indent))
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
@@ -0,0 +1,132 @@
+"""
+Routage des requêtes SQL entre la base primaire et les réplicas en lecture.
+
+- Les écritures vont toujours sur la primaire.
+- Les lectures vont sur un réplica sain, sauf si la requête HTTP courante a
+  déjà écrit, se trouve dans une transaction, ou si l'utilisateur a écrit
+  récemment (stickiness, voir ReplicaStickinessMiddleware).
+- Un réplica injoignable est écarté pendant `DATABASE_REPLICA_COOLDOWN` secondes.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+class RoutingState:
+    """État de routage d'une requête HTTP. Objet mutable partagé avec les threads sync_to_async."""
+
+    def __init__(self, use_primary=False):
+        self.use_primary = use_primary
+        self.wrote = False
+
+
+_routing_state = ContextVar('db_routing_state', default=None)
+
+
+def begin_request(use_primary=False):
+    state = RoutingState(use_primary)
+    return state, _routing_state.set(state)
+
+
+def end_request(token):
+    _routing_state.reset(token)
+
+
+def pin_to_primary():
+    """Force les lectures restantes de la requête courante sur la primaire."""
+    state = _routing_state.get()
+    if state is not None:
+        state.use_primary = True
+
+
+class ReplicaHealth:
+    """Vérifie périodiquement chaque réplica et met en quarantaine ceux qui échouent."""
+
+    def __init__(self, check_interval=None, cooldown=None):
+        self.check_interval = check_interval
+        self.cooldown = cooldown
+        self._down_until = {}
+        self._last_check = {}
+        self._lock = threading.Lock()
+
+    def _setting(self, value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+
+    def mark_down(self, alias):
+        cooldown = self._setting(self.cooldown, 'DATABASE_REPLICA_COOLDOWN', 30)
+        with self._lock:
+            self._down_until[alias] = time.monotonic() + cooldown
+
+    def mark_up(self, alias):
+        with self._lock:
+            self._down_until.pop(alias, None)
+
+    def is_available(self, alias):
+        now = time.monotonic()
+        if self._down_until.get(alias, 0) > now:
+            return False
+        interval = self._setting(self.check_interval, 'DATABASE_REPLICA_CHECK_INTERVAL', 10)
+        with self._lock:
+            due = now - self._last_check.get(alias, float('-inf')) >= interval
+            if due:
+                self._last_check[alias] = now
+        if due and not self.ping(alias):
+            self.mark_down(alias)
+            return False
+        return True
+
+    def ping(self, alias):
+        connection = connections[alias]
+        try:
+            if connection.connection is None:
+                connection.ensure_connection()
+                return True
+            return connection.is_usable()
+        except DatabaseError:
+            connection.close()
+            return False
+
+
+replica_health = ReplicaHealth()
+
+
+class PrimaryReplicaRouter:
+    # Les sessions servent à identifier l'utilisateur avant toute décision de routage :
+    # un réplica en retard déconnecterait quelqu'un qui vient de se connecter.
+    primary_only_apps = {'sessions'}
+
+    def __init__(self, primary=DEFAULT_DB_ALIAS, replicas=None, health=None):
+        self.primary = primary
+        self.replicas = list(replicas if replicas is not None else getattr(settings, 'DATABASE_REPLICAS', []))
+        self.health = health or replica_health
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or model._meta.app_label in self.primary_only_apps:
+            return self.primary
+        state = _routing_state.get()
+        if state is not None and (state.use_primary or state.wrote):
+            return self.primary
+        # Une lecture dans une transaction doit voir les écritures de cette transaction
+        if connections[self.primary].in_atomic_block:
+            return self.primary
+        candidates = [alias for alias in self.replicas if self.health.is_available(alias)]
+        if not candidates:
+            return self.primary
+        return random.choice(candidates)
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaire et réplicas contiennent les mêmes données
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in self.replicas
@@ -0,0 +1,192 @@
+"""
+Pré-filtrage automatique des preuves soumises.
+
+Après `submit_proof`, la photo est analysée dans un pool de processus
+(missions/imaging.py) : le décodage d'image ne bloque ni le GIL ni les workers
+web. Le résultat est comparé à la session (date EXIF), à `Proof.location` et au
+lieu de la mission (coordonnées GPS), puis converti en score de risque entre 0 et 1.
+
+Au-delà de `PROOF_AUTO_REJECT_RISK`, la preuve est rejetée sans attendre un
+modérateur. Les autres sont servies aux modérateurs par risque décroissant.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import geo
+from .imaging import analyze_image
+from .models import Proof
+from .moderation import ModerationError, review_proof
+
+logger = logging.getLogger(__name__)
+
+MIN_DIMENSION = 200      # pixels, côté le plus court
+MIN_STDDEV = 4.0         # en dessous, l'image est quasi uniforme (noire, blanche...)
+MAX_GPS_DISTANCE_KM = 5
+# L'heure EXIF est l'heure locale de l'appareil, sans fuseau : on tolère l'écart maximal entre fuseaux
+EXIF_CLOCK_TOLERANCE = timedelta(hours=14)
+
+RISK_WEIGHTS = {
+    'unreadable': 1.0,
+    # Seule une copie exacte (sha256) atteint le seuil de rejet automatique ; une
+    # image proche (dHash) peut être une autre photo du même lieu : modération
+    'duplicate': 0.8,
+    'similar': 0.4,
+    'blank': 0.8,
+    'too_small': 0.8,
+    'taken_before_session': 0.5,
+    'gps_mismatch': 0.3,
+    'far_from_mission': 0.5,
+    'no_exif': 0.1,
+}
+
+FLAG_LABELS = {
+    'unreadable': "image illisible",
+    'duplicate': "photo déjà soumise",
+    'similar': "photo très proche d'une photo déjà soumise",
+    'blank': "image vide",
+    'too_small': "image trop petite",
+    'taken_before_session': "photo prise avant le début de la mission",
+    'gps_mismatch': "position GPS éloignée du lieu indiqué",
+    'far_from_mission': "preuve trop éloignée du lieu de la mission",
+    'no_exif': "aucune donnée EXIF",
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Pool de processus partagé. Contexte `spawn` : pas de fork d'un processus qui détient des connexions."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PROOF_SCREENING_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def is_near_mission(proof, mission, coordinates=None):
+    """
+    Vrai si la preuve se situe dans le rayon de la mission. Les coordonnées de
+    la preuve (sinon `coordinates`) sont utilisées ; None si l'une des deux
+    positions est inconnue.
+    """
+    if proof.latitude is not None:
+        coordinates = (proof.latitude, proof.longitude)
+    if coordinates is None or mission.latitude is None or mission.longitude is None:
+        return None
+    return geo.haversine_km(coordinates, (mission.latitude, mission.longitude)) <= mission.radius_km
+
+
+def _exif_datetime(value):
+    try:
+        return timezone.make_aware(datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S'))
+    except (TypeError, ValueError):
+        return None
+
+
+def assess(proof, analysis):
+    """Calcule (score, drapeaux, date EXIF) pour une preuve à partir du résultat d'analyse."""
+    flags = []
+    taken_at = None
+    if analysis['error']:
+        flags.append('unreadable')
+    else:
+        if min(analysis['width'], analysis['height']) < MIN_DIMENSION:
+            flags.append('too_small')
+        if analysis['stddev'] < MIN_STDDEV:
+            flags.append('blank')
+        others = Proof.objects.exclude(pk=proof.pk)
+        if others.filter(photo_hash=analysis['sha256']).exists():
+            flags.append('duplicate')
+        elif others.filter(photo_dhash=analysis['dhash']).exists():
+            flags.append('similar')
+        taken_at = _exif_datetime(analysis['taken_at'])
+        if taken_at is None and analysis['gps'] is None:
+            flags.append('no_exif')
+        if taken_at is not None and taken_at < proof.session.started_at - EXIF_CLOCK_TOLERANCE:
+            flags.append('taken_before_session')
+        declared = geo.parse_coordinates(proof.location)
+        if analysis['gps'] and declared and geo.haversine_km(analysis['gps'], declared) > MAX_GPS_DISTANCE_KM:
+            flags.append('gps_mismatch')
+    if is_near_mission(proof, proof.session.mission, analysis['gps']) is False:
+        flags.append('far_from_mission')
+    score = min(1.0, sum(RISK_WEIGHTS[flag] for flag in flags))
+    return score, flags, taken_at
+
+
+def apply_screening(proof_id, analysis):
+    """Enregistre le score d'une preuve encore en attente et la rejette si le risque est trop élevé."""
+    proof = Proof.objects.select_related('session__mission').filter(pk=proof_id, status='pending').first()
+    if proof is None:
+        return None
+    score, flags, taken_at = assess(proof, analysis)
+    gps = analysis['gps'] or (None, None)
+    location = {}
+    if proof.latitude is None and analysis['gps']:
+        location = {'latitude': gps[0], 'longitude': gps[1], 'geohash': geo.encode(*gps)}
+    Proof.objects.filter(pk=proof_id).update(
+        **location,
+        risk_score=score,
+        risk_flags=flags,
+        photo_hash=analysis['sha256'],
+        photo_dhash=analysis['dhash'],
+        exif_taken_at=taken_at,
+        exif_latitude=gps[0],
+        exif_longitude=gps[1],
+        screened_at=timezone.now(),
+    )
+    if score >= settings.PROOF_AUTO_REJECT_RISK:
+        reason = "Rejet automatique : " + ", ".join(FLAG_LABELS[flag] for flag in flags) + "."
+        try:
+            review_proof(proof_id, 'rejected', reason=reason, require_claim=False)
+        except ModerationError:
+            # Déjà réservée par un modérateur : il tranchera, avec le score affiché
+            pass
+    return score
+
+
+def read_photo(proof):
+    with proof.photo.open('rb') as photo:
+        return photo.read()
+
+
+def _discard_executor(executor):
+    """Oublie un pool cassé (processus tué...) : le prochain appel en crée un neuf."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+
+def _on_done(proof_id, future, executor=None):
+    # Exécuté dans un thread du pool côté processus web : connexion propre à ce thread.
+    # Ce thread avale les exceptions : elles sont journalisées ici, la preuve reste
+    # non analysée (screened_at vide) et la commande screen_proofs la reprendra.
+    try:
+        apply_screening(proof_id, future.result())
+    except BrokenProcessPool:
+        logger.exception("Pool de pré-filtrage cassé, preuve %s non analysée", proof_id)
+        _discard_executor(executor)
+    except Exception:
+        logger.exception("Échec du pré-filtrage de la preuve %s", proof_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_screening(proof):
+    """Soumet l'analyse de la photo au pool ; à appeler après commit."""
+    executor = get_executor()
+    future = executor.submit(analyze_image, read_photo(proof))
+    future.add_done_callback(lambda f: _on_done(proof.pk, f, executor))
+    return future
@@ -1,45 +1,91 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
-from .models import UserProfile, Mission, UserMission, Badge, UserBadge
+from django.core.exceptions import FieldDoesNotExist
+from .models import UserProfile, Mission, UserMission, Badge, UserBadge, Proof, Notification, Purchase
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .middleware import get_profile
+
+def requested_fields(request):
+    """Champs demandés par `?fields=id,title` en lecture, ou None."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    `?fields=` : ne garde que les champs demandés. Seul le sérialiseur racine
+    est concerné (les sérialiseurs imbriqués n'ont pas de requête dans leur contexte).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        names = requested_fields(self.context.get('request'))
+        if names:
+            for name in set(self.fields) - names:
+                self.fields.pop(name)
+
+
+def sparse_columns(serializer):
+    """
+    Colonnes à charger avec only() pour les champs restant dans `serializer`,
+    ou None si l'un d'eux n'est pas une colonne simple du modèle (relation,
+    propriété...) : on charge alors tout.
+    """
+    opts = serializer.Meta.model._meta
+    columns = {opts.pk.name}
+    for field in serializer.fields.values():
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if model_field.is_relation or not model_field.concrete:
+            return None
+        columns.add(model_field.name)
+    return columns
+
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
-        token['pseudo'] = user.profile.pseudo
+        token['pseudo'] = get_profile(user).pseudo
         return token
     
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = UserProfile
         fields = ('id', 'user', 'pseudo', 'solde', 'score', 'created_at')
 
-class BadgeSerializer(serializers.ModelSerializer):
+class BadgeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Badge
         fields = ('id', 'name', 'description', 'icon')
 
-class UserBadgeSerializer(serializers.ModelSerializer):
+class UserBadgeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     badge = BadgeSerializer(read_only=True)
 
     class Meta:
         model = UserBadge
         fields = ('id', 'badge', 'acquired_at')
 
-class MissionSerializer(serializers.ModelSerializer):
+class MissionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Mission
-        fields = ('id', 'title', 'description', 'category', 'difficulty', 'reward', 'duration_minutes', 'created_at', 'is_active')
+        fields = ('id', 'title', 'description', 'category', 'difficulty', 'reward', 'duration_minutes', 'created_at', 'is_active', 'latitude', 'longitude', 'capacity', 'participant_count')
 
-class UserMissionSerializer(serializers.ModelSerializer):
+class UserMissionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     mission = MissionSerializer(read_only=True)
     user = UserProfileSerializer(read_only=True)
 
@@ -47,6 +93,16 @@ class UserMissionSerializer(serializers.ModelSerializer):
         model = UserMission
         fields = ('id', 'user', 'mission', 'status', 'started_at', 'completed_at')
 
+class NotificationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ('id', 'message', 'is_read', 'created_at')
+
+class PurchaseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Purchase
+        fields = ('id', 'product', 'buyer', 'seller', 'quantity', 'total_price', 'status', 'created_at', 'updated_at')
+
 class CompleteMissionSerializer(serializers.Serializer):
     mission_id = serializers.IntegerField()
 
@@ -67,4 +123,49 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         user.profile.pseudo = pseudo
         user.profile.save()
-        return user
\ No newline at end of file
+        return user
+
+
+class ModerationProofSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    mission = serializers.CharField(source='session.mission.title', read_only=True)
+    user = serializers.CharField(source='session.user.username', read_only=True)
+
+    class Meta:
+        model = Proof
+        fields = ('id', 'mission', 'user', 'photo', 'location', 'submitted_at', 'risk_score', 'risk_flags', 'claim_expires_at')
+
+class ProofReviewSerializer(serializers.Serializer):
+    decision = serializers.ChoiceField(choices=['validated', 'rejected'])
+    rejection_reason = serializers.CharField(required=False, allow_blank=True)
+
+
+def _decimal_to_string(value):
+    # Les DecimalField lus en base sont déjà quantifiés à `decimal_places` ; 'f' évite la notation 0E-7
+    return None if value is None else format(value, 'f')
+
+
+def values_fields(serializer_class, prefix=''):
+    """
+    Lecture rapide pour values() : liste (clé de sortie, lookup ORM, conversion)
+    des champs simples d'un ModelSerializer. Les conversions reproduisent le
+    format DRF (datetime dans le fuseau courant, Decimal en chaîne) sans
+    instancier de modèle ni de sérialiseur par ligne ; les champs imbriqués
+    sont ignorés.
+    """
+    fields = []
+    for name, field in serializer_class().fields.items():
+        if field.write_only or isinstance(field, serializers.BaseSerializer) or '.' in field.source:
+            continue
+        if isinstance(field, serializers.DecimalField):
+            convert = _decimal_to_string
+        elif isinstance(field, serializers.DateTimeField):
+            convert = field.to_representation
+        else:
+            convert = None
+        fields.append((name, prefix + field.source, convert))
+    return fields
+
+
+def values_row(row, fields):
+    """Représentation d'une ligne values() selon `values_fields`."""
+    return {name: convert(row[lookup]) if convert else row[lookup] for name, lookup, convert in fields}
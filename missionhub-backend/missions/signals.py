@@ -1,20 +1,47 @@
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete, pre_save
+from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Proof, Notification, Badge, UserBadge
+from .authentication import invalidate_principal
+from . import badges, geo
+from .events import publish_notification, publish_purchase
+from .middleware import get_profile
+from .models import Proof, Notification, Badge, UserBadge, UserProfile, Purchase, Product, Mission, UserSession, UserMission, SyncTombstone
+from .quotas import reconcile, release_slot
+from .transitions import purchase_transitioned
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_principal(sender, instance, **kwargs):
+    """
+    Invalide le principal mis en cache par CachedJWTAuthentication
+    dès que l'utilisateur ou son profil est modifié.
+    """
+    user_id = instance.pk if sender is User else instance.user_id
+    invalidate_principal(user_id)
+
+@receiver(pre_save, sender=Mission)
+@receiver(pre_save, sender=Proof)
+def fill_geohash(sender, instance, **kwargs):
+    """Calcule le geohash à partir des coordonnées (celles d'une preuve peuvent venir du champ location)."""
+    if sender is Proof:
+        coordinates = geo.parse_coordinates(instance.location)
+        if coordinates:
+            instance.latitude, instance.longitude = coordinates
+    if instance.latitude is not None and instance.longitude is not None:
+        instance.geohash = geo.encode(instance.latitude, instance.longitude)
+    else:
+        instance.geohash = ''
 
 @receiver(pre_save, sender=Proof)
 def store_old_proof_status(sender, instance, **kwargs):
     """
-    Avant de sauvegarder, on stocke l'ancien statut sur l'instance
-    pour pouvoir le comparer dans le post_save.
+    Avant de sauvegarder, on stocke l'ancien statut (et l'ancienne photo) sur
+    l'instance pour pouvoir les comparer dans le post_save.
     """
-    if instance.pk:
-        try:
-            instance._old_status = Proof.objects.get(pk=instance.pk).status
-        except Proof.DoesNotExist:
-            instance._old_status = None
-    else:
-        instance._old_status = None
+    old = Proof.objects.filter(pk=instance.pk).values_list('status', 'photo').first() if instance.pk else None
+    instance._old_status, instance._old_file = old or (None, None)
 
 @receiver(post_save, sender=Proof)
 def proof_change_notification(sender, instance, created, **kwargs):
@@ -45,32 +72,30 @@ def proof_change_notification(sender, instance, created, **kwargs):
 
 def check_and_award_badges(user):
     """
-    Vérifie et attribue des badges à un utilisateur en fonction de ses accomplissements.
+    Vérifie et attribue des badges à un utilisateur en fonction de ses accomplissements
+    (règles de missions/badges.py).
     """
-    # --- Badge 1: Première Preuve Validée ---
-    try:
-        badge = Badge.objects.get(name="Première Preuve Validée")
-        if Proof.objects.filter(session__user=user, status='validated').count() == 1:
-            awarded, created = UserBadge.objects.get_or_create(user=user.profile, badge=badge)
-            if created:
-                user.profile.score += badge.reward_value
-                user.profile.save()
-                Notification.objects.create(user=user, message=f"Félicitations ! Vous avez débloqué le badge : '{badge.name}'.")
-    except Badge.DoesNotExist:
-        pass  # Le badge n'a pas été créé dans l'admin, on ne fait rien.
-
-    # --- Badge 2: Explorateur (3 catégories de missions différentes) ---
-    try:
-        badge = Badge.objects.get(name="Explorateur")
-        distinct_categories = Proof.objects.filter(session__user=user, status='validated').values('session__mission__category').distinct().count()
-        if distinct_categories >= 3:
-            awarded, created = UserBadge.objects.get_or_create(user=user.profile, badge=badge)
-            if created:
-                user.profile.score += badge.reward_value
-                user.profile.save()
-                Notification.objects.create(user=user, message=f"Félicitations ! Vous avez débloqué le badge : '{badge.name}'.")
-    except Badge.DoesNotExist:
-        pass
+    profile = get_profile(user)
+    for badge in Badge.objects.exclude(rule=''):
+        if badge.rule in badges.RULES and badges.eligible(badge, profile=profile.pk).exists():
+            badges.award(badge, [profile.pk])
+
+
+@receiver(post_save, sender=Mission)
+def sync_mission_counters(sender, instance, created, **kwargs):
+    """
+    Un enregistrement complet de la mission réécrit participant_count depuis
+    l'instance en mémoire, et peut changer capacité ou répartition : on resynchronise.
+    Comme reconcile_all, seulement les missions actives : les sessions archivées
+    d'une mission désactivée ne doivent pas faire baisser son compteur.
+    """
+    if instance.is_active and (not created or instance.counter_shards > 1):
+        reconcile(instance)
+
+
+@receiver(post_delete, sender=UserSession)
+def release_mission_slot(sender, instance, **kwargs):
+    release_slot(instance.mission)
 
 
 @receiver(post_delete, sender=Proof)
@@ -79,4 +104,83 @@ def notify_proof_deleted(sender, instance, **kwargs):
     Envoie une notification lors de la suppression d'une preuve.
     """
     message = f"Votre preuve pour la mission '{instance.session.mission.title}' a été supprimée."
-    Notification.objects.create(user=instance.session.user, message=message)
\ No newline at end of file
+    Notification.objects.create(user=instance.session.user, message=message)
+
+
+@receiver(post_save, sender=Notification)
+def push_new_notification(sender, instance, created, **kwargs):
+    """Pousse les nouvelles notifications vers les flux SSE ouverts, après commit."""
+    if created:
+        transaction.on_commit(lambda: publish_notification(instance))
+
+
+@receiver(post_save, sender=Purchase)
+def push_new_purchase(sender, instance, created, **kwargs):
+    """Pousse la création d'un achat ; les changements de statut passent par purchase_transitioned."""
+    if created:
+        transaction.on_commit(lambda: publish_purchase(instance))
+
+
+@receiver(purchase_transitioned)
+def push_purchase_transition(sender, purchase_ids, source, target, **kwargs):
+    """Pousse les transitions de statut vers l'acheteur et le vendeur de chaque achat."""
+    for purchase in Purchase.objects.filter(pk__in=purchase_ids).only('id', 'status', 'buyer_id', 'seller_id', 'updated_at'):
+        publish_purchase(purchase)
+
+
+def _deleting_account(origin):
+    # Suppression d'un compte : ses pierres tombales ne serviraient à personne (et référenceraient un utilisateur supprimé)
+    return isinstance(origin, (User, UserProfile)) or getattr(origin, 'model', None) in (User, UserProfile)
+
+
+@receiver(post_delete, sender=Mission)
+@receiver(post_delete, sender=UserMission)
+@receiver(post_delete, sender=UserBadge)
+@receiver(post_delete, sender=Notification)
+@receiver(post_delete, sender=Purchase)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    """Enregistre la suppression pour la synchronisation incrémentale (missions/sync.py)."""
+    if _deleting_account(origin):
+        return
+    if sender is Mission:
+        SyncTombstone.objects.create(kind='missions', object_id=instance.pk)
+    elif sender is Notification:
+        SyncTombstone.objects.create(user_id=instance.user_id, kind='notifications', object_id=instance.pk)
+    elif sender is Purchase:
+        SyncTombstone.objects.bulk_create([
+            SyncTombstone(user_id=user_id, kind='purchases', object_id=instance.pk)
+            for user_id in {instance.buyer_id, instance.seller_id}
+        ])
+    else:
+        kind = 'user_missions' if sender is UserMission else 'badges'
+        user_id = UserProfile.objects.filter(pk=instance.user_id).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            SyncTombstone.objects.create(user_id=user_id, kind=kind, object_id=instance.pk)
+
+
+# Références des fichiers médias (missions/storage.py)
+_MEDIA_FIELDS = {Proof: 'photo', Product: 'image'}
+
+
+@receiver(pre_save, sender=Product)
+def store_old_product_image(sender, instance, **kwargs):
+    instance._old_file = Product.objects.filter(pk=instance.pk).values_list('image', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Proof)
+@receiver(post_save, sender=Product)
+def release_replaced_media(sender, instance, **kwargs):
+    """Rend la référence de l'ancien fichier quand il a été remplacé ou retiré."""
+    field = getattr(instance, _MEDIA_FIELDS[sender])
+    old = getattr(instance, '_old_file', None)
+    if old and old != field.name:
+        field.storage.delete(old)
+    instance._old_file = field.name
+
+
+@receiver(post_delete, sender=Proof)
+@receiver(post_delete, sender=Product)
+def release_deleted_media(sender, instance, **kwargs):
+    field = getattr(instance, _MEDIA_FIELDS[sender])
+    if field.name:
+        field.storage.delete(field.name)
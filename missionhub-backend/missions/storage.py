@@ -0,0 +1,97 @@
+"""
+Stockage des médias adressé par contenu.
+
+Un fichier reçu est nommé d'après l'empreinte SHA-256 de son contenu et rangé
+dans deux niveaux de sous-répertoires (`proofs/3f/a2/3fa2…e1.jpg`) : aucun
+répertoire ne dépasse quelques centaines d'entrées, et un même contenu envoyé
+deux fois n'est écrit qu'une fois. Le préfixe `upload_to` est conservé : les
+photos de preuves et les images de produits restent séparées (droits d'accès
+différents).
+
+Chaque nom stocké a une ligne MediaBlob dont `refcount` compte les références ;
+`delete()` décrémente et ne supprime le fichier qu'à zéro. Les fichiers
+antérieurs (sans MediaBlob) sont uniques et supprimés directement.
+"""
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+HASH_CHUNK = 64 * 1024
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK) if hasattr(content, 'chunks') else iter(lambda: content.read(HASH_CHUNK), b''):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """'proofs/WIN_2024.JPG' -> 'proofs/3f/a2/3fa2….jpg'."""
+    directory = posixpath.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return posixpath.join(directory, digest[:2], digest[2:4], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Le nom définitif dépend du contenu (_save) ; un nom identique désigne un contenu identique
+        return name
+
+    def _save(self, name, content):
+        name = hashed_name(name, content_hash(content))
+        with transaction.atomic():
+            # La référence est prise avant d'écrire : un delete() concurrent attend le verrou de la ligne
+            self.retain(name, content.size)
+            if not self.exists(name):
+                # Écriture sous un nom temporaire puis renommage atomique : deux envois simultanés
+                # du même contenu ne produisent jamais de fichier partiel
+                temporary = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+                os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def retain(self, name, size=0):
+        """Ajoute une référence à `name`."""
+        from .models import MediaBlob
+
+        if MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size, refcount=1)
+        except IntegrityError:
+            # Créé entre-temps par un envoi concurrent du même contenu
+            MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+    def delete(self, name):
+        """
+        Retire une référence. À la dernière, le fichier est supprimé après commit,
+        sauf si le même contenu a été renvoyé entre-temps.
+        """
+        from .models import MediaBlob
+
+        if not name:
+            return
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refcount > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+
+        def remove():
+            if not MediaBlob.objects.filter(name=name).exists():
+                super(ContentAddressedStorage, self).delete(name)
+
+        transaction.on_commit(remove)
@@ -0,0 +1,108 @@
+"""
+Synchronisation incrémentale pour le client mobile (GET /api/sync/).
+
+Le jeton `since` est signé et contient l'heure du début de la synchronisation
+précédente. Chaque catégorie est relue par un parcours d'intervalle sur un index
+(propriétaire, updated_at) ; les suppressions sont relues dans SyncTombstone.
+Sans jeton (ou jeton expiré), la réponse est un instantané complet (`full`).
+
+Les lignes modifiées par une transaction encore ouverte au moment de la lecture
+ont un updated_at antérieur à son commit : la fenêtre est élargie de
+SYNC_OVERLAP_SECONDS, le client applique les lignes par id (idempotent).
+Les compteurs de participants (Mission.participant_count) ne touchent pas
+updated_at : ils sont à jour quand la mission change, pas en continu.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from .middleware import get_profile
+from .models import Mission, Notification, Purchase, SyncTombstone, UserBadge, UserMission, UserProfile
+from .serializers import (
+    BadgeSerializer, MissionSerializer, NotificationSerializer, PurchaseSerializer, UserBadgeSerializer,
+    UserMissionSerializer, UserProfileSerializer, values_fields, values_row,
+)
+
+SALT = 'missions.sync'
+
+
+def retention():
+    """Durée de conservation des pierres tombales, donc de validité d'un jeton."""
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30))
+
+
+def make_token(user, at):
+    return signing.dumps({'u': user.pk, 't': at.isoformat()}, salt=SALT)
+
+
+def read_token(token, user):
+    """Heure contenue dans le jeton, ou None s'il est absent, invalide, expiré ou émis pour un autre utilisateur."""
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=SALT, max_age=retention())
+        since = datetime.fromisoformat(data['t'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    return since if data.get('u') == user.pk else None
+
+
+def _rows(queryset, fields, nested=None):
+    """Lignes values() ; `nested` = (clé, champs préfixés) pour un objet lié lu par la même jointure."""
+    lookups = [lookup for _, lookup, _ in fields]
+    if nested:
+        lookups += [lookup for _, lookup, _ in nested[1]]
+    rows = []
+    for row in queryset.values(*lookups):
+        item = values_row(row, fields)
+        if nested:
+            item[nested[0]] = values_row(row, nested[1])
+        rows.append(item)
+    return rows
+
+
+def changes(user, since=None):
+    """Tout ce qui a changé pour `user` depuis `since` (instantané complet si None)."""
+    now = timezone.now()
+    profile = get_profile(user)
+    after = since - timedelta(seconds=getattr(settings, 'SYNC_OVERLAP_SECONDS', 30)) if since else None
+
+    missions = Mission.objects.filter(updated_at__gt=after) if after else Mission.objects.filter(is_active=True)
+    user_missions = UserMission.objects.filter(user=profile)
+    badges = UserBadge.objects.filter(user=profile)
+    notifications = Notification.objects.filter(user=user)
+    purchases = Purchase.objects.filter(Q(buyer=user) | Q(seller=user))
+    if after:
+        user_missions = user_missions.filter(updated_at__gt=after)
+        badges = badges.filter(acquired_at__gt=after)
+        notifications = notifications.filter(updated_at__gt=after)
+        purchases = purchases.filter(updated_at__gt=after)
+    else:
+        notifications = notifications.order_by('-created_at')[:getattr(settings, 'SYNC_FULL_NOTIFICATIONS', 200)]
+
+    profile_fields = values_fields(UserProfileSerializer)
+    user_mission_fields = values_fields(UserMissionSerializer) + [('mission', 'mission_id', None)]
+    payload = {
+        'token': make_token(user, now),
+        'full': after is None,
+        'profile': _rows(UserProfile.objects.filter(pk=profile.pk), profile_fields)[0],
+        'missions': _rows(missions.order_by(), values_fields(MissionSerializer)),
+        'user_missions': _rows(user_missions.order_by(), user_mission_fields),
+        'badges': _rows(badges.order_by(), values_fields(UserBadgeSerializer), ('badge', values_fields(BadgeSerializer, 'badge__'))),
+        'notifications': _rows(notifications, values_fields(NotificationSerializer)),
+        'purchases': _rows(purchases.order_by(), values_fields(PurchaseSerializer)),
+        'deleted': {},
+    }
+    if after:
+        tombstones = SyncTombstone.objects.filter(Q(user=user) | Q(user__isnull=True), deleted_at__gt=after)
+        for kind, object_id in tombstones.values_list('kind', 'object_id'):
+            payload['deleted'].setdefault(kind, []).append(object_id)
+    return payload
+
+
+def prune_tombstones():
+    """Supprime les pierres tombales plus anciennes que la durée de validité des jetons."""
+    return SyncTombstone.objects.filter(deleted_at__lt=timezone.now() - retention()).delete()[0]
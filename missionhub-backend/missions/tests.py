@@ -1,3 +1,1428 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import math
+import os
+import tempfile
+import random
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, JsonResponse
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import archive, audit, authentication, events, pi_client, screening, badges, geo, leaderboard, moderation, quotas, routers, sync, throttling
+from rest_framework.renderers import JSONRenderer
+
+from .admin import force_complete_purchase, resolve_in_favor_of_seller
+from .imaging import analyze_image
+from .management.commands import run_escrow_scheduler as escrow
+from .middleware import CompressionMiddleware, ProfilePreloadMiddleware, ReplicaStickinessMiddleware, get_profile
+from .renderers import ORJSONRenderer
+from .models import ArchiveSegment, AuditEvent, Badge, LeaderboardBucket, LeaderboardSnapshot, MediaBlob, Mission, Notification, Product, Proof, Purchase, Score, UserBadge, UserMission, UserProfile, UserSession
+from .serializers import CustomTokenObtainPairSerializer, MissionSerializer, UserProfileSerializer
+from .transitions import IllegalTransition, bulk_transition, purchase_transitioned, transition_purchase
+
+
+class FakeHealth:
+    def __init__(self, down=()):
+        self.down = set(down)
+
+    def is_available(self, alias):
+        return alias not in self.down
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        authentication.principal_cache.clear()
+        self.user = User.objects.create_user('jwt', password='pw')
+        self.token = str(CustomTokenObtainPairSerializer.get_token(self.user).access_token)
+
+    def authenticate(self):
+        request = RequestFactory().get('/api/missions/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return authentication.CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_warm_cache_authenticates_without_queries(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.profile.pseudo, self.user.profile.pseudo)
+
+    def test_user_and_profile_saves_invalidate(self):
+        self.authenticate()
+        profile = UserProfile.objects.get(user=self.user)
+        profile.solde = Decimal('4')
+        profile.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().profile.solde, Decimal('4'))
+        User.objects.get(pk=self.user.pk).save()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch.object(authentication.time, 'monotonic', return_value=1000.0):
+            self.authenticate()
+        ttl = authentication.principal_cache.ttl
+        with mock.patch.object(authentication.time, 'monotonic', return_value=1000.0 + ttl - 1), self.assertNumQueries(0):
+            self.authenticate()
+        with mock.patch.object(authentication.time, 'monotonic', return_value=1000.0 + ttl + 1), self.assertNumQueries(1):
+            self.authenticate()
+
+
+class ProfilePreloadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('preload', password='pw')
+
+    def test_profile_is_loaded_once_per_request(self):
+        def view(request):
+            # Instances distinctes du même utilisateur (request.user, purchase.buyer...)
+            profiles = {id(get_profile(User(pk=self.user.pk))) for _ in range(3)}
+            return HttpResponse(str(len(profiles)))
+
+        with self.assertNumQueries(1):
+            response = ProfilePreloadMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'1')
+        with self.assertNumQueries(1):
+            ProfilePreloadMiddleware(view)(RequestFactory().get('/'))
+
+    def test_session_user_comes_with_its_profile(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/profile/').status_code, 200)
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'FROM "missions_userprofile"' in q['sql']])
+
+
+def pi_response(status=200, payload=None):
+    return httpx.Response(status, json=payload or {}, request=httpx.Request('POST', pi_client.PI_API_URL))
+
+
+class PiViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pioneer', password='pw')
+        UserProfile.objects.filter(user=cls.user).update(solde=10, pi_uid='uid-1')
+        cls.seller = User.objects.create_user('pi-seller')
+        cls.product = Product.objects.create(seller=cls.seller, name='p', description='d', price=1)
+
+    def setUp(self):
+        cache.clear()
+        throttling.local_blocklist = throttling.LocalBlocklist()
+        authentication.principal_cache.clear()
+        self.token = str(CustomTokenObtainPairSerializer.get_token(self.user).access_token)
+
+    def pi(self, *responses):
+        return mock.patch.object(pi_client, 'apost', new=mock.AsyncMock(side_effect=list(responses)))
+
+    async def withdraw(self, amount, client=None, **headers):
+        client = client or AsyncClient(enforce_csrf_checks=True)
+        return await client.post('/api/pi/withdraw/', {'amount': amount}, content_type='application/json', headers=headers)
+
+    async def balance(self):
+        return await UserProfile.objects.filter(user=self.user).values_list('solde', flat=True).aget()
+
+    async def test_withdrawal_with_jwt_debits_the_balance(self):
+        with self.pi(pi_response(payload={'identifier': 'tx-1'})) as apost:
+            response = await self.withdraw('4', Authorization=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.json()['new_balance'])), Decimal('6'))
+        self.assertEqual(apost.call_args.kwargs['json']['recipient'], 'uid-1')
+        self.assertEqual(await self.balance(), Decimal('6'))
+
+    async def test_pi_error_restores_the_balance(self):
+        for failure in (pi_response(500), httpx.ConnectError('down')):
+            with self.subTest(failure=failure), self.pi(failure):
+                response = await self.withdraw('4', Authorization=f'Bearer {self.token}')
+                self.assertEqual(response.status_code, 500)
+                self.assertEqual(await self.balance(), Decimal('10'))
+
+    async def test_insufficient_balance_is_refused_without_calling_pi(self):
+        with self.pi() as apost:
+            response = await self.withdraw('10.5', Authorization=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, 400)
+        apost.assert_not_called()
+        self.assertEqual(await self.balance(), Decimal('10'))
+
+    async def test_session_post_requires_csrf_token(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        await client.aforce_login(self.user)
+        with self.pi() as apost:
+            response = await self.withdraw('4', client)
+        self.assertEqual(response.status_code, 403)
+        apost.assert_not_called()
+        self.assertEqual(await self.balance(), Decimal('10'))
+        self.assertEqual((await AsyncClient().post('/api/pi/withdraw/', {'amount': '4'})).status_code, 401)
+
+    async def test_authenticate_links_uid_once(self):
+        other = await sync_to_async(User.objects.create_user)('other-pioneer')
+        token = str((await sync_to_async(CustomTokenObtainPairSerializer.get_token)(other)).access_token)
+        client = AsyncClient(enforce_csrf_checks=True)
+        post = lambda uid: client.post('/api/pi/auth/', {'uid': uid}, content_type='application/json', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual((await post('uid-1')).status_code, 400)
+        self.assertEqual((await post('uid-2')).status_code, 200)
+        self.assertEqual(await UserProfile.objects.filter(user=other).values_list('pi_uid', flat=True).aget(), 'uid-2')
+
+    async def webhook(self, purchase_id, payment_id='pay-1'):
+        return await AsyncClient().post(
+            '/api/pi/webhook/', {'paymentId': payment_id, 'metadata': {'purchase_id': purchase_id}}, content_type='application/json',
+        )
+
+    async def purchase(self):
+        return await Purchase.objects.acreate(product=self.product, buyer=self.user, seller=self.seller, total_price=1)
+
+    async def status_of(self, purchase):
+        return await Purchase.objects.filter(pk=purchase.pk).values_list('status', flat=True).aget()
+
+    async def test_webhook_success_moves_purchase_to_escrow(self):
+        purchase = await self.purchase()
+        with self.pi(pi_response(), pi_response()) as apost:
+            response = await self.webhook(purchase.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c.args[0] for c in apost.call_args_list], ['/payments/pay-1/approve', '/payments/pay-1/complete'])
+        self.assertEqual(
+            await Purchase.objects.filter(pk=purchase.pk).values_list('status', 'pi_payment_id').aget(), ('in_escrow', 'pay-1'),
+        )
+        self.assertTrue(await Notification.objects.filter(user=self.seller).aexists())
+
+    async def test_webhook_rejects_incomplete_or_unknown_payments(self):
+        response = await AsyncClient().post('/api/pi/webhook/', {'paymentId': 'x'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((await self.webhook(999999)).status_code, 404)
+
+    async def test_webhook_approve_failure_cancels(self):
+        purchase = await self.purchase()
+        with self.pi(pi_response(400)):
+            self.assertEqual((await self.webhook(purchase.pk)).status_code, 500)
+        self.assertEqual(await self.status_of(purchase), 'cancelled')
+
+    async def test_webhook_complete_failure_disputes(self):
+        purchase = await self.purchase()
+        with self.pi(pi_response(), httpx.ReadTimeout('slow')), self.assertLogs('missions.views', 'CRITICAL'):
+            self.assertEqual((await self.webhook(purchase.pk)).status_code, 500)
+        self.assertEqual(await self.status_of(purchase), 'disputed')
+
+    async def test_webhook_claims_the_purchase_before_calling_pi(self):
+        purchase = await self.purchase()
+        replies = []
+
+        async def apost(path, json=None):
+            if path.endswith('/approve'):
+                # Un second webhook et l'annulation des impayés arrivent pendant l'appel à Pi
+                replies.append((await self.webhook(purchase.pk)).status_code)
+                cutoff = timezone.now() + timedelta(hours=1)
+                replies.append(await sync_to_async(escrow.cancel_unpaid)(cutoff, 10))
+            return pi_response()
+
+        with mock.patch.object(pi_client, 'apost', new=apost):
+            self.assertEqual((await self.webhook(purchase.pk)).status_code, 200)
+        self.assertEqual(replies, [404, 0])
+        self.assertEqual(await self.status_of(purchase), 'in_escrow')
+        self.assertEqual(await Notification.objects.filter(user=self.seller).acount(), 1)
+
+
+class EventStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('listener')
+        cls.seller = User.objects.create_user('maker')
+        cls.product = Product.objects.create(seller=cls.seller, name='p', description='d', price=1)
+
+    def setUp(self):
+        events.broker = events.poller.broker = events.EventBroker()
+        events.poller._task = None
+
+    def test_cursor_round_trip(self):
+        moment = timezone.now().replace(microsecond=123000)
+        self.assertEqual(events.decode_cursor(events.encode_cursor(42, moment)), (42, moment))
+        for value in (None, '', 'abc', '1.2.3'):
+            self.assertIsNone(events.decode_cursor(value))
+
+    def test_broker_fans_out_to_every_subscription_of_the_user(self):
+        async def scenario():
+            first, second = events.broker.subscribe(1), events.broker.subscribe(1)
+            other = events.broker.subscribe(2)
+            events.broker.publish(1, {'type': 'notification', 'id': 7})
+            received = [first.queue.get_nowait(), second.queue.get_nowait(), other.queue.empty()]
+            for subscription in (first, second, other):
+                events.broker.unsubscribe(subscription)
+            return received, events.broker.user_ids()
+
+        received, remaining = async_to_sync(scenario)()
+        self.assertEqual(received, [{'type': 'notification', 'id': 7}] * 2 + [True])
+        self.assertEqual(remaining, [])
+
+    def test_one_poll_covers_all_connected_users(self):
+        since = timezone.now()
+        notification = Notification.objects.create(user=self.buyer, message='hello')
+        purchase = Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller, total_price=1)
+        with self.assertNumQueries(2):
+            found = async_to_sync(events.poll)([self.buyer.pk, self.seller.pk], notification.pk - 1, since)
+        self.assertCountEqual(
+            [(user_id, event['type'], event['id']) for user_id, event in found],
+            [(self.buyer.pk, 'notification', notification.pk),
+             (self.buyer.pk, 'purchase', purchase.pk), (self.seller.pk, 'purchase', purchase.pk)],
+        )
+
+    def test_once_returns_pending_events_without_starting_the_poller(self):
+        since = timezone.now() - timedelta(seconds=1)
+        notification = Notification.objects.create(user=self.buyer, message='hello')
+
+        async def collect(cursor):
+            return [chunk async for chunk in events.stream_events(self.buyer.pk, cursor, once=True)]
+
+        chunks = async_to_sync(collect)((notification.pk - 1, since))
+        self.assertTrue(chunks[0].startswith('retry: '))
+        self.assertEqual([chunk.split('\n')[0] for chunk in chunks[1:]], ['event: notification'])
+        self.assertEqual(len(async_to_sync(collect)(None)), 1)
+        self.assertIsNone(events.poller._task)
+        self.assertEqual(events.broker.user_ids(), [])
+
+    @override_settings(SSE_POLL_INTERVAL=0.01)
+    def test_poller_publishes_changes_from_other_processes(self):
+        async def scenario():
+            subscription = events.broker.subscribe(self.buyer.pk)
+            events.poller.ensure_running()
+            task = events.poller._task
+            await asyncio.sleep(0.05)
+            # bulk_create n'émet pas post_save : comme une écriture d'un autre worker
+            await sync_to_async(Notification.objects.bulk_create)([Notification(user=self.buyer, message='remote')])
+            event = await asyncio.wait_for(subscription.queue.get(), timeout=2)
+            events.broker.unsubscribe(subscription)
+            await asyncio.wait_for(task, timeout=2)
+            return event
+
+        event = async_to_sync(scenario)()
+        self.assertEqual(event['message'], 'remote')
+        self.assertIsNone(events.poller._task)
+
+    @override_settings(SSE_POLL_INTERVAL=0.01)
+    def test_poller_catches_late_commits_once(self):
+        # Id attribué avant une notification plus récente, commit visible après
+        late = Notification.objects.create(user=self.buyer, message='reserved')
+        late.delete()
+        Notification.objects.create(user=self.buyer, message='earlier')
+
+        async def scenario():
+            subscription = events.broker.subscribe(self.buyer.pk)
+            events.poller.ensure_running()
+            task = events.poller._task
+            await asyncio.sleep(0.05)
+            await sync_to_async(Notification.objects.bulk_create)(
+                [Notification(id=late.pk, user=self.buyer, message='late')]
+            )
+            received = [await asyncio.wait_for(subscription.queue.get(), timeout=2)]
+            # Les polls suivants relisent la ligne dans la fenêtre sans la republier
+            await asyncio.sleep(0.1)
+            while not subscription.queue.empty():
+                received.append(subscription.queue.get_nowait())
+            events.broker.unsubscribe(subscription)
+            await asyncio.wait_for(task, timeout=2)
+            return received
+
+        self.assertEqual([event['message'] for event in async_to_sync(scenario)()], ['late'])
+
+    def test_stream_sends_late_commit_below_the_cursor(self):
+        since = timezone.now()
+        old = Notification.objects.create(user=self.buyer, message='old')
+        Notification.objects.filter(pk=old.pk).update(created_at=since - timedelta(hours=1))
+        late = Notification.objects.create(user=self.buyer, message='late')
+        cursor = (late.pk + 1, since)
+
+        async def collect():
+            return [chunk async for chunk in events.stream_events(self.buyer.pk, cursor, once=True)]
+
+        chunks = async_to_sync(collect)()
+        self.assertEqual(len(chunks), 2)
+        self.assertIn('"late"', chunks[1])
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Routage entre deux alias locaux : 'default' (primaire) et 'replica1'."""
+
+    def setUp(self):
+        self.health = FakeHealth()
+        self.router = routers.PrimaryReplicaRouter(primary='default', replicas=['replica1'], health=self.health)
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Mission), 'replica1')
+        self.assertEqual(self.router.db_for_write(Mission), 'default')
+
+    def test_sessions_are_always_read_from_primary(self):
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def test_request_that_wrote_reads_its_own_writes(self):
+        state, token = routers.begin_request()
+        try:
+            self.assertEqual(self.router.db_for_read(Mission), 'replica1')
+            self.router.db_for_write(Mission)
+            self.assertTrue(state.wrote)
+            self.assertEqual(self.router.db_for_read(Mission), 'default')
+        finally:
+            routers.end_request(token)
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        self.health.down.add('replica1')
+        self.assertEqual(self.router.db_for_read(Mission), 'default')
+
+    def test_replicas_are_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'missions'))
+        self.assertTrue(self.router.allow_migrate('default', 'missions'))
+
+
+class PrimaryReplicaRouterTransactionTests(TestCase):
+    def test_reads_inside_transaction_stay_on_primary(self):
+        router = routers.PrimaryReplicaRouter(primary='default', replicas=['replica1'], health=FakeHealth())
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Mission), 'default')
+
+
+class ReplicaHealthTests(SimpleTestCase):
+    def test_failed_ping_quarantines_replica(self):
+        health = routers.ReplicaHealth(check_interval=0, cooldown=60)
+        health.ping = lambda alias: False
+        self.assertFalse(health.is_available('replica1'))
+        health.ping = lambda alias: True
+        # Toujours en quarantaine malgré un ping désormais réussi
+        self.assertFalse(health.is_available('replica1'))
+        health.mark_up('replica1')
+        self.assertTrue(health.is_available('replica1'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_REPLICA_PIN_SECONDS=10)
+class ReplicaStickinessMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = routers.PrimaryReplicaRouter(primary='default', replicas=['replica1'], health=FakeHealth())
+
+    def _request(self, method='get'):
+        request = getattr(self.factory, method)('/missions/')
+        request.session = {'_auth_user_id': '42'}
+        return request
+
+    def _run(self, request, view):
+        seen = {}
+
+        def get_response(req):
+            view(seen)
+            return HttpResponse()
+
+        ReplicaStickinessMiddleware(get_response)(request)
+        return seen
+
+    def test_user_is_pinned_to_primary_after_a_write(self):
+        seen = self._run(self._request(), lambda seen: seen.update(db=self.router.db_for_read(Mission)))
+        self.assertEqual(seen['db'], 'replica1')
+
+        # submit_proof, start_purchase... : une écriture épingle l'utilisateur
+        self._run(self._request('post'), lambda seen: self.router.db_for_write(Mission))
+
+        seen = self._run(self._request(), lambda seen: seen.update(db=self.router.db_for_read(Mission)))
+        self.assertEqual(seen['db'], 'default')
+
+    def test_unsafe_methods_read_from_primary(self):
+        seen = self._run(self._request('post'), lambda seen: seen.update(db=self.router.db_for_read(Mission)))
+        self.assertEqual(seen['db'], 'default')
+
+
+class QueryPlanAssertions:
+    """
+    PostgreSQL : les parcours séquentiels sont désactivés pour le test ; s'il en
+    reste un dans le plan, c'est qu'aucun index ne peut servir la requête.
+    SQLite : une ligne « SCAN table » sans « USING ... INDEX » est un parcours complet.
+    """
+
+    def assertUsesIndex(self, queryset):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+        else:
+            for line in plan.splitlines():
+                if ' SCAN ' in f' {line} ' and 'USING' not in line and 'CONSTANT ROW' not in line:
+                    self.fail(f"Parcours séquentiel :\n{plan}")
+
+
+class PurchaseTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('cas-buyer')
+        cls.seller = User.objects.create_user('cas-seller')
+        cls.product = Product.objects.create(seller=cls.seller, name='p', description='d', price=1)
+
+    def setUp(self):
+        self.signals = []
+        receiver = lambda sender, purchase_ids, source, target, **kwargs: self.signals.append((sorted(purchase_ids), source, target))
+        purchase_transitioned.connect(receiver, weak=False, dispatch_uid='transition-test')
+        self.addCleanup(purchase_transitioned.disconnect, dispatch_uid='transition-test')
+
+    def purchase(self, status='awaiting_payment'):
+        return Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller, total_price=1, status=status)
+
+    def test_illegal_transition_is_refused(self):
+        purchase = self.purchase('completed')
+        with self.assertRaises(IllegalTransition):
+            transition_purchase(purchase, 'completed', 'in_escrow')
+        with self.assertRaises(IllegalTransition):
+            bulk_transition(Purchase.objects.all(), 'cancelled', 'completed')
+        self.assertEqual(Purchase.objects.get(pk=purchase.pk).status, 'completed')
+
+    def test_losing_compare_and_swap_changes_nothing(self):
+        purchase = self.purchase()
+        Purchase.objects.filter(pk=purchase.pk).update(status='cancelled')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(transition_purchase(purchase, 'awaiting_payment', 'in_escrow'))
+        self.assertEqual(purchase.status, 'awaiting_payment')
+        self.assertEqual(Purchase.objects.get(pk=purchase.pk).status, 'cancelled')
+        self.assertFalse(AuditEvent.objects.exists())
+        self.assertEqual(self.signals, [])
+
+    def test_bulk_transition_only_moves_rows_in_source_state(self):
+        for returning in (True, False):
+            with self.subTest(returning=returning), mock.patch.object(
+                connections['default'].features, 'can_return_columns_from_insert', returning,
+            ):
+                self.signals.clear()
+                unpaid = [self.purchase().pk for _ in range(2)]
+                others = [self.purchase('in_escrow').pk, self.purchase('cancelled').pk]
+                # Queryset découpé (lots) : le statut n'est pas filtré avant le slice
+                batch = Purchase.objects.filter(pk__in=unpaid + others).order_by('pk')[:10]
+                with self.captureOnCommitCallbacks(execute=True):
+                    ids = bulk_transition(batch, 'awaiting_payment', 'cancelled')
+                self.assertCountEqual(ids, unpaid)
+                self.assertEqual(self.signals, [(sorted(unpaid), 'awaiting_payment', 'cancelled')])
+                self.assertEqual(
+                    dict(Purchase.objects.filter(pk__in=unpaid + others).values_list('pk', 'status')),
+                    {unpaid[0]: 'cancelled', unpaid[1]: 'cancelled', others[0]: 'in_escrow', others[1]: 'cancelled'},
+                )
+                self.assertCountEqual(
+                    AuditEvent.objects.filter(entity_id__in=unpaid + others).values_list('entity_id', flat=True), unpaid,
+                )
+
+
+    def test_confirm_receipt_pays_after_completing_and_disputes_on_failure(self):
+        statuses = []
+
+        def pay(purchase):
+            statuses.append(Purchase.objects.get(pk=purchase.pk).status)
+            return purchase.pk == paid.pk, 'Pi indisponible'
+
+        paid, failed = self.purchase('shipped'), self.purchase('shipped')
+        self.client.force_login(self.buyer)
+        with mock.patch('missions.views.release_funds_to_seller', side_effect=pay):
+            for purchase in (paid, failed, paid):
+                self.client.post(reverse('confirm_receipt', args=[purchase.pk]))
+        self.assertEqual(statuses, ['completed', 'completed'])
+        self.assertEqual(Purchase.objects.get(pk=paid.pk).status, 'completed')
+        self.assertEqual(
+            [(e.source, e.target, e.data.get('reason')) for e in audit.history('purchase', failed.pk)],
+            [('shipped', 'completed', None), ('completed', 'disputed', 'payout_failed: Pi indisponible')],
+        )
+
+    def test_admin_payouts_dispute_on_failure(self):
+        staff = User.objects.create_user('cas-admin', is_staff=True)
+        request = RequestFactory().post('/')
+        request.user = staff
+        modeladmin = mock.Mock()
+        shipped, disputed = self.purchase('shipped'), self.purchase('disputed')
+        with mock.patch('missions.views.release_funds_to_seller', side_effect=RuntimeError('boom')) as payout:
+            force_complete_purchase(modeladmin, request, Purchase.objects.filter(pk=shipped.pk))
+            resolve_in_favor_of_seller(modeladmin, request, Purchase.objects.filter(pk=disputed.pk))
+        self.assertEqual(payout.call_count, 2)
+        for purchase, source in ((shipped, 'shipped'), (disputed, 'disputed')):
+            self.assertEqual(
+                [(e.source, e.target) for e in audit.history('purchase', purchase.pk)],
+                [(source, 'completed'), ('completed', 'disputed')],
+            )
+        self.assertEqual(modeladmin.message_user.call_count, 2)
+
+
+class EscrowSchedulerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('escrow-buyer')
+        cls.seller = User.objects.create_user('escrow-seller')
+        cls.product = Product.objects.create(seller=cls.seller, name='p', description='d', price=1)
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def purchase(self, status, age):
+        purchase = Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller, total_price=1, status=status)
+        Purchase.objects.filter(pk=purchase.pk).update(updated_at=self.now - age)
+        return purchase.pk
+
+    def test_candidates_are_walked_by_keyset(self):
+        # Deux achats au même updated_at : départagés par l'id
+        old = [self.purchase('shipped', timedelta(days=20 - i // 2)) for i in range(5)]
+        self.purchase('shipped', timedelta(days=1))
+        self.purchase('in_escrow', timedelta(days=30))
+        seen, after = [], None
+        while batch := escrow._candidates('shipped', self.now - timedelta(days=14), 2, after):
+            seen += [pk for pk, _ in batch]
+            after = (batch[-1][1], batch[-1][0])
+        self.assertEqual(seen, old)
+
+    def test_auto_release_completes_before_paying(self):
+        ids = [self.purchase('shipped', timedelta(days=20)) for _ in range(3)]
+        self.purchase('shipped', timedelta(days=1))
+        statuses = []
+
+        def pay(purchase):
+            statuses.append(Purchase.objects.get(pk=purchase.pk).status)
+            return True, 'ok'
+
+        with mock.patch.object(escrow, 'release_funds_to_seller', side_effect=pay):
+            self.assertEqual(escrow.auto_release(self.now - timedelta(days=14), 2), (3, 0))
+        self.assertEqual(statuses, ['completed'] * 3)
+        self.assertEqual(set(Purchase.objects.filter(pk__in=ids).values_list('status', flat=True)), {'completed'})
+        self.assertEqual(Notification.objects.filter(user=self.seller).count(), 3)
+
+    def test_failed_payout_disputes_and_is_never_retried(self):
+        failed = self.purchase('shipped', timedelta(days=20))
+        crashed = self.purchase('shipped', timedelta(days=20))
+        outcomes = {failed: (False, 'Pi indisponible'), crashed: RuntimeError('boom')}
+
+        def pay(purchase):
+            outcome = outcomes[purchase.pk]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        cutoff = self.now - timedelta(days=14)
+        with mock.patch.object(escrow, 'release_funds_to_seller', side_effect=pay) as payout:
+            self.assertEqual(escrow.auto_release(cutoff, 10), (0, 2))
+            self.assertEqual(escrow.auto_release(cutoff, 10), (0, 0))
+        self.assertEqual(payout.call_count, 2)
+        self.assertEqual(set(Purchase.objects.filter(pk__in=outcomes).values_list('status', flat=True)), {'disputed'})
+        self.assertEqual(
+            [(e.source, e.target) for e in audit.history('purchase', failed)],
+            [('shipped', 'completed'), ('completed', 'disputed')],
+        )
+
+    def test_cancel_unpaid_only_touches_stale_unpaid_purchases(self):
+        stale = [self.purchase('awaiting_payment', timedelta(hours=30)) for _ in range(3)]
+        fresh = self.purchase('awaiting_payment', timedelta(hours=1))
+        paid = self.purchase('in_escrow', timedelta(hours=30))
+        self.assertEqual(escrow.cancel_unpaid(self.now - timedelta(hours=24), 2), 3)
+        self.assertEqual(
+            dict(Purchase.objects.values_list('pk', 'status')),
+            {**{pk: 'cancelled' for pk in stale}, fresh: 'awaiting_payment', paid: 'in_escrow'},
+        )
+        self.assertEqual(Notification.objects.filter(user=self.buyer, message__contains='annulée').count(), 3)
+
+
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+    """Les requêtes fréquentes doivent rester servies par un index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'plan{i}') for i in range(20)]
+        missions = Mission.objects.bulk_create([
+            Mission(title=f'm{i}', description='d', category='sport', difficulty='facile') for i in range(10)
+        ])
+        sessions = UserSession.objects.bulk_create([
+            UserSession(user=user, mission=mission) for user in cls.users for mission in missions
+        ])
+        Proof.objects.bulk_create([
+            Proof(session=session, photo='proofs/plan.jpg', location='x', status=('pending', 'validated', 'rejected')[i % 3])
+            for i, session in enumerate(sessions)
+        ])
+        products = Product.objects.bulk_create([
+            Product(seller=cls.users[i % 20], name=f'p{i}', description='d', price=1, is_available=i % 4 == 0)
+            for i in range(200)
+        ])
+        Purchase.objects.bulk_create([
+            Purchase(
+                product=product, buyer=cls.users[(i + 1) % 20], seller=product.seller, total_price=1,
+                status=[choice for choice, _ in Purchase.STATUS_CHOICES][i % 6],
+            )
+            for i, product in enumerate(products)
+        ])
+        Notification.objects.bulk_create([
+            Notification(user=cls.users[i % 20], message='n', is_read=i % 5 != 0) for i in range(1000)
+        ])
+        cls.mission = missions[0]
+
+    def test_pending_proofs_queue(self):
+        self.assertUsesIndex(Proof.objects.filter(status='pending').order_by('submitted_at'))
+
+    def test_profile_purchases_and_sales(self):
+        user = self.users[3]
+        self.assertUsesIndex(Purchase.objects.filter(buyer=user).order_by('-created_at'))
+        self.assertUsesIndex(Purchase.objects.filter(seller=user).order_by('-created_at'))
+
+    def test_purchases_by_status(self):
+        cutoff = timezone.now()
+        self.assertUsesIndex(Purchase.objects.filter(status='awaiting_payment', created_at__lt=cutoff))
+        self.assertUsesIndex(Purchase.objects.filter(status='shipped', updated_at__lt=cutoff).order_by('updated_at', 'id'))
+
+    def test_unread_notifications(self):
+        self.assertUsesIndex(Notification.objects.filter(user=self.users[5], is_read=False).order_by('-created_at'))
+
+    def test_user_session_lookup(self):
+        self.assertUsesIndex(UserSession.objects.filter(user=self.users[7], mission=self.mission))
+
+    def test_marketplace_listing(self):
+        self.assertUsesIndex(Product.objects.filter(is_available=True).order_by('-created_at'))
+
+
+class ProfileFragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pw')
+        cls.other = User.objects.create_user('stranger')
+        cls.product = Product.objects.create(seller=cls.other, name='p', description='d', price=1)
+        cls.own_product = Product.objects.create(seller=cls.owner, name='own', description='d', price=1)
+        cls.bought = Purchase.objects.create(product=cls.product, buyer=cls.owner, seller=cls.other, total_price=1)
+        cls.sold = Purchase.objects.create(product=cls.own_product, buyer=cls.other, seller=cls.owner, total_price=1)
+        # Achat entre tiers : ne doit apparaître dans aucun fragment du propriétaire
+        cls.foreign = Purchase.objects.create(product=cls.product, buyer=User.objects.create_user('third'), seller=cls.other, total_price=1)
+        badges = [Badge.objects.create(name=f'b{i}', description='d', condition='c') for i in range(2)]
+        cls.badge = UserBadge.objects.create(user=cls.owner.profile, badge=badges[0])
+        UserBadge.objects.create(user=cls.other.profile, badge=badges[1])
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def fragment(self, name, template, key, **params):
+        response = self.client.get(f'/profile/{name}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, template)
+        return [row.pk for row in response.context[key]], response
+
+    def test_fragments_render_only_the_owner_rows(self):
+        self.assertEqual(self.fragment('purchases', 'partials/profile_purchases.html', 'my_purchases')[0], [self.bought.pk])
+        self.assertEqual(self.fragment('sales', 'partials/profile_sales.html', 'my_sales')[0], [self.sold.pk])
+        self.assertEqual(self.fragment('badges', 'partials/profile_badges.html', 'user_badges')[0], [self.badge.pk])
+
+    def test_next_page_follows_the_cursor(self):
+        extra = [
+            Purchase.objects.create(product=self.product, buyer=self.owner, seller=self.other, total_price=1).pk
+            for _ in range(20)
+        ]
+        first, response = self.fragment('purchases', 'partials/profile_purchases.html', 'my_purchases')
+        self.assertEqual(len(first), 20)
+        self.assertContains(response, 'load-more')
+        second, _ = self.fragment('purchases', 'partials/profile_purchases.html', 'my_purchases', after=response.context['next_purchases'])
+        self.assertCountEqual(first + second, extra + [self.bought.pk])
+
+    def test_fragments_require_login(self):
+        self.client.logout()
+        for name in ('purchases', 'sales', 'badges'):
+            self.assertEqual(self.client.get(f'/profile/{name}/').status_code, 302)
+
+
+class ModerationQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('proof-owner')
+        mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile', reward=2)
+        session = UserSession.objects.create(user=user, mission=mission)
+        cls.proofs = Proof.objects.bulk_create([Proof(session=session, photo='proofs/x.jpg', location='x') for _ in range(5)])
+        cls.alice = User.objects.create_user('alice', is_staff=True)
+        cls.bob = User.objects.create_user('bob', is_staff=True)
+
+    def test_moderators_receive_disjoint_batches(self):
+        first = {proof.id for proof in moderation.claim_batch(self.alice, 3)}
+        second = {proof.id for proof in moderation.claim_batch(self.bob, 3)}
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(first & second)
+
+    def test_expired_lease_returns_to_queue(self):
+        moderation.claim_batch(self.alice, 5)
+        Proof.objects.update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(moderation.claim_batch(self.bob, 5)), 5)
+
+    def test_review_requires_a_valid_lease(self):
+        proof = moderation.claim_batch(self.alice, 1)[0]
+        with self.assertRaises(moderation.ModerationError):
+            moderation.review_proof(proof.id, 'validated', moderator=self.bob)
+        moderation.review_proof(proof.id, 'validated', moderator=self.alice)
+        self.assertEqual(UserProfile.objects.get(user__username='proof-owner').solde, 2)
+        with self.assertRaises(moderation.ModerationError):
+            moderation.review_proof(proof.id, 'validated', moderator=self.alice)
+
+
+def image_bytes(size=(400, 400), blank=False, taken_at=None, gps=None):
+    image = Image.new('RGB', size, 'white') if blank else Image.effect_noise(size, 64).convert('RGB')
+    exif = Image.Exif()
+    if taken_at:
+        exif[306] = taken_at
+    if gps:
+        exif.get_ifd(0x8825).update({1: 'N', 2: (gps[0], 0.0, 0.0), 3: 'E', 4: (gps[1], 0.0, 0.0)})
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+class ProofScreeningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('screened')
+        mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile')
+        cls.session = UserSession.objects.create(user=user, mission=mission)
+        [cls.proof] = Proof.objects.bulk_create([Proof(session=cls.session, photo='proofs/x.jpg', location='48.0, 2.0')])
+
+    def flags(self, data):
+        return screening.assess(self.proof, analyze_image(data))[1]
+
+    def test_clean_photo_only_lacks_exif(self):
+        self.assertEqual(self.flags(image_bytes()), ['no_exif'])
+
+    def test_image_checks(self):
+        self.assertIn('blank', self.flags(image_bytes(blank=True)))
+        self.assertIn('too_small', self.flags(image_bytes(size=(120, 300))))
+        self.assertEqual(self.flags(b'not an image'), ['unreadable'])
+
+    def test_duplicate_hash(self):
+        data = image_bytes()
+        Proof.objects.filter(pk=self.proof.pk).update(photo_hash=analyze_image(data)['sha256'])
+        other = Proof.objects.bulk_create([Proof(session=self.session, photo='proofs/y.jpg', location='x')])[0]
+        self.assertIn('duplicate', screening.assess(other, analyze_image(data))[1])
+
+    def test_near_duplicate_from_another_user_goes_to_moderation(self):
+        analysis = analyze_image(image_bytes())
+        Proof.objects.filter(pk=self.proof.pk).update(photo_hash=analysis['sha256'], photo_dhash=analysis['dhash'])
+        # Même empreinte perceptuelle, fichier différent (recadrage, recompression...)
+        near = {**analysis, 'sha256': '0' * 64}
+
+        session = UserSession.objects.create(user=User.objects.create_user('copycat'), mission=self.session.mission)
+        [other] = Proof.objects.bulk_create([Proof(session=session, photo='proofs/z.jpg', location='x')])
+        score = screening.apply_screening(other.pk, near)
+        other.refresh_from_db()
+        self.assertEqual(other.risk_flags, ['similar', 'no_exif'])
+        self.assertAlmostEqual(score, 0.5)
+        self.assertEqual(other.status, 'pending')
+
+    def test_exif_date_and_gps(self):
+        score, flags, taken_at = screening.assess(self.proof, analyze_image(image_bytes(taken_at='2001:02:03 04:05:06', gps=(45.0, 5.0))))
+        self.assertEqual(flags, ['taken_before_session', 'gps_mismatch'])
+        self.assertEqual(taken_at.year, 2001)
+        self.assertAlmostEqual(score, 0.8)
+        self.assertEqual(self.flags(image_bytes(taken_at=timezone.localtime().strftime('%Y:%m:%d %H:%M:%S'), gps=(48.0, 2.0))), [])
+
+    def test_worker_failure_is_logged(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker killed'))
+        executor = screening._executor = object()
+        with self.assertLogs('missions.screening', 'ERROR'):
+            screening._on_done(self.proof.pk, future, executor)
+        self.assertIsNone(screening._executor)
+        self.assertIsNone(Proof.objects.get(pk=self.proof.pk).screened_at)
+
+
+class GeohashTests(SimpleTestCase):
+    def test_encode_known_value(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_cover_contains_every_point_within_radius(self):
+        rng = random.Random(42)
+        for _ in range(200):
+            lat, lon = rng.uniform(-70, 70), rng.uniform(-179, 179)
+            radius = rng.choice([0.05, 0.5, 3, 20, 120])
+            cells = geo.cover(lat, lon, radius)
+            # Point à distance `radius` dans une direction aléatoire
+            bearing = rng.uniform(0, 2 * math.pi)
+            dlat = math.degrees(radius * 0.999 / geo.EARTH_RADIUS_KM) * math.cos(bearing)
+            dlon = math.degrees(radius * 0.999 / geo.EARTH_RADIUS_KM) * math.sin(bearing) / math.cos(math.radians(lat))
+            point = geo.encode(lat + dlat, lon + dlon)
+            self.assertTrue(any(point.startswith(cell) for cell in cells), (lat, lon, radius))
+
+    def test_prefix_range_upper_bound(self):
+        self.assertEqual(geo._successor('u09t'), 'u09u')
+        self.assertEqual(geo._successor('u0zz'), 'u1')
+        self.assertIsNone(geo._successor('zz'))
+
+
+class NearbyMissionsTests(QueryPlanAssertions, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def mission(title, lat, lon):
+            return Mission.objects.create(title=title, description='d', category='sport', difficulty='facile', latitude=lat, longitude=lon)
+        cls.louvre = mission('louvre', 48.8606, 2.3376)
+        cls.eiffel = mission('eiffel', 48.8584, 2.2945)
+        cls.lyon = mission('lyon', 45.7640, 4.8357)
+        mission('sans position', None, None)
+
+    def test_geohash_is_filled_on_save(self):
+        self.assertEqual(self.louvre.geohash, geo.encode(48.8606, 2.3376))
+
+    def test_nearby_returns_missions_within_radius_sorted_by_distance(self):
+        missions = geo.nearby(Mission.objects.all(), 48.8566, 2.3522, 5)
+        self.assertEqual([m.title for m in missions], ['louvre', 'eiffel'])
+        self.assertLess(missions[0].distance_km, missions[1].distance_km)
+
+    def test_nearby_query_uses_geohash_index(self):
+        queryset = Mission.objects.filter(geo.prefix_q(geo.cover(48.8566, 2.3522, 5)))
+        self.assertUsesIndex(queryset)
+
+
+class MissionQuotaTests(TestCase):
+    def mission(self, **kwargs):
+        return Mission.objects.create(title='quota', description='d', category='sport', difficulty='facile', **kwargs)
+
+    def test_capacity_is_never_exceeded(self):
+        mission = self.mission(capacity=2)
+        self.assertEqual([quotas.reserve_slot(mission) for _ in range(3)], [True, True, False])
+        self.assertEqual(quotas.participant_total(mission), 2)
+
+    def test_sharded_counter_honours_total_capacity(self):
+        mission = self.mission(capacity=7, counter_shards=3)
+        self.assertEqual(sum(quotas.reserve_slot(mission) for _ in range(10)), 7)
+        self.assertEqual(quotas.participant_total(mission), 7)
+
+    def test_reconcile_resyncs_from_sessions(self):
+        mission = self.mission(capacity=5, counter_shards=2)
+        for i in range(3):
+            UserSession.objects.create(user=User.objects.create_user(f'quota{i}'), mission=mission)
+        self.assertEqual(quotas.reconcile(mission), 3)
+        self.assertEqual(quotas.participant_total(mission), 3)
+        self.assertEqual(Mission.objects.get(pk=mission.pk).participant_count, 3)
+
+    def test_double_submit_keeps_one_session_and_one_slot(self):
+        mission = self.mission(capacity=5)
+        user = User.objects.create_user('double-click')
+        self.client.force_login(user)
+        self.client.post(reverse('choose_mission', args=[mission.pk]))
+        # Le second envoi a passé le test d'existence avant le commit du premier
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            response = self.client.post(reverse('choose_mission', args=[mission.pk]))
+        self.assertRedirects(response, reverse('mission_detail', args=[mission.pk]), fetch_redirect_response=False)
+        self.assertEqual(UserSession.objects.filter(user=user, mission=mission).count(), 1)
+        self.assertEqual(quotas.participant_total(mission), 1)
+
+    def test_saving_an_inactive_mission_keeps_its_counter(self):
+        # Sessions archivées : le compteur dépasse les UserSession restantes
+        mission = self.mission(is_active=False)
+        Mission.objects.filter(pk=mission.pk).update(participant_count=4)
+        mission.refresh_from_db()
+        mission.title = 'renamed'
+        mission.save()
+        self.assertEqual(Mission.objects.get(pk=mission.pk).participant_count, 4)
+
+
+@override_settings(THROTTLE_BUCKETS={'auth': ('1/min', 2), 'auth_endpoint': ('100/s', 100)})
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.local_blocklist = throttling.LocalBlocklist()
+
+    def test_burst_then_refill(self):
+        now = 1000.0
+        self.assertEqual([throttling.consume('t', 1.0, 3, now) for _ in range(3)], [None] * 3)
+        self.assertAlmostEqual(throttling.consume('t', 1.0, 3, now), 1.0)
+        self.assertIsNone(throttling.consume('t', 1.0, 3, now + 1.5))
+
+    def test_tokens_do_not_accumulate_beyond_burst(self):
+        throttling.consume('t', 1.0, 2, 1000.0)
+        results = [throttling.consume('t', 1.0, 2, 2000.0) for _ in range(3)]
+        self.assertEqual(results[:2], [None, None])
+        self.assertIsNotNone(results[2])
+
+    @override_settings(THROTTLE_BUCKETS={'auth': ('1/min', 2), 'auth_endpoint': ('1/min', 3)})
+    def test_one_client_cannot_drain_the_shared_bucket(self):
+        statuses = [self.client.post('/login/', {'username': 'x', 'password': 'y'}).status_code for _ in range(10)]
+        self.assertEqual(statuses.count(429), 8)
+        other = self.client.post('/login/', {'username': 'x', 'password': 'y'}, REMOTE_ADDR='10.0.0.2')
+        self.assertNotEqual(other.status_code, 429)
+
+    @override_settings(THROTTLE_BUCKETS={'a': ('1/min', 5), 'b': ('1/min', 1)})
+    def test_denied_request_consumes_no_tokens(self):
+        request = RequestFactory().post('/')
+        rules = (('a', 'ip'), ('b', 'endpoint'))
+        self.assertIsNone(throttling.check(request, rules))
+        self.assertIsNotNone(throttling.check(request, rules))
+        self.assertEqual(cache.get('tb:a:ip:127.0.0.1:n'), 1)
+        self.assertEqual(cache.get('tb:b:endpoint:n'), 1)
+
+    def test_login_returns_429_with_retry_after(self):
+        statuses = [self.client.post('/login/', {'username': 'x', 'password': 'y'}).status_code for _ in range(3)]
+        self.assertEqual(statuses[2], 429)
+        response = self.client.post('/login/', {'username': 'x', 'password': 'y'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+
+class RendererTests(SimpleTestCase):
+    def test_orjson_output_matches_stock_renderer(self):
+        data = {
+            'reward': Decimal('1.2500000'),
+            'created_at': timezone.now(),
+            'missions': [{'id': 1, 'title': 'Été', 'latitude': 48.85}],
+            'empty': None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    def respond(self, payload, accept_encoding='gzip, deflate'):
+        middleware = CompressionMiddleware(lambda request: JsonResponse(payload, safe=False))
+        return middleware(RequestFactory().get('/api/missions/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_large_json_is_gzipped(self):
+        payload = [{'title': 'mission', 'reward': '1.0000000'}] * 200
+        response = self.respond(payload)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), JsonResponse(payload, safe=False).content)
+
+    def test_small_or_unaccepted_responses_are_untouched(self):
+        self.assertFalse(self.respond({'ok': True}).has_header('Content-Encoding'))
+        self.assertFalse(self.respond([{'title': 'mission'}] * 200, 'identity').has_header('Content-Encoding'))
+
+
+class UserMissionListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('lean', password='pw')
+        self.missions = [
+            Mission.objects.create(title=f'm{i}', description='d', category='sport', difficulty='facile', reward='1.5')
+            for i in range(5)
+        ]
+        UserMission.objects.bulk_create([UserMission(user=self.user.profile, mission=m) for m in self.missions])
+        self.client.force_login(self.user)
+
+    def test_list_is_one_query_with_user_in_envelope(self):
+        self.client.get('/api/user-missions/')  # réchauffe la session
+        with self.assertNumQueries(3):  # session, utilisateur + profil, missions
+            data = self.client.get('/api/user-missions/?expand=mission', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(data['user']['user']['username'], 'lean')
+        self.assertEqual(len(data['results']), 5)
+        mission = Mission.objects.get(pk=data['results'][0]['mission']['id'])
+        self.assertEqual(data['results'][0]['mission'], MissionSerializer(mission).data)
+
+    def test_mission_is_an_id_unless_expanded(self):
+        data = self.client.get('/api/user-missions/', HTTP_ACCEPT='application/json').json()
+        self.assertCountEqual([row['mission'] for row in data['results']], [m.pk for m in self.missions])
+
+
+
+class CompleteMissionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('finisher', password='pw')
+        self.mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile', reward='2.5')
+        self.client.force_login(self.user)
+
+    def complete(self, mission_id=None):
+        return self.client.post('/api/user-missions/complete_mission/', {'mission_id': mission_id or self.mission.pk},
+                                content_type='application/json', HTTP_ACCEPT='application/json')
+
+    def test_started_mission_is_completed_and_credited_once(self):
+        started = UserMission.objects.create(user=self.user.profile, mission=self.mission)
+        response = self.complete()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()['new_balance']), Decimal('2.5'))
+        self.assertEqual(self.complete().status_code, 400)
+
+        user_mission = UserMission.objects.get()
+        self.assertEqual((user_mission.pk, user_mission.status), (started.pk, 'termine'))
+        self.assertIsNotNone(user_mission.completed_at)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.solde, profile.score), (Decimal('2.5'), Decimal('2.5')))
+        self.assertEqual(Score.objects.filter(user=self.user).count(), 1)
+
+    def test_completion_without_participation_in_few_queries(self):
+        self.client.get('/api/user-missions/')  # réchauffe la session
+        # session, utilisateur + profil, mission, transaction (2), upsert, crédit du profil, classement (2)
+        with self.assertNumQueries(9):
+            self.assertEqual(self.complete().status_code, 200)
+        self.assertEqual(UserMission.objects.get().status, 'termine')
+
+    def test_inactive_mission_is_not_found(self):
+        Mission.objects.filter(pk=self.mission.pk).update(is_active=False)
+        self.assertEqual(self.complete().status_code, 404)
+        self.assertFalse(UserMission.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', "Concurrence réelle : verrous de ligne PostgreSQL")
+class ConcurrentCompleteMissionTests(TransactionTestCase):
+    threads = 8
+
+    def test_concurrent_completions_credit_once(self):
+        user = User.objects.create_user('racer', password='pw')
+        mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile', reward='2.5')
+        clients = []
+        for _ in range(self.threads):
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def complete(client):
+            try:
+                barrier.wait()
+                response = client.post('/api/user-missions/complete_mission/', {'mission_id': mission.pk},
+                                       content_type='application/json', HTTP_ACCEPT='application/json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=complete, args=(client,)) for client in clients]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(sorted(statuses), [200] + [400] * (self.threads - 1))
+        self.assertEqual(list(UserMission.objects.values_list('status', flat=True)), ['termine'])
+        self.assertEqual(Score.objects.filter(user=user).count(), 1)
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((profile.solde, profile.score), (Decimal('2.5'), Decimal('2.5')))
+        self.assertEqual(set(LeaderboardBucket.objects.filter(user=user).values_list('points', flat=True)), {Decimal('2.5')})
+
+
+class PaginationAndFieldsetTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('sparse', password='pw')
+        self.missions = [
+            Mission.objects.create(title=f'm{i}', description='d', category='sport', difficulty='facile') for i in range(5)
+        ]
+        self.client.force_login(user)
+
+    def test_missions_are_cursor_paginated(self):
+        seen, url = [], '/api/missions/?page_size=2'
+        while url:
+            data = self.client.get(url, HTTP_ACCEPT='application/json').json()
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, sorted((m.pk for m in self.missions), reverse=True))
+
+    def test_by_category_is_paginated_and_requires_the_category(self):
+        data = self.client.get('/api/missions/by_category/?category=sport', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(set(data), {'next', 'previous', 'results'})
+        self.assertEqual(len(data['results']), 5)
+        response = self.client.get('/api/missions/by_category/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+    def test_fields_narrow_output_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/missions/?fields=id,title', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(set(data['results'][0]), {'id', 'title'})
+        sql = queries[-1]['sql']
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"description"', sql)
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sync', password='pw')
+        self.mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile')
+        self.client.force_login(self.user)
+
+    def sync(self, token=None):
+        params = {'since': token} if token else {}
+        return self.client.get('/api/sync/', params, HTTP_ACCEPT='application/json').json()
+
+    def test_full_then_delta_with_tombstones(self):
+        user_mission = UserMission.objects.create(user=self.user.profile, mission=self.mission)
+        full = self.sync()
+        self.assertTrue(full['full'])
+        self.assertEqual(full['profile'], {k: v for k, v in UserProfileSerializer(self.user.profile).data.items() if k != 'user'})
+        self.assertEqual([row['id'] for row in full['user_missions']], [user_mission.pk])
+
+        UserMission.objects.filter(pk=user_mission.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        Mission.objects.filter(pk=self.mission.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        notification = Notification.objects.create(user=self.user, message='hello')
+        deleted_id = user_mission.pk
+        user_mission.delete()
+        delta = self.sync(full['token'])
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['missions'], [])
+        self.assertEqual([row['id'] for row in delta['notifications']], [notification.pk])
+        self.assertEqual(delta['deleted'], {'user_missions': [deleted_id]})
+
+    def test_token_of_another_user_forces_full_sync(self):
+        other = User.objects.create_user('other')
+        token = sync.make_token(other, timezone.now())
+        self.assertTrue(self.sync(token)['full'])
+        self.assertTrue(self.sync('garbage')['full'])
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_identical_uploads_are_stored_once_and_refcounted(self):
+        first = default_storage.save('proofs/WIN_2024.JPG', ContentFile(b'same bytes'))
+        second = default_storage.save('proofs/other.jpg', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^proofs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(MediaBlob.objects.get(name=first).refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(first)
+        self.assertTrue(default_storage.exists(first))
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(first)
+        self.assertFalse(default_storage.exists(first))
+        self.assertFalse(MediaBlob.objects.filter(name=first).exists())
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, MEDIA_ACCEL_REDIRECT='')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user('owner')
+        mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile')
+        session = UserSession.objects.create(user=self.owner, mission=mission)
+        self.data = bytes(range(256)) * 8
+        self.proof = Proof.objects.create(session=session, photo=SimpleUploadedFile('p.jpg', self.data), location='x')
+        self.url = self.proof.photo.url
+
+    def test_proof_photos_are_private(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(User.objects.create_user('stranger'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_range_and_conditional_requests(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-').status_code, 416)
+
+    def test_accel_redirect_hands_off_transfer(self):
+        self.client.force_login(self.owner)
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.proof.photo.name)
+        self.assertEqual(response.content, b'')
+
+
+class AuditLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer')
+        cls.seller = User.objects.create_user('seller')
+        cls.product = Product.objects.create(seller=cls.seller, name='p', description='d', price=1)
+
+    def purchase(self, status='awaiting_payment'):
+        return Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller, total_price=1, status=status)
+
+    def test_transition_is_recorded_with_actor_and_fields(self):
+        purchase = self.purchase()
+        self.assertTrue(transition_purchase(purchase, 'awaiting_payment', 'in_escrow', actor=self.seller, pi_payment_id='pay-1'))
+        self.assertFalse(transition_purchase(purchase, 'awaiting_payment', 'in_escrow'))
+        [event] = audit.history('purchase', purchase.pk)
+        self.assertEqual((event.action, event.source, event.target, event.actor_id), ('status', 'awaiting_payment', 'in_escrow', self.seller.pk))
+        self.assertEqual(event.data, {'pi_payment_id': 'pay-1'})
+
+    def test_bulk_transition_writes_events_in_one_insert(self):
+        ids = [self.purchase().pk for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            bulk_transition(Purchase.objects.filter(pk__in=ids), 'awaiting_payment', 'cancelled', reason='unpaid')
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith(f'INSERT INTO "{AuditEvent._meta.db_table}"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(sorted(AuditEvent.objects.filter(data__reason='unpaid').values_list('entity_id', flat=True)), ids)
+
+    def test_rolled_back_transition_leaves_no_event(self):
+        purchase = self.purchase()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            transition_purchase(purchase, 'awaiting_payment', 'in_escrow')
+            raise RuntimeError
+        self.assertFalse(audit.history('purchase', purchase.pk).exists())
+
+    def test_moderation_decision_is_recorded(self):
+        mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile', reward=2)
+        proof = Proof.objects.create(session=UserSession.objects.create(user=self.buyer, mission=mission), photo='proofs/x.jpg', location='x')
+        moderation.review_proof(proof.pk, 'rejected', moderator=self.seller, reason='floue', require_claim=False)
+        [event] = audit.history('proof', proof.pk)
+        self.assertEqual((event.target, event.actor_id, event.data), ('rejected', self.seller.pk, {'reason': 'floue'}))
+
+    def test_events_are_append_only(self):
+        [event] = audit.record('purchase', 1, 'payout', amount=Decimal('0.9500000'))
+        self.assertEqual(AuditEvent.objects.get(pk=event.pk).data, {'amount': '0.9500000'})
+        with self.assertRaises(ValueError):
+            event.save()
+        with self.assertRaises(ValueError):
+            event.delete()
+
+    def test_pruning_without_partitions(self):
+        audit.write([
+            AuditEvent(entity_type='purchase', entity_id=1, action='status', created_at=timezone.now() - timedelta(days=800)),
+            AuditEvent(entity_type='purchase', entity_id=1, action='status'),
+        ])
+        call_command('audit_partitions', stdout=io.StringIO())
+        self.assertEqual(AuditEvent.objects.count(), 1)
+
+
+class ColdArchiveTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        override = override_settings(ARCHIVE_ROOT=root.name, ARCHIVE_NOTIFICATION_DAYS=90, ARCHIVE_SESSION_DAYS=180)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('archived')
+        self.old = timezone.now() - timedelta(days=365)
+
+    def test_read_notifications_are_archived_and_restorable(self):
+        archived = Notification.objects.create(user=self.user, message='vieille', is_read=True)
+        unread = Notification.objects.create(user=self.user, message='non lue')
+        recent = Notification.objects.create(user=self.user, message='récente', is_read=True)
+        Notification.objects.filter(pk__in=[archived.pk, unread.pk]).update(created_at=self.old)
+
+        self.assertEqual(archive.archive('notifications', segment_rows=1), (1, 1))
+        self.assertEqual(set(Notification.objects.values_list('id', flat=True)), {unread.pk, recent.pk})
+        segment = ArchiveSegment.objects.get()
+        self.assertEqual((segment.first_id, segment.last_id, segment.rows), (archived.pk, archived.pk, 1))
+
+        rows = archive.lookup('notifications', user_id=self.user.pk)
+        self.assertEqual([row['message'] for row in rows], ['vieille'])
+        self.assertEqual(archive.lookup('notifications', user_id=0), [])
+        self.assertEqual(archive.restore('notifications', rows), 1)
+        self.assertEqual(archive.restore('notifications', rows), 0)
+        self.assertEqual(Notification.objects.get(pk=archived.pk).created_at, self.old)
+
+    def test_only_closed_sessions_of_inactive_missions_are_archived(self):
+        mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile', is_active=False)
+        active = Mission.objects.create(title='a', description='d', category='sport', difficulty='facile')
+        # Sessions telles que l'application les crée (`completed` n'est jamais positionné)
+        closed = UserSession.objects.create(user=self.user, mission=mission)
+        pending = UserSession.objects.create(user=User.objects.create_user('pending'), mission=mission)
+        running = UserSession.objects.create(user=self.user, mission=active)
+        proof = Proof.objects.create(session=closed, photo='proofs/a.jpg', location='x', status='validated', reviewed_at=self.old)
+        Proof.objects.create(session=pending, photo='proofs/b.jpg', location='x')
+        UserSession.objects.update(started_at=self.old)
+        Proof.objects.update(submitted_at=self.old)
+        Mission.objects.filter(pk=mission.pk).update(participant_count=2)
+        notifications = Notification.objects.count()
+
+        self.assertEqual(archive.archive('sessions'), (1, 1))
+        self.assertEqual(set(UserSession.objects.values_list('id', flat=True)), {pending.pk, running.pk})
+        # Suppression sans signaux : ni place libérée, ni notification « preuve supprimée »
+        self.assertEqual(Mission.objects.get(pk=mission.pk).participant_count, 2)
+        self.assertEqual(Notification.objects.count(), notifications)
+
+        [row] = archive.lookup('sessions', object_id=closed.pk)
+        self.assertEqual([p['id'] for p in row['proofs']], [proof.pk])
+        archive.restore('sessions', [row])
+        self.assertEqual(Proof.objects.get(pk=proof.pk).submitted_at, self.old)
+
+        # Une mission désactivée n'accepte plus de participation, session archivée ou non
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(f'/missions/{mission.pk}/choose/').status_code, 404)
+
+
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile', reward=2)
+        cls.users = [User.objects.create_user(f'player{i}') for i in range(3)]
+
+    def test_buckets_are_incremented_per_period(self):
+        a, b, c = self.users
+        leaderboard.award(a.pk, self.mission.pk, Decimal('2'))
+        leaderboard.award(b.pk, self.mission.pk, Decimal('3'))
+        leaderboard.award(a.pk, self.mission.pk, Decimal('1'))
+        leaderboard.award(c.pk, self.mission.pk, Decimal('1'))
+        self.assertEqual(Score.objects.count(), 4)
+        self.assertEqual(LeaderboardBucket.objects.filter(period='week').count(), 3)
+        self.assertEqual([(row['user_id'], row['rank']) for row in leaderboard.top('month')], [(a.pk, 1), (b.pk, 1), (c.pk, 3)])
+        self.assertEqual(leaderboard.rank(c.pk, 'day'), (3, Decimal('1')))
+        self.assertIsNone(leaderboard.rank(User.objects.create_user('idle').pk, 'week'))
+
+    def test_finished_periods_are_frozen(self):
+        a, b, _ = self.users
+        old = timezone.now() - timedelta(days=40)
+        start = leaderboard.period_start('month', timezone.localdate(old))
+        leaderboard.award(a.pk, self.mission.pk, Decimal('1'), at=old)
+        leaderboard.award(b.pk, self.mission.pk, Decimal('5'), at=old)
+        leaderboard.award(a.pk, self.mission.pk, Decimal('1'))
+
+        frozen = leaderboard.freeze()
+        self.assertIn(('month', start), frozen)
+        self.assertFalse(LeaderboardBucket.objects.filter(period_start__lt=leaderboard.period_start('month', timezone.localdate())).exists())
+        self.assertEqual(list(LeaderboardSnapshot.objects.filter(period='month', period_start=start).order_by('rank').values_list('user_id', 'rank')), [(b.pk, 1), (a.pk, 2)])
+        self.assertEqual(leaderboard.rank(a.pk, 'month', start), (2, Decimal('1')))
+        self.assertEqual(leaderboard.rank(a.pk, 'month'), (1, Decimal('1')))
+
+        self.assertEqual(leaderboard.rebuild(timezone.localdate(old)), 3)
+        self.assertEqual(leaderboard.rank(a.pk, 'month'), (1, Decimal('1')))
+
+    def test_validated_proof_scores_and_api(self):
+        user = self.users[0]
+        proof = Proof.objects.create(session=UserSession.objects.create(user=user, mission=self.mission), photo='proofs/x.jpg', location='x')
+        moderation.review_proof(proof.pk, 'validated', require_claim=False)
+        self.client.force_login(user)
+        response = self.client.get('/api/leaderboard/', {'period': 'week'}, HTTP_ACCEPT='application/json').json()
+        self.assertEqual(response['results'][0]['points'], '2.0000000')
+        self.assertEqual(response['me'], {'rank': 1, 'points': '2.0000000'})
+        self.assertEqual(self.client.get('/api/leaderboard/', {'period': 'year'}, HTTP_ACCEPT='application/json').status_code, 400)
+
+
+class BadgeBackfillTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'explorer{i}') for i in range(3)]
+        for index, user in enumerate(cls.users):
+            # explorer0 : 3 catégories, explorer1 : 2, explorer2 : 3
+            for category in ['sport', 'culture', 'nature'][:2 if index == 1 else 3]:
+                mission = Mission.objects.create(title=category, description='d', category=category, difficulty='facile')
+                session = UserSession.objects.create(user=user, mission=mission)
+                Proof.objects.bulk_create([Proof(session=session, photo='proofs/x.jpg', location='x', status='validated')])
+
+    def test_backfill_awards_eligible_users_once_in_chunks(self):
+        badge = Badge.objects.create(name='Explorateur', description='d', condition='3 catégories', reward_value=5, rule='explorer')
+        with self.assertNumQueries(1):
+            eligible = list(badges.eligible(badge))
+        self.assertEqual(eligible, [self.users[0].profile.pk, self.users[2].profile.pk])
+
+        self.assertEqual(list(badges.backfill(badge, chunk_size=1)), [(eligible[0], 1), (eligible[1], 1)])
+        self.assertEqual(list(badges.backfill(badge)), [(eligible[1], 0)])
+        self.assertEqual(set(UserBadge.objects.filter(badge=badge).values_list('user_id', flat=True)), set(eligible))
+        self.assertEqual([UserProfile.objects.get(pk=pk).score for pk in eligible], [5, 5])
+        self.assertEqual(Notification.objects.filter(message__contains='Explorateur').count(), 2)
+        # Reprise après le premier profil
+        UserBadge.objects.filter(badge=badge, user_id=eligible[1]).delete()
+        self.assertEqual(list(badges.backfill(badge, after=eligible[0])), [(eligible[1], 1)])
+
+    def test_validated_proof_awards_badge_through_rules(self):
+        badge = Badge.objects.create(name='Première', description='d', condition='1 preuve', reward_value=1, rule='first_validated_proof')
+        user = User.objects.create_user('newcomer')
+        mission = Mission.objects.create(title='m', description='d', category='sport', difficulty='facile', reward=2)
+        proof = Proof.objects.create(session=UserSession.objects.create(user=user, mission=mission), photo='proofs/x.jpg', location='x')
+        moderation.review_proof(proof.pk, 'validated', require_claim=False)
+        self.assertTrue(UserBadge.objects.filter(badge=badge, user=user.profile).exists())
+        self.assertEqual(UserProfile.objects.get(user=user).score, 3)
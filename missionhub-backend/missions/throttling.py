@@ -0,0 +1,201 @@
+"""
+Limitation de débit par seau à jetons (token bucket).
+
+Chaque seau se remplit au débit soutenu de sa portée et contient au plus
+`rafale` jetons (voir THROTTLE_BUCKETS). Une règle associe une portée à une
+clé : l'utilisateur (à défaut l'IP), l'IP, ou l'endpoint entier (tous clients
+confondus). Un seau d'endpoint est un disjoncteur contre un afflux distribué :
+son débit doit rester très au-dessus du budget d'un client, sinon un seul
+client pourrait bloquer tout le monde.
+
+État partagé : le cache Django (Redis en production). Chaque passage coûte un
+`incr` atomique sur le nombre de jetons consommés depuis une origine ;
+le nombre de jetons disponibles se déduit du temps écoulé. Chemin rapide : un
+client refusé est mémorisé localement jusqu'à son Retry-After, ses requêtes
+suivantes sont rejetées sans aller-retour vers le cache.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from .middleware import request_identity
+
+_PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> 10 / 60 jetons par seconde."""
+    count, period = rate.split('/')
+    return int(count) / _PERIODS[period]
+
+
+class LocalBlocklist:
+    """Clients refusés récemment, par processus (LRU borné)."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._until = OrderedDict()
+        self._lock = threading.Lock()
+
+    def retry_after(self, key, now):
+        with self._lock:
+            until = self._until.get(key)
+            if until is None:
+                return None
+            if until <= now:
+                del self._until[key]
+                return None
+            return until - now
+
+    def block(self, key, until):
+        with self._lock:
+            self._until[key] = until
+            self._until.move_to_end(key)
+            while len(self._until) > self.max_size:
+                self._until.popitem(last=False)
+
+
+local_blocklist = LocalBlocklist()
+
+
+def consume(key, rate, burst, now=None):
+    """
+    Prend un jeton dans le seau `key`. Retourne None si accordé, sinon le
+    délai (secondes) avant qu'un jeton soit disponible.
+    """
+    now = time.time() if now is None else now
+    retry = local_blocklist.retry_after(key, now)
+    if retry is not None:
+        return retry
+
+    # Au-delà de ce délai sans requête, le seau est de toute façon plein : les clés peuvent expirer
+    ttl = math.ceil(burst / rate) + 60
+    origin_key, used_key = f'tb:{key}:t', f'tb:{key}:n'
+    try:
+        used = cache.incr(used_key)
+    except ValueError:
+        # Premier passage (ou seau expiré) : add() tranche entre requêtes concurrentes
+        cache.add(origin_key, now, ttl)
+        used = 1 if cache.add(used_key, 1, ttl) else cache.incr(used_key)
+    origin = cache.get(origin_key)
+    if origin is None:
+        cache.add(origin_key, now, ttl)
+        origin = now
+
+    available = burst + (now - origin) * rate - used
+    if available >= 0:
+        if available + 1 > burst:
+            # Seau plein : on avance l'origine pour que les jetons ne s'accumulent pas au-delà de la rafale
+            cache.set(origin_key, now - (used - 1) / rate, ttl)
+        return None
+
+    # Refus : le jeton n'est pas consommé
+    cache.decr(used_key)
+    retry = -available / rate
+    local_blocklist.block(key, now + retry)
+    return retry
+
+
+def _client_ip(request):
+    return BaseThrottle().get_ident(request)
+
+
+def rule_key(request, scope, kind, user_id=None):
+    if kind == 'endpoint':
+        return f'{scope}:endpoint'
+    if kind == 'user':
+        user_id = user_id or request_identity(request)
+        if user_id is not None:
+            return f'{scope}:user:{user_id}'
+    return f'{scope}:ip:{_client_ip(request)}'
+
+
+def refund(key):
+    """Rend un jeton pris dans le seau `key`."""
+    try:
+        cache.decr(f'tb:{key}:n')
+    except ValueError:
+        # Seau expiré entre-temps : il est de toute façon plein
+        pass
+
+
+def check(request, rules, user_id=None):
+    """
+    Applique les règles (portée, clé) dans l'ordre ; retourne None ou le
+    Retry-After de la première qui refuse. Une requête refusée ne consomme rien :
+    on s'arrête au premier refus et les jetons déjà pris sont rendus. Les règles
+    par client passent donc avant les plafonds d'endpoint : un client au-delà de
+    son propre débit n'entame pas le seau partagé.
+    """
+    buckets = getattr(settings, 'THROTTLE_BUCKETS', {})
+    now = time.time()
+    taken = []
+    for scope, kind in rules:
+        rate, burst = buckets[scope]
+        key = rule_key(request, scope, kind, user_id)
+        wait = consume(key, parse_rate(rate), burst, now)
+        if wait is not None:
+            for previous in taken:
+                refund(previous)
+            return wait
+        taken.append(key)
+    return None
+
+
+def too_many_requests(retry):
+    response = JsonResponse({'error': 'Trop de requêtes, réessayez plus tard.'}, status=429)
+    response['Retry-After'] = str(math.ceil(retry))
+    return response
+
+
+def throttle(*rules, methods=('POST',)):
+    """
+    Décorateur pour les vues Django (synchrones ou asynchrones).
+    Seules les requêtes `methods` sont limitées ; répond 429 avec Retry-After.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    retry = await sync_to_async(check)(request, rules)
+                    if retry is not None:
+                        return too_many_requests(retry)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    retry = check(request, rules)
+                    if retry is not None:
+                        return too_many_requests(retry)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class BucketThrottle(BaseThrottle):
+    """Throttle DRF ; DRF ajoute l'en-tête Retry-After à partir de wait()."""
+    rules = ()
+
+    def allow_request(self, request, view):
+        user = getattr(request, 'user', None)
+        user_id = str(user.pk) if user is not None and user.is_authenticated else None
+        self.retry = check(request, self.rules, user_id)
+        return self.retry is None
+
+    def wait(self):
+        return self.retry
+
+
+class AuthThrottle(BucketThrottle):
+    """Connexion, inscription et jetons JWT : par IP, puis disjoncteur global."""
+    rules = (('auth', 'ip'), ('auth_endpoint', 'endpoint'))
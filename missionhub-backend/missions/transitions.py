@@ -0,0 +1,132 @@
+"""
+Machine à états des achats (Purchase.status).
+
+Chaque transition est appliquée par un unique UPDATE conditionnel
+(`... WHERE id = ? AND status = ?`) : aucune relecture préalable n'est
+nécessaire et deux traitements concurrents (webhooks Pi, actions admin,
+clics multiples) ne peuvent jamais appliquer la même transition deux fois.
+Le signal `purchase_transitioned` est émis après commit ; l'événement d'audit
+(missions/audit.py) est écrit dans la même transaction que l'UPDATE.
+"""
+from django.db import connections, router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import audit
+from .models import Purchase
+
+PURCHASE_TRANSITIONS = {
+    'awaiting_payment': {'processing', 'in_escrow', 'cancelled', 'disputed'},
+    # Réservé par le webhook Pi avant tout appel : ignoré par l'annulation des impayés
+    'processing': {'in_escrow', 'cancelled', 'disputed'},
+    'in_escrow': {'shipped', 'disputed'},
+    'shipped': {'completed', 'disputed'},
+    'disputed': {'completed', 'cancelled'},
+    # Paiement du vendeur en échec après la finalisation (run_escrow_scheduler)
+    'completed': {'disputed'},
+    'cancelled': set(),
+}
+
+# Arguments : purchase_ids (liste), source, target
+purchase_transitioned = Signal()
+
+
+class IllegalTransition(Exception):
+    pass
+
+
+def check_transition(source, target):
+    if target not in PURCHASE_TRANSITIONS.get(source, ()):
+        raise IllegalTransition(f"Transition interdite : {source} -> {target}")
+
+
+def _values(target, fields):
+    return {'status': target, 'updated_at': timezone.now(), **fields}
+
+
+def _emit(ids, source, target, using):
+    transaction.on_commit(
+        lambda: purchase_transitioned.send(sender=Purchase, purchase_ids=ids, source=source, target=target),
+        using=using,
+    )
+
+
+def _audit(ids, source, target, actor, reason, fields):
+    audit.record('purchase', ids, 'status', source=source, target=target, actor=actor, reason=reason, **fields)
+
+
+def transition_purchase(purchase, source, target, actor=None, reason=None, **fields):
+    """
+    Fait passer un achat (instance ou id) de `source` à `target`.
+
+    `fields` permet de mettre à jour d'autres colonnes dans le même UPDATE
+    (ex. pi_payment_id). `actor` et `reason` ne vont qu'au journal d'audit.
+    Retourne False si l'achat n'était plus dans l'état `source` ; lève
+    IllegalTransition si la transition n'est pas permise.
+    """
+    check_transition(source, target)
+    pk = purchase.pk if isinstance(purchase, Purchase) else purchase
+    values = _values(target, fields)
+    using = router.db_for_write(Purchase)
+    with transaction.atomic(using=using):
+        changed = Purchase.objects.using(using).filter(pk=pk, status=source).update(**values)
+        if not changed:
+            return False
+        _audit([pk], source, target, actor, reason, fields)
+    if isinstance(purchase, Purchase):
+        for name, value in values.items():
+            setattr(purchase, name, value)
+    _emit([pk], source, target, using)
+    return True
+
+
+def bulk_transition(queryset, source, target, actor=None, reason=None, **fields):
+    """
+    Applique la transition à tous les achats du queryset encore dans l'état `source`.
+
+    Un seul UPDATE ... RETURNING (PostgreSQL, SQLite >= 3.35), sinon verrouillage
+    puis relecture des statuts ; retourne dans les deux cas la liste des ids
+    effectivement modifiés.
+    """
+    check_transition(source, target)
+    values = _values(target, fields)
+    using = router.db_for_write(Purchase)
+    connection = connections[using]
+    queryset = queryset.using(using)
+    if not queryset.query.is_sliced:
+        # Un queryset découpé (lots) doit être filtré par l'appelant avant le slice ;
+        # la condition sur le statut est de toute façon revérifiée par l'UPDATE.
+        queryset = queryset.filter(status=source).order_by()
+
+    with transaction.atomic(using=using):
+        if connection.features.can_return_columns_from_insert:
+            meta = Purchase._meta
+            qn = connection.ops.quote_name
+            assignments, params = [], []
+            for name, value in values.items():
+                field = meta.get_field(name)
+                assignments.append(f"{qn(field.column)} = %s")
+                params.append(field.get_db_prep_save(value, connection))
+            subquery, sub_params = queryset.values('pk').query.get_compiler(using=using).as_sql()
+            sql = (
+                f"UPDATE {qn(meta.db_table)} SET {', '.join(assignments)} "
+                f"WHERE {qn('status')} = %s AND {qn(meta.pk.column)} IN ({subquery}) "
+                f"RETURNING {qn(meta.pk.column)}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [*params, source, *sub_params])
+                ids = [row[0] for row in cursor.fetchall()]
+        else:
+            locked = list(queryset.select_for_update(skip_locked=True).values_list('pk', flat=True))
+            # Relecture des lignes verrouillées : seules celles encore dans l'état
+            # `source` sont modifiées, et ce sont exactement les ids retournés.
+            ids = list(
+                Purchase.objects.using(using).filter(pk__in=locked, status=source).values_list('pk', flat=True)
+            )
+            Purchase.objects.using(using).filter(pk__in=ids).update(**values)
+        if ids:
+            _audit(ids, source, target, actor, reason, fields)
+
+    if ids:
+        _emit(ids, source, target, using)
+    return ids
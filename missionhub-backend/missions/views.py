@@ -3,16 +3,22 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from .models import UserProfile, Mission, UserMission, Badge, UserSession, Proof, Notification, ProofForm, ProofEditForm, UserBadge, Product, ProductForm, Purchase
+from .middleware import get_profile
 from .serializers import (
     UserProfileSerializer, MissionSerializer, UserMissionSerializer,
-    CompleteMissionSerializer, RegisterSerializer, UserBadgeSerializer
+    CompleteMissionSerializer, RegisterSerializer, UserBadgeSerializer, CustomTokenObtainPairSerializer,
+    ModerationProofSerializer, ProofReviewSerializer, requested_fields, sparse_columns, values_fields, values_row
 )
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.http import JsonResponse, HttpResponseForbidden
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from django.http import Http404, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import login
@@ -21,102 +27,257 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 import requests
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from decimal import Decimal
+from django.views.decorators.http import require_POST, require_safe
+from django.middleware.csrf import CsrfViewMiddleware
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import httpx
+import json
+import logging
+from . import audit, geo, leaderboard, media, pi_client, sync
+from .events import decode_cursor, stream_events
+from .transitions import transition_purchase
+from .quotas import reserve_slot
+from .throttling import AuthThrottle, throttle
+from .screening import schedule_screening
+from .moderation import ModerationError, claim_batch, moderation_stats, release_claims, review_proof
+from .authentication import CachedJWTAuthentication, invalidate_principal
+
+logger = logging.getLogger(__name__)
 
 
 
 # Create your views here.
 class CustomTokenObtainPairView(TokenObtainPairView):
-    serializer_class = TokenObtainPairSerializer
+    # Ajoute le claim `pseudo`, utilisé par CachedJWTAuthentication
+    serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [AuthThrottle]
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class SparseFieldsetViewMixin:
+    """
+    Avec `?fields=`, restreint aussi les colonnes lues (only()) pour les actions
+    `sparse_actions`, si tous les champs demandés sont des colonnes simples.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.sparse_actions and requested_fields(self.request):
+            columns = sparse_columns(self.get_serializer())
+            if columns is not None:
+                queryset = queryset.select_related(None).only(*columns)
+        return queryset
+
+
+class UserProfileViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        return UserProfile.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
 
-class MissionViewSet(viewsets.ReadOnlyModelViewSet):
+class MissionViewSet(SparseFieldsetViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Mission.objects.filter(is_active=True)
     serializer_class = MissionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    sparse_actions = ('list', 'retrieve', 'by_category')
 
     @action(detail=False, methods=['get'])
     def by_category(self, request):
         category = request.query_params.get('category')
-        if category:
-            missions = Mission.objects.filter(category=category, is_active=True)           
-            serializer = self.get_serializer(missions, many=True)
-            return Response(serializer.data)
-        return Response([])
+        if not category:
+            return Response({'error': 'Paramètre category requis.'}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(self.get_queryset().filter(category=category))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-class UserMissionViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Missions à moins de `radius` km (5 par défaut, 50 au plus) de `lat`, `lon`,
+        les plus proches d'abord. Non paginé : 100 résultats au plus, triés par distance.
+        """
+        try:
+            lat = float(request.query_params['lat'])
+            lon = float(request.query_params['lon'])
+            radius = min(float(request.query_params.get('radius', 5)), 50)
+        except (KeyError, ValueError):
+            return Response({'error': 'Paramètres lat et lon requis.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180 and radius > 0):
+            return Response({'error': 'Coordonnées invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        missions = geo.nearby(self.get_queryset(), lat, lon, radius, limit=100)
+        data = self.get_serializer(missions, many=True).data
+        for item, mission in zip(data, missions):
+            item['distance_km'] = round(mission.distance_km, 3)
+        return Response(data)
+
+def _complete_user_mission(profile_id, mission_id, now):
+    """
+    Passe la participation à « terminé » (en la créant au besoin) par un seul
+    INSERT ... ON CONFLICT DO UPDATE ... WHERE status <> 'termine'. Retourne
+    True si cette requête a fait la transition : deux appels concurrents ne
+    peuvent pas tous deux obtenir True (le second attend le verrou de ligne,
+    puis ne voit plus de ligne à modifier).
+    """
+    table = connection.ops.quote_name(UserMission._meta.db_table)
+    # Même syntaxe sur PostgreSQL et SQLite (>= 3.24)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, mission_id, status, started_at, completed_at, updated_at) "
+            f"VALUES (%s, %s, 'termine', %s, %s, %s) "
+            f"ON CONFLICT (user_id, mission_id) DO UPDATE "
+            f"SET status = excluded.status, completed_at = excluded.completed_at, updated_at = excluded.updated_at "
+            f"WHERE {table}.status <> 'termine'",
+            [profile_id, mission_id, now, now, now],
+        )
+        return cursor.rowcount == 1
+
+def _credit_profile(profile_id, amount, now):
+    """
+    Crédite solde et score d'un même montant et retourne le nouveau solde (crédits
+    concurrents compris) : un seul UPDATE ... RETURNING (PostgreSQL, SQLite >= 3.35),
+    sinon UPDATE puis relecture dans la transaction de l'appelant.
+    """
+    profiles = UserProfile.objects.filter(pk=profile_id)
+    if not connection.features.can_return_columns_from_insert:
+        profiles.update(solde=F('solde') + amount, score=F('score') + amount, updated_at=now)
+        return profiles.values_list('solde', flat=True).get()
+    meta = UserProfile._meta
+    qn = connection.ops.quote_name
+    solde = meta.get_field('solde')
+    amount = solde.get_db_prep_save(amount, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {qn(meta.db_table)} SET {qn('solde')} = {qn('solde')} + %s, {qn('score')} = {qn('score')} + %s, "
+            f"{qn('updated_at')} = %s WHERE {qn(meta.pk.column)} = %s RETURNING {qn('solde')}",
+            [amount, amount, meta.get_field('updated_at').get_db_prep_save(now, connection), profile_id],
+        )
+        value = cursor.fetchone()[0]
+    # Mêmes convertisseurs qu'une lecture par l'ORM (SQLite renvoie un flottant)
+    column = solde.get_col(meta.db_table)
+    for converter in connection.ops.get_db_converters(column) + solde.get_db_converters(connection):
+        value = converter(value, column, connection)
+    return value
+
+class UserMissionViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
+    queryset = UserMission.objects.select_related('mission', 'user__user')
     serializer_class = UserMissionSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        return UserMission.objects.filter(user=self.request.user.profile)
+        return super().get_queryset().filter(user=get_profile(self.request.user))
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lecture allégée : une seule requête values(), l'utilisateur une seule fois
+        dans l'enveloppe. `mission` vaut l'id de la mission, ou la mission
+        complète avec ?expand=mission (même requête, jointe).
+        """
+        profile = get_profile(request.user)
+        expand = set(request.query_params.get('expand', '').split(','))
+        names = requested_fields(request)
+        fields = [field for field in values_fields(UserMissionSerializer) if names is None or field[0] in names]
+        mission_fields = []
+        if 'mission' in expand and (names is None or 'mission' in names):
+            mission_fields = values_fields(MissionSerializer, prefix='mission__')
+        lookups = {lookup for _, lookup, _ in fields + mission_fields} | {'id', 'mission_id'}
+
+        # La pagination par curseur lit sa position dans les dictionnaires (clé `id`)
+        rows = self.paginate_queryset(UserMission.objects.filter(user=profile).values(*lookups))
+        results = []
+        for row in rows:
+            item = values_row(row, fields)
+            if names is None or 'mission' in names:
+                item['mission'] = values_row(row, mission_fields) if mission_fields else row['mission_id']
+            results.append(item)
+        return Response({
+            'user': UserProfileSerializer(profile).data,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
+            'results': results,
+        })
     
     @action(detail=False, methods=['post'])
     def complete_mission(self, request):
+        """
+        Termine une mission et crédite sa récompense, une seule fois même en cas
+        de double envoi : la transition est un UPDATE conditionnel, le solde et
+        le score sont incrémentés en base par un UPDATE ... RETURNING, sans
+        relire ni verrouiller le profil.
+        """
         serializer = CompleteMissionSerializer(data=request.data)
-        if serializer.is_valid():
-            mission_id = serializer.validated_data['mission_id']
-
-            try:
-                mission = Mission.objects.get(id=mission_id, is_active=True)
-                user_profile = request.user.profile
-
-                with transaction.atomic():
-                    #Vérifier si la mission n'est pas déjà complétée
-                    user_mission, created = UserMission.objects.get_or_create(
-                        user=user_profile,
-                        mission=mission,
-                        defaults={'status': 'termine'}
-                    )
-
-                    if not created and user_mission.status == 'termine':
-                        return Response(
-                            {'error': 'Mission déjà complétée'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    
-                    #Mettre à jour le statut et la date de complétion
-                    user_mission.status = 'termine'
-                    user_mission.save()
-
-                    #Mettre à jour le solde et le score de l'utilisateur
-                    user_profile.solde += mission.reward
-                    user_profile.score += mission.reward
-                    user_profile.save()
-
-                    #Vérifier les badges (à implémenter plus tard)
-                    self.check_badges(user_profile)
-                
-                return Response({
-                    'message': 'Mission complétée avec succès',
-                    'reward': mission.reward,
-                    'new_balance': user_profile.solde
-                })
-            
-            except Mission.DoesNotExist:
-                return Response(
-                    {'error': 'Mission non trouvée'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    def check_badges(self, user_profile):
-        #A implémenter: logique de vérification des badges
-        pass
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        mission_id = serializer.validated_data['mission_id']
+        reward = Mission.objects.filter(id=mission_id, is_active=True).values_list('reward', flat=True).order_by().first()
+        if reward is None:
+            return Response({'error': 'Mission non trouvée'}, status=status.HTTP_404_NOT_FOUND)
+
+        user_profile = get_profile(request.user)
+        user_id = request.user.pk
+        now = timezone.now()
+        with transaction.atomic():
+            if not _complete_user_mission(user_profile.pk, mission_id, now):
+                return Response({'error': 'Mission déjà complétée'}, status=status.HTTP_400_BAD_REQUEST)
+            new_balance = _credit_profile(user_profile.pk, reward, now)
+            leaderboard.award(user_id, mission_id, reward, now)
+            transaction.on_commit(lambda: invalidate_principal(user_id))
+
+        return Response({
+            'message': 'Mission complétée avec succès',
+            'reward': reward,
+            'new_balance': new_balance,
+        })
+
+
+class ModerationViewSet(viewsets.ViewSet):
+    """
+    File de modération partagée entre modérateurs.
+
+    POST claim/ réserve un lot de preuves, POST <id>/review/ rend la décision,
+    POST release/ rend les preuves non traitées, GET stats/ donne le débit.
+    """
+    permission_classes = [IsAdminUser]
+
+    @action(detail=False, methods=['post'])
+    def claim(self, request):
+        try:
+            size = min(max(int(request.data.get('size', settings.MODERATION_BATCH_SIZE)), 1), 50)
+        except (TypeError, ValueError):
+            return Response({'error': 'Taille de lot invalide.'}, status=status.HTTP_400_BAD_REQUEST)
+        proofs = claim_batch(request.user, size)
+        return Response(ModerationProofSerializer(proofs, many=True, context={'request': request}).data)
+
+    @action(detail=True, methods=['post'])
+    def review(self, request, pk=None):
+        serializer = ProofReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            proof = review_proof(
+                pk, serializer.validated_data['decision'], moderator=request.user,
+                reason=serializer.validated_data.get('rejection_reason') or None,
+            )
+        except ModerationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'id': proof.id, 'status': proof.status})
+
+    @action(detail=False, methods=['post'])
+    def release(self, request):
+        return Response({'released': release_claims(request.user)})
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        return Response(moderation_stats())
 
 
 class RegisterViewSet(viewsets.GenericViewSet):
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [AuthThrottle]
 
     @action(detail=False, methods=['post'])
     def register(self, request):
@@ -129,17 +290,97 @@ class RegisterViewSet(viewsets.GenericViewSet):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+PROFILE_PAGE_SIZE = 20
+
+
+def _keyset_page(queryset, after, field, descending=True, size=PROFILE_PAGE_SIZE):
+    """
+    Page d'un queryset triée sur (field, id), à partir du curseur `after`.
+
+    Le curseur est la clé de la dernière ligne affichée : chaque page coûte un
+    parcours d'index de `size` lignes, quelle que soit sa position.
+    Retourne (lignes, curseur de la page suivante ou None).
+    """
+    lookup = 'lt' if descending else 'gt'
+    queryset = queryset.order_by(*([f'-{field}', '-id'] if descending else [field, 'id']))
+    try:
+        value, pk = after.rsplit('~', 1)
+        value, pk = datetime.fromisoformat(value), int(pk)
+    except (AttributeError, ValueError):
+        pass
+    else:
+        queryset = queryset.filter(Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': pk}))
+    rows = list(queryset[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, f"{getattr(rows[-1], field).isoformat()}~{rows[-1].pk}"
+
+
+def _profile_purchases(user, after=None):
+    queryset = Purchase.objects.filter(buyer=user).select_related('product', 'seller__profile')
+    return _keyset_page(queryset, after, 'created_at')
+
+
+def _profile_sales(user, after=None):
+    queryset = Purchase.objects.filter(seller=user).select_related('product', 'buyer__profile')
+    return _keyset_page(queryset, after, 'created_at')
+
+
+def _profile_badges(user, after=None):
+    queryset = UserBadge.objects.filter(user__user=user).select_related('badge')
+    return _keyset_page(queryset, after, 'acquired_at', descending=False)
+
+
+def _profile_counts(user):
+    """Nombre d'achats, de ventes et de badges, en une seule requête."""
+    def count(queryset, key):
+        return Coalesce(Subquery(
+            queryset.filter(**{key: OuterRef('pk')}).order_by().values(key).annotate(n=Count('pk')).values('n')
+        ), 0)
+
+    return User.objects.filter(pk=user.pk).values(
+        purchase_count=count(Purchase.objects.all(), 'buyer'),
+        sale_count=count(Purchase.objects.all(), 'seller'),
+        badge_count=count(UserBadge.objects.all(), 'user__user'),
+    ).get()
+
+
 @login_required
 def user_profile(request):
-    user_badges = UserBadge.objects.filter(user=request.user.profile).select_related('badge')
-    my_purchases = Purchase.objects.filter(buyer=request.user).select_related('product', 'seller__profile').order_by('-created_at')
-    my_sales = Purchase.objects.filter(seller=request.user).select_related('product', 'buyer__profile').order_by('-created_at')
+    purchases, next_purchases = _profile_purchases(request.user)
+    sales, next_sales = _profile_sales(request.user)
+    badges, next_badges = _profile_badges(request.user)
     context = {
-        'user_badges': user_badges,
-        'my_purchases': my_purchases,
-        'my_sales': my_sales,
+        'counts': _profile_counts(request.user),
+        'my_purchases': purchases,
+        'next_purchases': next_purchases,
+        'my_sales': sales,
+        'next_sales': next_sales,
+        'user_badges': badges,
+        'next_badges': next_badges,
     }
     return render(request, 'profile.html', context)
+
+
+# Pages suivantes des sections du profil, chargées à la demande (fragments HTML)
+@login_required
+def profile_purchases(request):
+    purchases, next_cursor = _profile_purchases(request.user, request.GET.get('after'))
+    return render(request, 'partials/profile_purchases.html', {'my_purchases': purchases, 'next_purchases': next_cursor})
+
+
+@login_required
+def profile_sales(request):
+    sales, next_cursor = _profile_sales(request.user, request.GET.get('after'))
+    return render(request, 'partials/profile_sales.html', {'my_sales': sales, 'next_sales': next_cursor})
+
+
+@login_required
+def profile_badges(request):
+    badges, next_cursor = _profile_badges(request.user, request.GET.get('after'))
+    return render(request, 'partials/profile_badges.html', {'user_badges': badges, 'next_badges': next_cursor})
+
 @login_required
 def list_missions(request):
     missions = Mission.objects.all()
@@ -158,6 +399,55 @@ def product_detail(request, product_id):
     }
     return render(request, 'product_detail.html', context)
 
+@require_safe
+def serve_media(request, path):
+    """Médias en production : accès vérifié, puis transfert confié au frontal (voir missions/media.py)."""
+    name = media.clean_name(path)
+    if not media.can_access(request.user, name):
+        # 404 plutôt que 403 : ne révèle pas l'existence d'une preuve
+        raise Http404
+    return media.media_response(request, name)
+
+
+@api_view(['GET'])
+def sync_changes(request):
+    """
+    Synchronisation du client mobile : tout ce qui a changé depuis `?since=<jeton>`
+    (missions, missions suivies, badges, notifications, achats, solde) et les
+    suppressions. Le jeton de la réponse sert à l'appel suivant.
+    """
+    return Response(sync.changes(request.user, sync.read_token(request.query_params.get('since'), request.user)))
+
+
+@api_view(['GET'])
+def leaderboard_view(request):
+    """
+    Classement d'une période : `?period=day|week|month` (semaine par défaut),
+    `?start=AAAA-MM-JJ` pour une période passée (classement figé). `me` donne
+    le rang et les points de l'utilisateur connecté.
+    """
+    period = request.query_params.get('period', 'week')
+    if period not in leaderboard.PERIODS:
+        return Response({'error': 'Période inconnue.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        day = datetime.strptime(request.query_params['start'], '%Y-%m-%d').date() if 'start' in request.query_params else timezone.localdate()
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+    except ValueError:
+        return Response({'error': 'Paramètre invalide.'}, status=status.HTTP_400_BAD_REQUEST)
+    start = leaderboard.period_start(period, day)
+    results = leaderboard.top(period, start, limit)
+    for row in results:
+        # Décimaux en chaîne, comme les DecimalField des sérialiseurs
+        row['points'] = format(row['points'], 'f')
+    me = leaderboard.rank(request.user.pk, period, start)
+    return Response({
+        'period': period,
+        'start': start,
+        'results': results,
+        'me': {'rank': me[0], 'points': format(me[1], 'f')} if me else None,
+    })
+
+
 @login_required
 @api_view(['POST']) # This should be an API endpoint called by JS
 def start_purchase(request, product_id):
@@ -226,15 +516,23 @@ def mark_notification_read(request, notification_id):
 
 @login_required
 def choose_mission(request, mission_id):
-    mission = get_object_or_404(Mission, id=mission_id)
+    # Mission désactivée : plus de participation (ses sessions closes peuvent être archivées)
+    mission = get_object_or_404(Mission, id=mission_id, is_active=True)
     # Vérifie si l'utilisateur a déjà une session pour cette mission
-    session, created = UserSession.objects.get_or_create(user=request.user, mission=mission)
-    if created:
-        # Si une nouvelle session est créée, redirige vers une page de confirmation
-        return redirect('mission_detail', mission_id=mission.id)
-    else:
+    if UserSession.objects.filter(user=request.user, mission=mission).exists():
         # Si la session existe déjà, redirige vers la page de la mission
         return redirect('mission_detail', mission_id=mission.id)
+    try:
+        with transaction.atomic():
+            # La place est réservée dans la même transaction que la session : pas de place perdue en cas d'erreur
+            if not reserve_slot(mission):
+                messages.error(request, "Cette mission est complète.")
+                return redirect('list_missions')
+            UserSession.objects.create(user=request.user, mission=mission)
+    except IntegrityError:
+        # Double envoi : l'autre requête a créé la session, le rollback a libéré notre place
+        pass
+    return redirect('mission_detail', mission_id=mission.id)
 
 @login_required
 def mission_detail(request, mission_id):
@@ -255,6 +553,7 @@ def submit_proof(request, session_id):
             proof = form.save(commit=False)
             proof.session = session
             proof.save()
+            transaction.on_commit(lambda: schedule_screening(proof))
             return redirect('mission_detail', mission_id=session.mission.id)
     else:
         form = ProofForm()
@@ -263,49 +562,37 @@ def submit_proof(request, session_id):
 @login_required
 def mark_shipped(request, purchase_id):
     """Marque une commande comme expédiée (action du vendeur)."""
-    purchase = get_object_or_404(Purchase, id=purchase_id, seller=request.user)    
-    if purchase.status != 'in_escrow':
-        messages.error(request, "Cette commande ne peut pas être marquée comme expédiée.")
-        return redirect('user_profile')
+    purchase = get_object_or_404(Purchase.objects.select_related('product'), id=purchase_id, seller=request.user)
     if request.method == 'POST':
-        purchase.status = 'shipped'
-        purchase.save()
+        if not transition_purchase(purchase, 'in_escrow', 'shipped', actor=request.user):
+            messages.error(request, "Cette commande ne peut pas être marquée comme expédiée.")
+            return redirect('user_profile')
         messages.success(request, "La commande a été marquée comme expédiée.")
-        Notification.objects.create(user=purchase.buyer, message=f"Bonne nouvelle ! Votre commande pour '{purchase.product.name}' a été expédiée !");
+        Notification.objects.create(user_id=purchase.buyer_id, message=f"Bonne nouvelle ! Votre commande pour '{purchase.product.name}' a été expédiée !")
     return redirect('user_profile')
-    
+
 
 @login_required
 def confirm_receipt(request, purchase_id):
     """Confirme la réception d'une commande (action de l'acheteur)."""
-    purchase = get_object_or_404(Purchase, id=purchase_id, buyer=request.user)
+    purchase = get_object_or_404(Purchase.objects.select_related('product', 'seller'), id=purchase_id, buyer=request.user)
 
-    if purchase.status != 'shipped':
-        messages.error(request, "Cette action n'est pas possible à ce stade de la transaction.")
-        return redirect('user_profile')
     if request.method == 'POST':
-        try:
-            with transaction.atomic():
-                # Étape 1 : Transférer les fonds au vendeur (App-to-User)
-                success, message = release_funds_to_seller(purchase)
-                if not success:
-                    raise Exception(message)
-
-                # Étape 2 : Mettre à jour le statut de l'achat
-                purchase.status = 'completed'
-                purchase.save()
-
-                # Étape 3 : Notifier tout le monde
-                messages.success(request, "Achat confirmé ! Les fonds ont été transférés au vendeur.")
-                Notification.objects.create(user=purchase.seller, message=f"Paiement reçu pour la vente de '{purchase.product.name}'.")
-                
-                return redirect('user_profile')
-
-        except Exception as e:
-            purchase.status = 'disputed'
-            purchase.save()
-            messages.error(request, f"Une erreur est survenue : {e}. Cette transaction est maintenant en litige, veuillez contacter le support.")
+        # Étape 1 : Passer l'achat à 'completed', validé avant l'appel Pi : un double clic
+        # ou un force_complete concurrent échoue sur la transition et ne peut pas repayer.
+        if not transition_purchase(purchase, 'shipped', 'completed', actor=request.user):
+            messages.error(request, "Cette action n'est pas possible à ce stade de la transaction.")
             return redirect('user_profile')
+
+        # Étape 2 : Transférer les fonds au vendeur (App-to-User), litige en cas d'échec
+        success, message = pay_seller(purchase, actor=request.user)
+        if not success:
+            messages.error(request, f"Une erreur est survenue : {message}. Cette transaction est maintenant en litige, veuillez contacter le support.")
+            return redirect('user_profile')
+
+        # Étape 3 : Notifier tout le monde
+        messages.success(request, "Achat confirmé ! Les fonds ont été transférés au vendeur.")
+        Notification.objects.create(user=purchase.seller, message=f"Paiement reçu pour la vente de '{purchase.product.name}'.")
     return redirect('user_profile')
 
 
@@ -322,6 +609,8 @@ def edit_proof(request, proof_id):
         form = ProofEditForm(request.POST, request.FILES, instance=proof)
         if form.is_valid():
             form.save()
+            if 'photo' in form.changed_data:
+                transaction.on_commit(lambda: schedule_screening(proof))
             return redirect('mission_detail', mission_id=proof.session.mission.id)
     else:
         form = ProofEditForm(instance=proof)
@@ -344,6 +633,7 @@ def delete_proof(request, proof_id):
     return render(request, 'delete_proof.html', {'proof': proof})
 
 @never_cache
+@throttle(('auth', 'ip'), ('auth_endpoint', 'endpoint'))
 def custom_login_view(request):
     if request.user.is_authenticated:
         # Si l'utilisateur est déjà connecté, on le redirige
@@ -368,7 +658,7 @@ def signup(request):
         form = UserCreationForm(request.POST)
         if form.is_valid():
             user = form.save()
-            login(request, user)  # Connecte automatiquement l'utilisateur après l'inscription
+            login(request, user, backend='missions.backends.ProfileModelBackend')  # Connecte automatiquement l'utilisateur après l'inscription
             messages.success(request, "Votre compte a été créé avec succès !")
             return redirect('list_missions')  # Redirige vers la liste des missions
     else:
@@ -377,110 +667,174 @@ def signup(request):
 
 # ...
 
+def _request_data(request):
+    """Lit le corps d'une requête API (JSON ou formulaire) dans une vue Django asynchrone."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
+
+async def _aauthenticate(request):
+    """
+    Authentifie une requête API dans une vue asynchrone.
+
+    Reproduit le comportement de DRF : session (avec contrôle CSRF) ou jeton JWT.
+    Retourne un tuple (utilisateur, réponse d'erreur).
+    """
+    user = await request.auser()
+    if user.is_authenticated:
+        csrf_failure = await sync_to_async(CsrfViewMiddleware(lambda req: None).process_view)(request, None, (), {})
+        if csrf_failure is not None:
+            return None, JsonResponse({'error': 'CSRF verification failed.'}, status=403)
+        return user, None
+
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return None, JsonResponse({'error': str(e.detail)}, status=401)
+    if result is None:
+        return None, JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+    return result[0], None
+
+
 @csrf_exempt # Important pour les webhooks externes
-@api_view(['POST'])
-@permission_classes([AllowAny]) # Le webhook vient des serveurs Pi, pas d'un utilisateur connecté
-def pi_payment_webhook(request):
+@require_POST
+@throttle(('webhook', 'ip'), ('webhook_endpoint', 'endpoint'))
+async def pi_payment_webhook(request):
     """
     Gère les callbacks du serveur Pi pour approuver et compléter les paiements.
+    Le webhook vient des serveurs Pi, pas d'un utilisateur connecté.
     """
-    payment_data = request.data
+    payment_data = _request_data(request)
     payment_id = payment_data.get('paymentId')
 
-    metadata = payment_data.get('metadata', {})
+    metadata = payment_data.get('metadata') or {}
     purchase_id = metadata.get('purchase_id')
 
     if not all([payment_id, purchase_id]):
-        return Response({'error': 'Missing data'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': 'Missing data'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        purchase = Purchase.objects.get(id=purchase_id, status='awaiting_payment')
-    except Purchase.DoesNotExist:
-        return Response({'error': 'Purchase not found or already processed'}, status=status.HTTP_404_NOT_FOUND)
-    
-    headers = {'Authorization': f'Key {settings.PI_API_KEY}'}
-    
-    approve_url = f'https://api.pi.network/v2/payments/{payment_id}/approve'
-    approve_response = requests.post(approve_url, headers=headers)
-
-    if not approve_response.ok:
-        purchase.status = 'cancelled'
-        purchase.save()
-        return Response({'error': 'Failed to approve payment with Pi network'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        purchase = await Purchase.objects.select_related('product', 'seller').aget(id=purchase_id, status='awaiting_payment')
+    except (Purchase.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Purchase not found or already processed'}, status=status.HTTP_404_NOT_FOUND)
 
-    complete_url = f'https://api.pi.network/v2/payments/{payment_id}/complete'
-    complete_response = requests.post(complete_url, headers=headers)
+    # Réserver l'achat avant tout appel Pi : un webhook concurrent ou l'annulation
+    # des impayés (run_escrow_scheduler) ne peut plus le modifier pendant le paiement
+    if not await sync_to_async(transition_purchase)(purchase, 'awaiting_payment', 'processing', pi_payment_id=payment_id):
+        return JsonResponse({'error': 'Purchase not found or already processed'}, status=status.HTTP_409_CONFLICT)
 
-    if not complete_response.ok:
-        purchase.status = 'disputed'
-        purchase.save()
-        print(f"CRITICAL: Failed to complete payment {payment_id} for purchase {purchase.id}")
-        return Response({'error': 'Failed to complete payment with Pi network'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    try:
+        approve_response = await pi_client.apost(f'/payments/{payment_id}/approve')
+    except httpx.HTTPError:
+        approve_response = None
 
-    # Mettre à jour notre état interne
-    purchase.status = 'in_escrow'
-    purchase.pi_payment_id = payment_id
-    purchase.save()
+    if approve_response is None or not approve_response.is_success:
+        await sync_to_async(transition_purchase)(purchase, 'processing', 'cancelled', reason='approve_failed')
+        return JsonResponse({'error': 'Failed to approve payment with Pi network'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    Notification.objects.create(
+    try:
+        complete_response = await pi_client.apost(f'/payments/{payment_id}/complete')
+    except httpx.HTTPError:
+        complete_response = None
+
+    if complete_response is None or not complete_response.is_success:
+        await sync_to_async(transition_purchase)(purchase, 'processing', 'disputed', reason='complete_failed')
+        logger.critical("Échec de la finalisation du paiement Pi %s pour l'achat %s", payment_id, purchase.id)
+        return JsonResponse({'error': 'Failed to complete payment with Pi network'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # Seule une modification manuelle a pu sortir l'achat de 'processing' alors que
+    # les fonds sont encaissés : à régulariser à la main avec l'id de paiement
+    if not await sync_to_async(transition_purchase)(purchase, 'processing', 'in_escrow'):
+        logger.critical("Paiement Pi %s finalisé mais l'achat %s n'est plus réservé", payment_id, purchase.id)
+        return JsonResponse({'error': 'Purchase not found or already processed'}, status=status.HTTP_409_CONFLICT)
+
+    await Notification.objects.acreate(
         user=purchase.seller,
         message=f"Vente confirmée pour '{purchase.product.name}'. Vous pouvez maintenant expédier le produit."
     )
 
-    return Response({'status': 'success'})
+    return JsonResponse({'status': 'success'})
 
-@api_view(['POST'])
-@login_required
-def pi_authenticate(request):
+@csrf_exempt # Le contrôle CSRF est fait par _aauthenticate pour les sessions
+@require_POST
+@throttle(('pi_auth', 'user'))
+async def pi_authenticate(request):
     """
     Lie un UID Pi à l'utilisateur Django actuellement connecté.
     """
-    pi_uid = request.data.get('uid')
+    user, error = await _aauthenticate(request)
+    if error:
+        return error
+
+    pi_uid = _request_data(request).get('uid')
     if not pi_uid:
         messages.error(request, 'UID Pi non fourni.')
-        return Response({'error': 'Pi UID not provided'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': 'Pi UID not provided'}, status=status.HTTP_400_BAD_REQUEST)
 
     # Vérifier si cet UID n'est pas déjà pris par un autre utilisateur
-    if UserProfile.objects.filter(pi_uid=pi_uid).exclude(user=request.user).exists():
+    if await UserProfile.objects.filter(pi_uid=pi_uid).exclude(user=user).aexists():
         messages.error(request, 'Ce compte Pi est déjà lié à un autre utilisateur.')
-        return Response({'error': 'This Pi account is already linked to another user.'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': 'This Pi account is already linked to another user.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    request.user.profile.pi_uid = pi_uid
-    request.user.profile.save()
+    profile = await sync_to_async(get_profile)(user)
+    profile.pi_uid = pi_uid
+    try:
+        await profile.asave()
+    except IntegrityError:
+        # Un autre utilisateur a lié ce compte Pi entre-temps
+        messages.error(request, 'Ce compte Pi est déjà lié à un autre utilisateur.')
+        return JsonResponse({'error': 'This Pi account is already linked to another user.'}, status=status.HTTP_400_BAD_REQUEST)
     messages.success(request, 'Votre compte Pi a été lié avec succès !')
-    return Response({'message': 'Pi account linked successfully!'})
+    return JsonResponse({'message': 'Pi account linked successfully!'})
 
-@api_view(['POST'])
-@login_required
-def pi_withdraw(request):
+@csrf_exempt # Le contrôle CSRF est fait par _aauthenticate pour les sessions
+@require_POST
+@throttle(('withdraw', 'user'))
+async def pi_withdraw(request):
     """
     Crée un paiement de l'application vers l'utilisateur (App-to-User).
+
+    Le solde est débité par un UPDATE conditionnel avant l'appel à Pi, puis
+    recrédité si l'appel échoue : deux retraits simultanés ne peuvent pas
+    dépasser le solde.
     """
-    amount_str = request.data.get('amount')
+    user, error = await _aauthenticate(request)
+    if error:
+        return error
+
+    amount_str = _request_data(request).get('amount')
     if not amount_str:
         messages.error(request, 'Montant non fourni.')
-        return Response({'error': 'Amount not provided'}, status=400)
+        return JsonResponse({'error': 'Amount not provided'}, status=400)
 
     try:
-        amount = Decimal(amount_str)
+        amount = Decimal(str(amount_str))
         if amount <= 0:
             messages.error(request, 'Le montant doit être positif.')
-            return Response({'error': 'Amount must be positive'}, status=400)
-    except:
+            return JsonResponse({'error': 'Amount must be positive'}, status=400)
+    except (InvalidOperation, ValueError):
         messages.error(request, 'Montant invalide.')
-        return Response({'error': 'Invalid amount'}, status=400)
+        return JsonResponse({'error': 'Invalid amount'}, status=400)
 
-    profile = request.user.profile
+    profile = await sync_to_async(get_profile)(user)
 
     if not profile.pi_uid:
         messages.error(request, "Aucun compte Pi n'est lié. Veuillez d'abord connecter votre compte.")
-        return Response({'error': 'No Pi account is linked. Please authenticate with Pi first.'}, status=400)
+        return JsonResponse({'error': 'No Pi account is linked. Please authenticate with Pi first.'}, status=400)
 
-    if profile.solde < amount:
+    debited = await UserProfile.objects.filter(pk=profile.pk, solde__gte=amount).aupdate(
+        solde=F('solde') - amount, updated_at=timezone.now()
+    )
+    invalidate_principal(user.pk)
+    if not debited:
         messages.error(request, 'Solde insuffisant.')
-        return Response({'error': 'Insufficient balance.'}, status=400)
+        return JsonResponse({'error': 'Insufficient balance.'}, status=400)
 
-    headers = {'Authorization': f'Key {settings.PI_API_KEY}'}
     payload = {
         'recipient': profile.pi_uid,
         'amount': f'{amount:.7f}', # Format avec 7 décimales
@@ -488,32 +842,49 @@ def pi_withdraw(request):
     }
 
     try:
-        pi_response = requests.post('https://api.pi.network/v2/payments', json=payload, headers=headers)
+        pi_response = await pi_client.apost('/payments', json=payload)
         pi_response.raise_for_status()  # Lève une exception pour les codes 4xx/5xx
         response_data = pi_response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        # Le paiement n'a pas eu lieu : on recrédite le montant réservé
+        await UserProfile.objects.filter(pk=profile.pk).aupdate(
+            solde=F('solde') + amount, updated_at=timezone.now()
+        )
+        invalidate_principal(user.pk)
+        messages.error(request, f'Echec de la communication avec les serveurs Pi : {e}')
+        return JsonResponse({'error': f'Failed to communicate with Pi servers: {e}'}, status=500)
 
-        with transaction.atomic():
-            profile.refresh_from_db() # Re-fetch pour éviter les race conditions
-            if profile.solde >= amount:
-                profile.solde -= amount
-                profile.save()
-                messages.success(request, f'Retrait de {amount} π réussi !')
-                return Response({'message': 'Withdrawal successful!', 'new_balance': profile.solde, 'pi_transaction': response_data})
-            else:
-                # Ne pas compléter si le solde a changé entre-temps
-                messages.error(request, 'Votre solde a été mis à jour, fonds insuffisants.')
-                return Response({'error': 'Balance updated, insufficient funds.'}, status=400)
+    new_balance = await UserProfile.objects.filter(pk=profile.pk).values_list('solde', flat=True).aget()
+    messages.success(request, f'Retrait de {amount} π réussi !')
+    return JsonResponse({'message': 'Withdrawal successful!', 'new_balance': new_balance, 'pi_transaction': response_data})
 
-    except requests.exceptions.RequestException as e:
-        messages.error(request, f'Echec de la communication avec les serveurs Pi : {e}')
-        return Response({'error': f'Failed to communicate with Pi servers: {e}'}, status=500)
+async def event_stream(request):
+    """
+    Flux Server-Sent Events des nouvelles notifications et des changements
+    de statut des achats/ventes de l'utilisateur.
+
+    Servi en continu via ASGI ; sous WSGI, chaque connexion renvoie les
+    événements en attente puis se ferme (le navigateur se reconnecte).
+    """
+    user, error = await _aauthenticate(request)
+    if error:
+        return error
+
+    cursor = decode_cursor(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+    response = StreamingHttpResponse(
+        stream_events(user.pk, cursor, once=not isinstance(request, ASGIRequest)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Pas de mise en tampon côté nginx
+    return response
 
 def release_funds_to_seller(purchase):
     """
     Fonction helper qui effectue le paiement de l'app vers le vendeur via l'API Pi.
     Retourne un tuple (succès: bool, message: str).
     """
-    seller_profile = purchase.seller.profile
+    seller_profile = get_profile(purchase.seller)
     if not seller_profile.pi_uid:
         return (False, "Le vendeur n'a pas lié son compte Pi.")
 
@@ -522,14 +893,13 @@ def release_funds_to_seller(purchase):
     commission = purchase.total_price * commission_rate
     amount_to_seller = purchase.total_price - commission
 
-    headers = {'Authorization': f'Key {settings.PI_API_KEY}'}
     payload = {
         'recipient': seller_profile.pi_uid,
         'amount': f'{amount_to_seller:.7f}',
         'memo': f"Paiement pour la vente de '{purchase.product.name}' (Achat #{purchase.id})",
     }
     try:
-        pi_response = requests.post('https://api.pi.network/v2/payments', json=payload, headers=headers)
+        pi_response = requests.post(f'{pi_client.PI_API_URL}/payments', json=payload, headers=pi_client.pi_headers(), timeout=pi_client.pi_timeout())
         pi_response.raise_for_status()
         response_data = pi_response.json()
         
@@ -541,41 +911,55 @@ def release_funds_to_seller(purchase):
         purchase.commission_amount = commission
         purchase.payout_id = payout_id
         purchase.save(update_fields=['commission_amount', 'payout_id'])
+        audit.record('purchase', purchase.id, 'payout', payout_id=payout_id, amount=amount_to_seller, commission=commission)
         
         return (True, "Paiement au vendeur réussi.")
     except requests.exceptions.RequestException as e:
         # Il est crucial de logger cette erreur pour l'analyse
-        error_message = f"ERREUR DE PAIEMENT PI pour l'achat {purchase.id}: {e}"
-        print(error_message)
+        logger.error("Erreur de paiement Pi pour l'achat %s : %s", purchase.id, e)
         return (False, "La communication avec les serveurs Pi a échoué.")
 
+def pay_seller(purchase, actor=None):
+    """
+    Paie le vendeur d'un achat dont la transition vers 'completed' est déjà
+    validée, hors de toute transaction : l'appel Pi ne tient aucun verrou et
+    un second appelant ne peut plus repayer. En cas d'échec, l'achat passe en
+    litige pour un traitement manuel. Retourne (succès, message).
+    """
+    try:
+        success, message = release_funds_to_seller(purchase)
+    except Exception as e:
+        success, message = False, str(e)
+    if not success:
+        transition_purchase(purchase, 'completed', 'disputed', actor=actor, reason=f'payout_failed: {message}')
+    return success, message
+
 def refund_to_buyer(purchase):
     """
     Fonction helper qui rembourse l'acheteur via l'API Pi.
     Retourne un tuple (succès: bool, message: str).
     """
-    buyer_profile = purchase.buyer.profile
+    buyer_profile = get_profile(purchase.buyer)
     if not buyer_profile.pi_uid:
         return (False, "L'acheteur n'a pas lié son compte Pi.")
 
-    headers = {'Authorization': f'Key {settings.PI_API_KEY}'}
     payload = {
         'recipient': buyer_profile.pi_uid,
         'amount': f'{purchase.total_price:.7f}',
         'memo': f"Remboursement pour l'achat de '{purchase.product.name}' (Achat #{purchase.id}) sur MissionHub",
     }
     try:
-        pi_response = requests.post('https://api.pi.network/v2/payments', json=payload, headers=headers)
+        pi_response = requests.post(f'{pi_client.PI_API_URL}/payments', json=payload, headers=pi_client.pi_headers(), timeout=pi_client.pi_timeout())
         pi_response.raise_for_status()
         response_data = pi_response.json()
         
         payout_id = response_data.get('identifier')
         purchase.payout_id = payout_id # Reusing payout_id for refund transaction
         purchase.save(update_fields=['payout_id'])
+        audit.record('purchase', purchase.id, 'refund', payout_id=payout_id, amount=purchase.total_price)
         return (True, "Remboursement à l'acheteur réussi.")
     except requests.exceptions.RequestException as e:
-        error_message = f"ERREUR DE REMBOURSEMENT PI pour l'achat {purchase.id}: {e}"
-        print(error_message)
+        logger.error("Erreur de remboursement Pi pour l'achat %s : %s", purchase.id, e)
         return (False, "La communication avec les serveurs Pi a échoué.")
 
 def privacy_policy(request):